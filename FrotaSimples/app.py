@@ -1,32 +1,386 @@
 # -*- coding: utf-8 -*-
+import functools
+import json
+import math
+import time
+from urllib.parse import urlencode
+
 import psycopg2
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, make_response, request, jsonify
 from flask_cors import CORS
 
-# Configuração do Banco de Dados
-# ATENÇÃO: Adicionado 'client_encoding' para mitigar o erro 'UnicodeDecodeError'
-DB_CONFIG = {
-    "host": "localhost",
-    "database": "FrotaSimples",
-    "user": "postgres",
-    "password": "123",
-    "port": "5432"
-}
+from config import (
+    DB_CONFIG, POOL_CONFIG, SENHA_CONFIG, CACHE_CONFIG, NDJSON_ITERSIZE, JSON_NO_BANCO,
+    METRICAS_ATIVAS, RASTREIO_CONFIG, EVENTOS_CONFIG, REPLICAS_CONFIG, TOKENS_CONFIG,
+    IDEMPOTENCIA_CONFIG, ARQUIVO_CONFIG
+)
+from pool import PoolConexoes, PoolEsgotado
+from paginacao import ParametroInvalido, codificar_cursor, fatiar_pagina, recortar_campos
+from validacao import (
+    DadosInvalidos, validar_usuario, validar_login, validar_troca_senha, validar_funcionario,
+    validar_veiculo, validar_status_veiculo, validar_status_lote, validar_emprestimo,
+    validar_finalizacao, validar_lote_emprestimos, validar_emprestimo_lote,
+    validar_finalizacao_lote, validar_renovacao, linha_funcionario, linha_veiculo, ler_filtros_usuarios,
+    ler_filtros_funcionarios, ler_filtros_veiculos, ler_filtros_emprestimos, ler_filtros_uso,
+    ler_ranking_uso, ler_busca, ler_filtros_arquivo
+)
+import consultas
+import arquivamento
+from json_banco import montar_corpo
+from lote import LoteInvalido, ler_registros, inserir_em_lote
+import emprestimos_lote
+from senhas import ServicoSenhas, ServicoSenhasOcupado
+from tokens import ServicoTokens, TokenInvalido, TIPO_RENOVACAO, token_do_cabecalho
+from cache import criar_cache
+from versoes import ControleVersoes
+import metricas
+from metricas import JSONMedido, RegistroMetricas
+from rastreio import CursorRastreado, log_consultas_lentas, server_timing
+from eventos import CentralEventos
+from replicas import RoteadorLeituras
+from idempotencia import (
+    CONFLITO, EM_ANDAMENTO, EXECUTAR, ERRO_CONFLITO, ERRO_EM_ANDAMENTO, CABECALHO_REPETIDA,
+    ChaveInvalida, RegistroIdempotencia, chave_requisicao, cabecalhos_guardados, impressao_requisicao
+)
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "http://localhost:4200"}})
+app.json = JSONMedido(app)
+app.config['JSON_NO_BANCO'] = JSON_NO_BANCO
+app.config['METRICAS_ATIVAS'] = METRICAS_ATIVAS
+app.config['SERVER_TIMING'] = RASTREIO_CONFIG["server_timing"]
+# supports_credentials: o navegador só envia o cookie COOKIE_PRIMARIO (ver replicas.py)
+# com credentials: 'include'
+CORS(app, resources={r"/*": {"origins": "http://localhost:4200"}}, supports_credentials=True,
+     expose_headers=["X-Proximo-Cursor", "Link", "ETag", "Server-Timing", "X-Origem-Leitura",
+                     CABECALHO_REPETIDA])
+
+# Cookie de quem escreveu há pouco (valor: até quando, em segundos desde a época); enquanto
+# ele vale, as leituras desse cliente vão ao primário em vez de a uma réplica
+COOKIE_PRIMARIO = 'frota_primario'
+
+
+# CursorRastreado e os observadores do pool e do hashing alimentam as fases da requisição
+# (execucao, conexao, espera_conexao, senha) usadas pelas métricas e pelo Server-Timing
+db_pool = PoolConexoes(dict(DB_CONFIG, cursor_factory=CursorRastreado),
+                       observador=metricas.registrar_fase, **POOL_CONFIG)
+servico_senhas = ServicoSenhas(**SENHA_CONFIG, observador=metricas.registrar_fase)
+cache_respostas = criar_cache(CACHE_CONFIG)
+registro_metricas = RegistroMetricas()
+central_eventos = CentralEventos(db_pool.db_config, **EVENTOS_CONFIG)
+roteador_leituras = RoteadorLeituras(REPLICAS_CONFIG["replicas"], db_pool.db_config, POOL_CONFIG,
+                                     REPLICAS_CONFIG["intervalo"], REPLICAS_CONFIG["atraso_maximo"],
+                                     REPLICAS_CONFIG["janela_escrita"],
+                                     observador=metricas.registrar_fase)
+registro_idempotencia = RegistroIdempotencia(**IDEMPOTENCIA_CONFIG)
+log_consultas_lentas.configurar(db_pool.db_config, RASTREIO_CONFIG["consulta_lenta_ms"],
+                                RASTREIO_CONFIG["amostra_explain"], RASTREIO_CONFIG["arquivo"])
+
+@app.before_request
+def iniciar_medicao():
+    if app.config['METRICAS_ATIVAS'] or app.config['SERVER_TIMING']:
+        metricas.iniciar_requisicao()
+
+@app.after_request
+def registrar_medicao(resposta):
+    """
+    Contabiliza a requisição pelo padrão da rota (ex.: /veiculos/<int:veiculo_id>/status)
+    e envia o tempo de cada fase no cabeçalho Server-Timing.
+    """
+    duracao, fases, comandos = metricas.encerrar_requisicao()
+    if duracao is None:
+        return resposta
+    if app.config['METRICAS_ATIVAS']:
+        rota = request.url_rule.rule if request.url_rule else "<sem rota>"
+        registro_metricas.observar_requisicao(rota, request.method, resposta.status_code,
+                                              duracao, fases)
+    if app.config['SERVER_TIMING']:
+        resposta.headers['Server-Timing'] = server_timing(duracao, fases, comandos)
+    return resposta
+
+@app.after_request
+def fixar_leituras_no_primario(resposta):
+    """
+    Depois de uma escrita, o cliente lê do primário por janela_escrita segundos (cookie
+    COOKIE_PRIMARIO), até as réplicas receberem o que ele gravou.
+    """
+    if (roteador_leituras.ativo and request.method in ('POST', 'PUT', 'PATCH', 'DELETE')
+            and resposta.status_code < 400):
+        janela = roteador_leituras.janela_escrita
+        roteador_leituras.registrar_escrita()
+        resposta.set_cookie(COOKIE_PRIMARIO, f"{time.time() + janela:.3f}",
+                            max_age=math.ceil(janela), httponly=True, samesite='Lax')
+    return resposta
+
+@app.before_request
+def repetir_escrita_idempotente():
+    """
+    Idempotency-Key nas rotas de escrita (idempotencia.py): a repetição de uma requisição já
+    atendida recebe a resposta guardada sem executar a rota, e a que chega enquanto a
+    original executa espera por ela.
+    """
+    try:
+        chave = chave_requisicao(request.method, request.endpoint, request.path,
+                                 request.headers.get('Idempotency-Key'))
+    except ChaveInvalida as e:
+        return jsonify({"erro": str(e)}), 400
+    if chave is None:
+        return None
+
+    impressao = impressao_requisicao(request.get_data(), request.headers.get('Authorization'))
+    resultado, guardada = registro_idempotencia.iniciar(chave, impressao)
+    if resultado == EXECUTAR:
+        g.idempotencia = chave
+        return None
+    if resultado == CONFLITO:
+        return jsonify({"erro": ERRO_CONFLITO}), 422
+    if resultado == EM_ANDAMENTO:
+        resposta = jsonify({"erro": ERRO_EM_ANDAMENTO})
+        resposta.headers['Retry-After'] = '1'
+        return resposta, 409
+
+    status, cabecalhos, corpo = guardada
+    resposta = Response(corpo, status=status, headers=cabecalhos)
+    resposta.headers[CABECALHO_REPETIDA] = 'true'
+    return resposta
+
+@app.after_request
+def guardar_escrita_idempotente(resposta):
+    """Guarda a resposta da requisição original com Idempotency-Key (5xx libera a chave)."""
+    chave = g.pop('idempotencia', None)
+    if chave is not None:
+        if resposta.is_streamed:
+            registro_idempotencia.abandonar(chave)
+        else:
+            registro_idempotencia.concluir(chave, resposta.status_code,
+                                           cabecalhos_guardados(resposta.headers), resposta.get_data())
+    return resposta
+
+@app.teardown_request
+def liberar_escrita_idempotente(erro):
+    """Sem passar pelo after_request (exceção), a chave é liberada para uma nova tentativa."""
+    chave = g.pop('idempotencia', None)
+    if chave is not None:
+        registro_idempotencia.abandonar(chave)
+
+def le_do_primario():
+    """O cliente escreveu há menos de janela_escrita segundos (cookie COOKIE_PRIMARIO)?"""
+    try:
+        return float(request.cookies.get(COOKIE_PRIMARIO, 0)) > time.time()
+    except ValueError:
+        return False
+
+def leitura_em_replica(rota):
+    """
+    Decorador das rotas GET só de leitura (fica logo abaixo de @app.route). As conexões da
+    requisição, inclusive a da ETag, vêm da mesma réplica saudável, ou do primário se não
+    houver nenhuma ou se o cliente escreveu há pouco. A origem vai em X-Origem-Leitura.
+    """
+    @functools.wraps(rota)
+    def envoltorio(*args, **kwargs):
+        g.replica = None
+        if roteador_leituras.ativo and not le_do_primario():
+            roteador_leituras.iniciar()
+            g.replica = roteador_leituras.escolher()
+        resposta = make_response(rota(*args, **kwargs))
+        if roteador_leituras.ativo:
+            resposta.headers['X-Origem-Leitura'] = g.replica.nome if g.replica else 'primario'
+        return resposta
+    return envoltorio
+
+def fora_do_cache():
+    """
+    Com réplicas, o cache de respostas é ignorado por quem escreveu há pouco e, logo após
+    uma escrita deste processo, por todos: uma resposta lida de uma réplica ainda atrasada
+    não pode ficar guardada depois da invalidação.
+    """
+    return roteador_leituras.ativo and (le_do_primario() or roteador_leituras.escrita_recente())
 
 def get_db_connection():
-    """Cria e retorna uma nova conexão com o banco de dados."""
+    """
+    Retira uma conexão do pool (None se o banco estiver indisponível ou o pool esgotado).
+    Nas rotas com @leitura_em_replica ela vem da réplica escolhida; se a réplica falhar,
+    a requisição passa a ler do primário.
+    """
+    replica = g.get('replica') if has_request_context() else None
+    if replica is not None:
+        try:
+            return roteador_leituras.obter(replica)
+        except (PoolEsgotado, psycopg2.Error) as e:
+            print(f"Replica {replica.nome} indisponivel, lendo do primario: {e}")
+            g.replica = None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
+        return db_pool.obter()
+    except PoolEsgotado as e:
+        print(f"DB Pool exhausted: {e}")
+        return None
     except psycopg2.Error as e:
         # Alterado para uma mensagem de erro sem acentuação para evitar o UnicodeDecodeError
         print(f"DB Connect Fail: {e}") 
         return None
 
+def release_db_connection(conn):
+    """Devolve a conexão ao pool de onde veio (transações pendentes são desfeitas)."""
+    if not roteador_leituras.devolver(conn):
+        db_pool.devolver(conn)
+
+versoes_tabelas = ControleVersoes(get_db_connection, release_db_connection)
+
+def carregar_usuario_sessao(usuario_id):
+    """Usuário de um token (só na falta no cache do ServicoTokens); None se não existe."""
+    conn = get_db_connection()
+
+    if conn is None:
+        raise psycopg2.OperationalError("Falha na conexão com o banco de dados")
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(consultas.SQL_USUARIO_SESSAO, (usuario_id,))
+            registro = cur.fetchone()
+            if registro is None:
+                return None
+            return dict(zip([desc[0] for desc in cur.description], registro))
+    finally:
+        release_db_connection(conn)
+
+servico_tokens = ServicoTokens(carregar_usuario_sessao, **TOKENS_CONFIG)
+
+def resposta_nao_autenticado(mensagem):
+    """401 com o desafio Bearer (token ausente, inválido, expirado ou revogado)."""
+    resposta = jsonify({"erro": mensagem})
+    resposta.headers['WWW-Authenticate'] = 'Bearer error="invalid_token"'
+    return resposta, 401
+
+def requer_autenticacao(rota):
+    """
+    Decorador das rotas protegidas (fica logo abaixo de @app.route): exige o cabeçalho
+    'Authorization: Bearer <token de acesso>' e guarda o usuário em g.usuario. Com o usuário
+    no cache do ServicoTokens, a verificação não vai ao banco.
+    """
+    @functools.wraps(rota)
+    def envoltorio(*args, **kwargs):
+        try:
+            g.usuario = servico_tokens.verificar(token_do_cabecalho(request.headers.get('Authorization')))
+        except TokenInvalido as e:
+            return resposta_nao_autenticado(str(e))
+        except psycopg2.Error as e:
+            print(f"Erro no banco de dados ao verificar o token: {e}")
+            return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+        return rota(*args, **kwargs)
+    return envoltorio
+
+def notificar_evento(cur, tipo, dados):
+    """Emite um evento de /eventos na transação atual (entregue só no commit)."""
+    cur.execute(consultas.SQL_NOTIFICAR_EVENTO, (tipo, json.dumps(dados)))
+
+def resposta_servico_ocupado():
+    """503 para quando a fila de hashing de senhas está cheia."""
+    resposta = jsonify({"erro": "Servidor ocupado, tente novamente em instantes"})
+    resposta.headers['Retry-After'] = '1'
+    return resposta, 503
+
+def resposta_paginada(itens, proximo_cursor):
+    """
+    Serializa uma página de uma listagem.
+    O corpo continua sendo a lista; o cursor da próxima página vai nos cabeçalhos
+    X-Proximo-Cursor e Link (rel="next"). Na última página eles não são enviados.
+    """
+    return com_cursor(jsonify(itens), proximo_cursor)
+
+def com_cursor(resposta, proximo_cursor):
+    """Adiciona X-Proximo-Cursor e Link (rel="next") à resposta, se houver próxima página."""
+    if proximo_cursor:
+        args = request.args.to_dict()
+        args['after'] = proximo_cursor
+        resposta.headers['X-Proximo-Cursor'] = proximo_cursor
+        resposta.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return resposta
+
+def quer_ndjson():
+    """O cliente pediu streaming (?stream=1 ou Accept: application/x-ndjson)?"""
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    melhor = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return melhor == 'application/x-ndjson'
+
+def resposta_ndjson(sql, params, descricao):
+    """
+    Transmite o resultado da consulta como NDJSON (um objeto JSON por linha).
+    Usa um cursor nomeado (lado do servidor) que busca NDJSON_ITERSIZE linhas por vez,
+    então a memória fica constante e o primeiro byte sai antes do fim da consulta.
+    A conexão fica com o gerador e volta ao pool quando a transmissão termina
+    (ou quando o cliente desconecta).
+    """
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    def gerar():
+        try:
+            with conn.cursor(name='listagem_ndjson') as cur:
+                cur.itersize = NDJSON_ITERSIZE
+                cur.execute(sql, params)
+                column_names = None
+                for row in cur:
+                    if column_names is None:
+                        column_names = [desc[0] for desc in cur.description]
+                    yield app.json.dumps(dict(zip(column_names, row)), separators=(',', ':')) + '\n'
+        except psycopg2.Error as e:
+            # O status 200 já foi enviado: o erro vai como última linha do fluxo
+            print(f"Erro no banco de dados ao transmitir {descricao}: {e}")
+            yield app.json.dumps({"erro": f"Erro interno ao transmitir {descricao}."}) + '\n'
+        finally:
+            release_db_connection(conn)
+
+    resposta = Response(gerar(), mimetype='application/x-ndjson')
+    # Evita que proxies (nginx) segurem o fluxo em buffer
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
+
+def json_no_banco():
+    """O JSON das listagens deve ser montado pelo PostgreSQL (JSON_NO_BANCO)?"""
+    if not app.config['JSON_NO_BANCO']:
+        return False
+    # A saída do banco é a do jsonify compacto; com indentação (debug) usa o caminho normal
+    return app.json.compact or (app.json.compact is None and not app.debug)
+
+def resposta_json_do_banco(sql, params, campos, descricao, limite=None, chave=(), cursor=None,
+                           envelope=None, ordem=None):
+    """
+    Executa a listagem com o array JSON montado pelo PostgreSQL (consultas.como_json) e
+    devolve os bytes sem criar um dicionário por linha nem passar pelo jsonify.
+    - limite, chave e cursor: paginação; cursor recebe {coluna da chave: valor} do último
+      item da página e retorna os valores do cursor, como a função de fatiar_pagina.
+    - envelope: nome da lista nas rotas que respondem {"<envelope>": [...], "total": n}.
+    - ordem: o ORDER BY da listagem (ver consultas.como_json); padrão: a chave, crescente.
+    """
+    sql_json, params_json = consultas.como_json(sql, params, campos, limite, chave, ordem)
+
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    try:
+        with conn.cursor() as cur:
+            # O texto do array volta como bytes, sem decodificação
+            psycopg2.extensions.register_type(psycopg2.extensions.BYTES, cur)
+            cur.execute(sql_json + ";", params_json)
+            array, total, *valores_chave = cur.fetchone()
+
+        proximo_cursor = None
+        if limite and total > limite:
+            proximo_cursor = codificar_cursor(*cursor(dict(zip(chave, valores_chave))))
+        resposta = Response(montar_corpo(array, total, envelope), mimetype=app.json.mimetype)
+        return com_cursor(resposta, proximo_cursor), 200
+
+    except psycopg2.Error as e:
+        print(f"Erro no banco de dados ao listar {descricao}: {e}")
+        return jsonify({"erro": f"Erro interno ao listar {descricao}."}), 500
+
+    finally:
+        release_db_connection(conn)
+
 # =============================================================================
 # ROTAS DE USUÁRIOS
 # =============================================================================
@@ -34,17 +388,15 @@ def get_db_connection():
 ## CADASTRO DE USUÁRIOS (POST)
 @app.route('/usuarios', methods=['POST'])
 def criar_usuario():
-    data = request.get_json()
-    
-    if not data or 'nome' not in data or 'email' not in data or 'senha' not in data:
-        return jsonify({"erro": "Dados incompletos (nome, email, senha são obrigatórios)"}), 400
-
-    nome = data['nome']
-    email = data['email']
-    senha_plana = data['senha']
-    funcionario_id = data.get('funcionario_id') 
+    try:
+        nome, email, senha_plana, funcionario_id = validar_usuario(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
 
-    senha_hash = generate_password_hash(senha_plana)
+    try:
+        senha_hash = servico_senhas.gerar_hash(senha_plana)
+    except ServicoSenhasOcupado:
+        return resposta_servico_ocupado()
 
     conn = get_db_connection()
 
@@ -53,13 +405,8 @@ def criar_usuario():
 
     try:
         with conn.cursor() as cur: 
-            sql = """
-                INSERT INTO usuarios (nome, email, senha_hash, funcionario_id)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id;
-            """
             params = (nome, email, senha_hash, funcionario_id)
-            cur.execute(sql, params)
+            cur.execute(consultas.SQL_INSERIR_USUARIO, params)
             
             novo_id = cur.fetchone()[0]
             
@@ -81,11 +428,30 @@ def criar_usuario():
         return jsonify({"erro": "Erro interno ao criar usuário."}), 500
         
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 ## LISTAR USUÁRIOS (GET)
 @app.route('/usuarios', methods=['GET'])
+@leitura_em_replica
+@versoes_tabelas.condicional('usuarios')
 def listar_usuarios():
+    """
+    Lista os usuários em ordem de ID.
+    Paginação por cursor: limit e after (valor de X-Proximo-Cursor da página anterior).
+    fields: colunas a devolver (ex.: fields=id,nome); sem ele, todas.
+    """
+    try:
+        filtros = ler_filtros_usuarios(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    sql, params = consultas.listar_usuarios(filtros)
+
+    if json_no_banco():
+        campos = consultas.campos_json(consultas.CAMPOS_USUARIOS, filtros["campos"])
+        return resposta_json_do_banco(sql, params, campos, "usuários",
+                                      filtros["limite"], ("id",), lambda u: (u['id'],))
+
     conn = get_db_connection()
 
     if conn is None:
@@ -93,34 +459,32 @@ def listar_usuarios():
     
     try:
         with conn.cursor() as cur:
-            # ATENÇÃO: Excluindo 'senha_hash' da listagem por segurança.
-            cur.execute("SELECT id, nome, email, funcionario_id, criado_em FROM usuarios;")
+            cur.execute(sql + ";", params)
             
             # Obtém os nomes das colunas
             column_names = [desc[0] for desc in cur.description]
             # Mapeia as linhas para uma lista de dicionários
             usuarios = [dict(zip(column_names, row)) for row in cur.fetchall()]
+            usuarios, proximo_cursor = fatiar_pagina(usuarios, filtros["limite"], lambda u: (u['id'],))
+            usuarios = recortar_campos(usuarios, filtros["campos"])
             
-            return jsonify(usuarios), 200
+            return resposta_paginada(usuarios, proximo_cursor), 200
 
     except psycopg2.Error as e:
         print(f"Erro no banco de dados ao listar usuários: {e}") 
         return jsonify({"erro": "Erro interno ao listar usuários."}), 500
         
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 ## LOGIN DE USUÁRIOS (POST)
 @app.route('/login', methods=['POST'])
 def login_usuario():
-    data = request.get_json()
-
     # 1. Validação de campos
-    if not data or 'email' not in data or 'senha' not in data:
-        return jsonify({"erro": "Email e senha são obrigatórios"}), 400
-    
-    email = data['email']
-    senha_plana = data['senha']
+    try:
+        email, senha_plana = validar_login(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
     
     conn = get_db_connection()
 
@@ -130,55 +494,117 @@ def login_usuario():
     try:
         with conn.cursor() as cur:
             # 2. Busca o hash da senha e outros dados importantes pelo email
-            sql = """
-                SELECT id, nome, email, senha_hash, funcionario_id 
-                FROM usuarios 
-                WHERE email = %s;
-            """
-            cur.execute(sql, (email,))
+            cur.execute(consultas.SQL_LOGIN, (email,))
             user_record = cur.fetchone()
-
-            if user_record:
-                # 3. Mapeia o registro para um dicionário
-                column_names = [desc[0] for desc in cur.description]
-                user_data = dict(zip(column_names, user_record))
-                
-                # 4. Verifica a senha
-                if check_password_hash(user_data['senha_hash'], senha_plana):
-                    # Autenticação bem-sucedida
-                    
-                    # 5. Remove o hash da resposta por segurança
-                    del user_data['senha_hash'] 
-                    
-                    return jsonify({
-                        "mensagem": "Login bem-sucedido",
-                        "usuario": user_data
-                    }), 200
-                else:
-                    # Senha incorreta
-                    return jsonify({"erro": "Email ou senha incorretos"}), 401
-            else:
-                # Usuário não encontrado
-                return jsonify({"erro": "Email ou senha incorretos"}), 401
+            column_names = [desc[0] for desc in cur.description]
 
     except psycopg2.Error as e:
         print(f"Erro no banco de dados durante o login: {e}") 
         return jsonify({"erro": "Erro interno ao tentar login."}), 500
         
     finally:
-        conn.close()
+        # A conexão volta ao pool antes da verificação da senha (que é lenta de propósito)
+        release_db_connection(conn)
+
+    if not user_record:
+        # Usuário não encontrado
+        return jsonify({"erro": "Email ou senha incorretos"}), 401
+
+    # 3. Mapeia o registro para um dicionário
+    user_data = dict(zip(column_names, user_record))
+
+    # 4. Verifica a senha (no pool de processos de hashing)
+    try:
+        senha_correta = servico_senhas.verificar(user_data['senha_hash'], senha_plana)
+    except ServicoSenhasOcupado:
+        return resposta_servico_ocupado()
+
+    if not senha_correta:
+        # Senha incorreta
+        return jsonify({"erro": "Email ou senha incorretos"}), 401
+
+    # Autenticação bem-sucedida: atualiza o hash se foi gerado com parâmetros antigos
+    if servico_senhas.precisa_rehash(user_data['senha_hash']):
+        atualizar_hash_desatualizado(user_data['id'], user_data['senha_hash'], senha_plana)
+
+    # 5. Remove o hash da resposta por segurança
+    del user_data['senha_hash'] 
+    versao_senha = user_data.pop('versao_senha')
+
+    # 6. Tokens de acesso e de renovação (tokens.py)
+    return jsonify({
+        "mensagem": "Login bem-sucedido",
+        "usuario": user_data,
+        **servico_tokens.emitir(user_data['id'], versao_senha)
+    }), 200
+
+## RENOVAÇÃO DOS TOKENS (POST)
+@app.route('/login/renovar', methods=['POST'])
+def renovar_tokens():
+    """Troca um token de renovação válido por um par novo, sem pedir a senha."""
+    try:
+        token = validar_renovacao(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        usuario = servico_tokens.verificar(token, TIPO_RENOVACAO)
+    except TokenInvalido as e:
+        return resposta_nao_autenticado(str(e))
+    except psycopg2.Error as e:
+        print(f"Erro no banco de dados ao renovar o token: {e}")
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    return jsonify({
+        "mensagem": "Tokens renovados",
+        **servico_tokens.emitir(usuario['id'], usuario['versao_senha'])
+    }), 200
+
+## USUÁRIO AUTENTICADO (GET)
+@app.route('/usuarios/eu', methods=['GET'])
+@requer_autenticacao
+def usuario_autenticado():
+    """Dono do token de acesso, lido do cache (sem ir ao banco na maioria das chamadas)."""
+    return jsonify({
+        campo: valor for campo, valor in g.usuario.items() if campo != 'versao_senha'
+    }), 200
+
+def atualizar_hash_desatualizado(usuario_id, senha_hash_antigo, senha_plana):
+    """
+    Regrava o hash com o método/custo atual após um login bem-sucedido.
+    Melhor esforço: uma falha aqui não impede o login. Só atualiza se o hash não
+    mudou nesse meio tempo (ex.: troca de senha concorrente).
+    """
+    try:
+        novo_hash = servico_senhas.gerar_hash(senha_plana)
+    except ServicoSenhasOcupado:
+        return
+
+    conn = get_db_connection()
+
+    if conn is None:
+        return
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(consultas.SQL_REGRAVAR_HASH, (novo_hash, usuario_id, senha_hash_antigo))
+            conn.commit()
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Erro ao atualizar hash de senha desatualizado: {e}")
+
+    finally:
+        release_db_connection(conn)
 
 ## ATUALIZAR SENHA DO USUÁRIO (PUT)
 @app.route('/usuarios/<int:usuario_id>/senha', methods=['PUT'])
 def atualizar_senha_usuario(usuario_id):
-    data = request.get_json()
-
-    # 1. Validação básica
-    if not data or 'nova_senha' not in data:
-        return jsonify({"erro": "A nova senha é obrigatória"}), 400
-
-    senha_atual = data.get('senha_atual')  # opcional
-    nova_senha = data['nova_senha']
+    # 1. Validação básica (senha_atual é opcional)
+    try:
+        senha_atual, nova_senha = validar_troca_senha(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
 
     conn = get_db_connection()
 
@@ -188,36 +614,46 @@ def atualizar_senha_usuario(usuario_id):
     try:
         with conn.cursor() as cur:
             # 2. Busca o hash atual
-            cur.execute(
-                "SELECT senha_hash FROM usuarios WHERE id = %s;",
-                (usuario_id,)
-            )
+            cur.execute(consultas.SQL_SENHA_USUARIO, (usuario_id,))
             result = cur.fetchone()
 
-            if not result:
-                return jsonify({"erro": "Usuário não encontrado"}), 404
+    except psycopg2.Error as e:
+        print(f"Erro ao atualizar senha: {e}")
+        return jsonify({"erro": "Erro interno ao atualizar senha"}), 500
+
+    finally:
+        # A conexão volta ao pool enquanto o hashing roda
+        release_db_connection(conn)
+
+    if not result:
+        return jsonify({"erro": "Usuário não encontrado"}), 404
 
-            senha_hash_atual = result[0]
+    senha_hash_atual = result[0]
 
-            # 3. Se senha atual foi enviada, valida
-            if senha_atual:
-                if not check_password_hash(senha_hash_atual, senha_atual):
-                    return jsonify({"erro": "Senha atual incorreta"}), 401
+    try:
+        # 3. Se senha atual foi enviada, valida
+        if senha_atual:
+            if not servico_senhas.verificar(senha_hash_atual, senha_atual):
+                return jsonify({"erro": "Senha atual incorreta"}), 401
+
+        # 4. Gera novo hash
+        nova_senha_hash = servico_senhas.gerar_hash(nova_senha)
+    except ServicoSenhasOcupado:
+        return resposta_servico_ocupado()
+
+    conn = get_db_connection()
 
-            # 4. Gera novo hash
-            nova_senha_hash = generate_password_hash(nova_senha)
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
 
+    try:
+        with conn.cursor() as cur:
             # 5. Atualiza no banco
-            cur.execute(
-                """
-                UPDATE usuarios
-                SET senha_hash = %s
-                WHERE id = %s;
-                """,
-                (nova_senha_hash, usuario_id)
-            )
+            cur.execute(consultas.SQL_ATUALIZAR_SENHA, (nova_senha_hash, usuario_id))
 
             conn.commit()
+            # Os tokens emitidos com a senha antiga deixam de valer (versao_senha mudou)
+            servico_tokens.invalidar_usuario(usuario_id)
 
             return jsonify({
                 "mensagem": "Senha atualizada com sucesso"
@@ -229,7 +665,7 @@ def atualizar_senha_usuario(usuario_id):
         return jsonify({"erro": "Erro interno ao atualizar senha"}), 500
 
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 # =============================================================================
 # ROTAS DE FUNCIONÁRIOS
@@ -238,13 +674,10 @@ def atualizar_senha_usuario(usuario_id):
 ## CADASTRO DE FUNCIONÁRIOS (POST)
 @app.route('/funcionarios', methods=['POST'])
 def criar_funcionario():
-    data = request.get_json()
-    if not data or 'nome' not in data or 'matricula' not in data or 'cargo' not in data:
-          return jsonify({"erro": "Dados incompletos (nome, matricula, cargo)"}), 400
-    
-    nome = data['nome']
-    matricula = data['matricula']
-    cargo = data['cargo']
+    try:
+        nome, matricula, cargo = validar_funcionario(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
     
     conn = get_db_connection()
 
@@ -253,13 +686,8 @@ def criar_funcionario():
     
     try:
         with conn.cursor() as cur: 
-            sql = """
-                INSERT INTO funcionarios (nome, matricula, cargo)
-                VALUES (%s, %s, %s)
-                RETURNING id;
-            """
             params = (nome, matricula, cargo)
-            cur.execute(sql, params)
+            cur.execute(consultas.SQL_INSERIR_FUNCIONARIO, params)
             
             novo_id = cur.fetchone()[0]
             
@@ -281,11 +709,85 @@ def criar_funcionario():
         return jsonify({"erro": "Erro interno ao cadastrar funcionário."}), 500
         
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+## CADASTRO DE FUNCIONÁRIOS EM LOTE (POST)
+@app.route('/funcionarios/lote', methods=['POST'])
+def criar_funcionarios_lote():
+    """
+    Importa vários funcionários de uma vez (array JSON ou CSV com nome, matricula, cargo).
+    Linhas inválidas ou com matrícula repetida não abortam a importação:
+    voltam no relatório 'erros' com o número da linha (1 = primeiro registro).
+    """
+    try:
+        registros = ler_registros(request)
+    except LoteInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    linhas = []
+    erros = []
+    for numero, registro in enumerate(registros, start=1):
+        try:
+            linhas.append((numero, linha_funcionario(registro)))
+        except DadosInvalidos as e:
+            erros.append({"linha": numero, "erro": str(e)})
+
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    try:
+        criados, erros_banco = inserir_em_lote(
+            conn, consultas.SQL_LOTE_FUNCIONARIOS, linhas, 1,
+            {psycopg2.errors.UniqueViolation: "A matrícula já está em uso"},
+            "Erro interno ao cadastrar funcionário."
+        )
+        conn.commit()
+
+        erros = sorted(erros + erros_banco, key=lambda erro: erro["linha"])
+        return jsonify({
+            "mensagem": f"{len(criados)} de {len(registros)} funcionários cadastrados",
+            "total": len(registros),
+            "cadastrados": len(criados),
+            "ids": [{"linha": numero, "id": novo_id} for numero, novo_id in criados],
+            "erros": erros
+        }), 201 if criados else 400
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Erro no banco de dados na importação de funcionários: {e}")
+        return jsonify({"erro": "Erro interno ao cadastrar funcionários."}), 500
+
+    finally:
+        release_db_connection(conn)
 
 ## LISTAR FUNCIONÁRIOS (GET)
 @app.route('/funcionarios', methods=['GET'])
+@leitura_em_replica
+@versoes_tabelas.condicional('funcionarios', variante=quer_ndjson)
 def listar_funcionarios():
+    """
+    Lista os funcionários em ordem de ID.
+    Paginação por cursor: limit e after (valor de X-Proximo-Cursor da página anterior).
+    fields: colunas a devolver (ex.: fields=id,nome); sem ele, todas.
+    """
+    try:
+        filtros = ler_filtros_funcionarios(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    streaming = quer_ndjson()
+    sql, params = consultas.listar_funcionarios(filtros, a_mais=not streaming)
+
+    if streaming:
+        return resposta_ndjson(sql, params, "funcionários")
+
+    if json_no_banco():
+        campos = consultas.campos_json(consultas.CAMPOS_FUNCIONARIOS, filtros["campos"])
+        return resposta_json_do_banco(sql, params, campos, "funcionários",
+                                      filtros["limite"], ("id",), lambda f: (f['id'],))
+
     conn = get_db_connection()
 
     if conn is None:
@@ -293,19 +795,21 @@ def listar_funcionarios():
     
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT id, nome, matricula, cargo, criado_em FROM funcionarios;")
+            cur.execute(sql + ";", params)
             
             column_names = [desc[0] for desc in cur.description]
             funcionarios = [dict(zip(column_names, row)) for row in cur.fetchall()]
+            funcionarios, proximo_cursor = fatiar_pagina(funcionarios, filtros["limite"], lambda f: (f['id'],))
+            funcionarios = recortar_campos(funcionarios, filtros["campos"])
             
-            return jsonify(funcionarios), 200
+            return resposta_paginada(funcionarios, proximo_cursor), 200
 
     except psycopg2.Error as e:
         print(f"Erro no banco de dados ao listar funcionários: {e}") 
         return jsonify({"erro": "Erro interno ao listar funcionários."}), 500
         
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 # =============================================================================
 # ROTAS DE VEÍCULOS
@@ -314,16 +818,10 @@ def listar_funcionarios():
 ## CADASTRO DE VEÍCULOS (POST)
 @app.route('/veiculos', methods=['POST'])
 def cadastrar_veiculo():
-    data = request.get_json()
-
-    if not data or 'modelo' not in data or 'marca' not in data or 'ano' not in data or 'placa' not in data or 'tipo' not in data:
-        return jsonify({"erro": "Dados incompletos (modelo, marca, ano, placa e tipo são obrigatórios)"}), 400
-    
-    modelo = data['modelo']
-    marca = data['marca']
-    ano = data['ano']
-    placa = data['placa'].upper() 
-    tipo = data['tipo']
+    try:
+        modelo, marca, ano, placa, tipo = validar_veiculo(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
     
     conn = get_db_connection()
 
@@ -332,17 +830,14 @@ def cadastrar_veiculo():
     
     try:
         with conn.cursor() as cur: 
-            sql = """
-                INSERT INTO veiculos (modelo, marca, ano, placa,tipo)
-                VALUES (%s, %s, %s, %s,%s)
-                RETURNING id;
-            """
             params = (modelo, marca, ano, placa,tipo)
-            cur.execute(sql, params)
+            cur.execute(consultas.SQL_INSERIR_VEICULO, params)
             
             novo_id = cur.fetchone()[0]
+            notificar_evento(cur, 'veiculo_cadastrado', {"id": novo_id, "placa": placa, "tipo": tipo})
             
             conn.commit() 
+            cache_respostas.invalidar('veiculos')
 
             return jsonify({
                 "mensagem": "Veículo cadastrado com sucesso",
@@ -365,11 +860,94 @@ def cadastrar_veiculo():
         return jsonify({"erro": "Erro interno ao cadastrar veículo."}), 500
         
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+## CADASTRO DE VEÍCULOS EM LOTE (POST)
+@app.route('/veiculos/lote', methods=['POST'])
+def cadastrar_veiculos_lote():
+    """
+    Importa vários veículos de uma vez (array JSON ou CSV com modelo, marca, ano, placa, tipo).
+    A placa é gravada em maiúsculas. Linhas inválidas, com placa repetida ou ano < 1900
+    não abortam a importação: voltam no relatório 'erros' com o número da linha.
+    """
+    try:
+        registros = ler_registros(request)
+    except LoteInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    linhas = []
+    erros = []
+    for numero, registro in enumerate(registros, start=1):
+        try:
+            linhas.append((numero, linha_veiculo(registro)))
+        except DadosInvalidos as e:
+            erros.append({"linha": numero, "erro": str(e)})
+
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    try:
+        criados, erros_banco = inserir_em_lote(
+            conn, consultas.SQL_LOTE_VEICULOS, linhas, 3,
+            {
+                psycopg2.errors.UniqueViolation: "A placa já está em uso",
+                psycopg2.errors.CheckViolation: "O ano do veículo não é válido (deve ser >= 1900)"
+            },
+            "Erro interno ao cadastrar veículo."
+        )
+        if criados:
+            with conn.cursor() as cur:
+                notificar_evento(cur, 'veiculos_importados', {"quantidade": len(criados)})
+        conn.commit()
+        cache_respostas.invalidar('veiculos')
+
+        erros = sorted(erros + erros_banco, key=lambda erro: erro["linha"])
+        return jsonify({
+            "mensagem": f"{len(criados)} de {len(registros)} veículos cadastrados",
+            "total": len(registros),
+            "cadastrados": len(criados),
+            "ids": [{"linha": numero, "id": novo_id} for numero, novo_id in criados],
+            "erros": erros
+        }), 201 if criados else 400
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Erro no banco de dados na importação de veículos: {e}")
+        return jsonify({"erro": "Erro interno ao cadastrar veículos."}), 500
+
+    finally:
+        release_db_connection(conn)
 
 ## LISTAR VEÍCULOS (GET)
 @app.route('/veiculos', methods=['GET'])
+@leitura_em_replica
+@cache_respostas.em_cache('veiculos', ignorar=lambda: quer_ndjson() or fora_do_cache())
+@versoes_tabelas.condicional('veiculos', variante=quer_ndjson)
 def listar_veiculos():
+    """
+    Lista os veículos em ordem de ID.
+    Filtros opcionais: tipo, marca, ativo (true/false).
+    Paginação por cursor: limit e after (valor de X-Proximo-Cursor da página anterior).
+    fields: colunas a devolver (ex.: fields=id,placa,ativo); sem ele, todas.
+    """
+    try:
+        filtros = ler_filtros_veiculos(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    streaming = quer_ndjson()
+    sql, params = consultas.listar_veiculos(filtros, a_mais=not streaming)
+
+    if streaming:
+        return resposta_ndjson(sql, params, "veículos")
+
+    if json_no_banco():
+        campos = consultas.campos_json(consultas.CAMPOS_VEICULOS, filtros["campos"])
+        return resposta_json_do_banco(sql, params, campos, "veículos",
+                                      filtros["limite"], ("id",), lambda v: (v['id'],))
+
     conn = get_db_connection()
 
     if conn is None:
@@ -377,19 +955,21 @@ def listar_veiculos():
     
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT id, modelo, marca, ano, placa,tipo, ativo, criado_em FROM veiculos;")
+            cur.execute(sql + ";", params)
             
             column_names = [desc[0] for desc in cur.description]
             veiculos = [dict(zip(column_names, row)) for row in cur.fetchall()]
+            veiculos, proximo_cursor = fatiar_pagina(veiculos, filtros["limite"], lambda v: (v['id'],))
+            veiculos = recortar_campos(veiculos, filtros["campos"])
             
-            return jsonify(veiculos), 200
+            return resposta_paginada(veiculos, proximo_cursor), 200
 
     except psycopg2.Error as e:
         print(f"Erro no banco de dados ao listar veículos: {e}") 
         return jsonify({"erro": "Erro interno ao listar veículos."}), 500
         
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 ## ATUALIZAR STATUS DO VEÍCULO (PATCH)
 @app.route('/veiculos/<int:veiculo_id>/status', methods=['PATCH'])
@@ -398,16 +978,10 @@ def atualizar_status_veiculo(veiculo_id):
     Atualiza o status (ativo/inativo) de um veículo.
     Útil para marcar veículo como emprestado (ativo=False) ou disponível (ativo=True)
     """
-    data = request.get_json()
-    
-    if not data or 'ativo' not in data:
-        return jsonify({"erro": "Campo 'ativo' é obrigatório (true ou false)"}), 400
-    
-    ativo = data['ativo']
-    
-    # Validação do tipo booleano
-    if not isinstance(ativo, bool):
-        return jsonify({"erro": "O campo 'ativo' deve ser um booleano (true ou false)"}), 400
+    try:
+        ativo = validar_status_veiculo(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
     
     conn = get_db_connection()
     
@@ -417,26 +991,22 @@ def atualizar_status_veiculo(veiculo_id):
     try:
         with conn.cursor() as cur:
             # Verifica se o veículo existe
-            cur.execute("SELECT id, modelo, placa FROM veiculos WHERE id = %s;", (veiculo_id,))
+            cur.execute(consultas.SQL_VEICULO_EXISTE, (veiculo_id,))
             veiculo = cur.fetchone()
             
             if not veiculo:
                 return jsonify({"erro": f"Veículo com ID {veiculo_id} não encontrado"}), 404
             
             # Atualiza o status
-            sql = """
-                UPDATE veiculos 
-                SET ativo = %s 
-                WHERE id = %s
-                RETURNING id, modelo, marca, ano, placa, tipo, ativo;
-            """
-            cur.execute(sql, (ativo, veiculo_id))
+            cur.execute(consultas.SQL_ATUALIZAR_STATUS_VEICULO, (ativo, veiculo_id))
             
             updated_row = cur.fetchone()
             column_names = [desc[0] for desc in cur.description]
             veiculo_atualizado = dict(zip(column_names, updated_row))
+            notificar_evento(cur, 'veiculo_status', {"id": veiculo_id, "ativo": ativo})
             
             conn.commit()
+            cache_respostas.invalidar('veiculos')
             
             status_texto = "disponível" if ativo else "indisponível"
             
@@ -451,15 +1021,81 @@ def atualizar_status_veiculo(veiculo_id):
         return jsonify({"erro": "Erro interno ao atualizar status do veículo."}), 500
     
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+## ATUALIZAR STATUS DE VÁRIOS VEÍCULOS (PATCH)
+@app.route('/veiculos/status', methods=['PATCH'])
+def atualizar_status_veiculos_lote():
+    """
+    Atualiza o status de vários veículos num único comando e numa única transação.
+    Corpo: {"veiculos": [{"id": 1, "ativo": false}, ...]} ou um filtro
+    {"ativo": false, "tipo": "...", "marca": "..."} (tipo e/ou marca).
+    Retorna os veículos atualizados e, na lista, os ids que não foram encontrados.
+    """
+    try:
+        modo, *dados = validar_status_lote(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    if modo == 'lista':
+        sql, params = consultas.SQL_ATUALIZAR_STATUS_LOTE, dados
+    else:
+        sql, params = consultas.atualizar_status_por_filtro(*dados)
+
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+
+            column_names = [desc[0] for desc in cur.description]
+            veiculos = [dict(zip(column_names, row)) for row in cur.fetchall()]
+            alterados = sum(veiculo.pop('alterado') for veiculo in veiculos)
+            if alterados:
+                notificar_evento(cur, 'veiculos_status_lote', {"quantidade": alterados})
+
+            conn.commit()
+            if alterados:
+                cache_respostas.invalidar('veiculos')
+
+            encontrados = {veiculo['id'] for veiculo in veiculos}
+            nao_encontrados = [i for i in dados[0] if i not in encontrados] if modo == 'lista' else []
+
+            return jsonify({
+                "mensagem": f"{len(veiculos)} veículos atualizados ({alterados} mudaram de status)",
+                "atualizados": len(veiculos),
+                "alterados": alterados,
+                "veiculos": veiculos,
+                "nao_encontrados": nao_encontrados
+            }), 200
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Erro no banco de dados ao atualizar status em lote: {e}")
+        return jsonify({"erro": "Erro interno ao atualizar status dos veículos."}), 500
+
+    finally:
+        release_db_connection(conn)
 
 ## BUSCAR VEÍCULOS DISPONÍVEIS (GET)
 @app.route('/veiculos/disponiveis', methods=['GET'])
+@leitura_em_replica
+@cache_respostas.em_cache('veiculos', ignorar=fora_do_cache)
+@versoes_tabelas.condicional('veiculos')
 def listar_veiculos_disponiveis():
     """
     Lista apenas os veículos que estão disponíveis (ativo = TRUE).
     Útil para exibir opções de veículos disponíveis para empréstimo.
     """
+    if json_no_banco():
+        return resposta_json_do_banco(consultas.SQL_VEICULOS_DISPONIVEIS, None,
+                                      consultas.CAMPOS_VEICULOS_DISPONIVEIS,
+                                      "veículos disponíveis", envelope="veiculos",
+                                      ordem=("modelo", "marca"))
+
     conn = get_db_connection()
     
     if conn is None:
@@ -467,13 +1103,7 @@ def listar_veiculos_disponiveis():
     
     try:
         with conn.cursor() as cur:
-            sql = """
-                SELECT id, modelo, marca, ano, placa, tipo, criado_em
-                FROM veiculos
-                WHERE ativo = TRUE
-                ORDER BY modelo, marca;
-            """
-            cur.execute(sql)
+            cur.execute(consultas.SQL_VEICULOS_DISPONIVEIS)
             
             column_names = [desc[0] for desc in cur.description]
             veiculos_disponiveis = [dict(zip(column_names, row)) for row in cur.fetchall()]
@@ -488,7 +1118,7 @@ def listar_veiculos_disponiveis():
         return jsonify({"erro": "Erro interno ao listar veículos disponíveis."}), 500
     
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 # =============================================================================
@@ -498,22 +1128,13 @@ def listar_veiculos_disponiveis():
 ## REGISTRAR EMPRÉSTIMO (POST)
 @app.route('/emprestimos', methods=['POST'])
 def registrar_emprestimo():
-    data = request.get_json()
+    try:
+        params = validar_emprestimo(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
 
-    # Validação de campos obrigatórios para o registro de saída
-    required_fields = ['veiculo_id', 'funcionario_id', 'data_saida', 'km_saida']
-    if not all(field in data for field in required_fields):
-        return jsonify({"erro": f"Dados incompletos. Campos obrigatórios: {', '.join(required_fields)}"}), 400
-    
-    veiculo_id = data['veiculo_id']
-    funcionario_id = data['funcionario_id']
-    data_saida = data['data_saida']
-    km_saida = data['km_saida']
-    
-    # Campos opcionais
-    data_retorno = data.get('data_retorno') # Deve ser NULL em uma saída inicial
-    km_retorno = data.get('km_retorno')     # Deve ser NULL em uma saída inicial
-    observacao = data.get('observacao')
+    veiculo_id = params['veiculo_id']
+    funcionario_id = params['funcionario_id']
     
     conn = get_db_connection()
 
@@ -522,17 +1143,20 @@ def registrar_emprestimo():
     
     try:
         with conn.cursor() as cur: 
-            sql = """
-                INSERT INTO emprestimos (veiculo_id, funcionario_id, data_saida, km_saida, observacao)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id;
-            """
-            params = (veiculo_id, funcionario_id, data_saida, km_saida, observacao)
-            cur.execute(sql, params)
+            # Checkout num único comando (ver consultas.SQL_REGISTRAR_EMPRESTIMO).
+            # O comando já é atômico: em autocommit ele é a própria transação (uma ida ao banco)
+            conn.autocommit = True
+            cur.execute(consultas.SQL_REGISTRAR_EMPRESTIMO, params)
             
-            novo_id = cur.fetchone()[0]
-            
-            conn.commit() 
+            # O evento 'emprestimo_registrado' sai no mesmo comando
+            novo_id, veiculo_existe, _ = cur.fetchone()
+
+            if novo_id is None:
+                if not veiculo_existe:
+                    return jsonify({"erro": "ID de veículo ou funcionário inválido."}), 404
+                return jsonify({"erro": f"O veículo {veiculo_id} não está disponível para empréstimo"}), 409
+
+            cache_respostas.invalidar('veiculos')
 
             return jsonify({
                 "mensagem": "Empréstimo (Saída) registrado com sucesso",
@@ -542,22 +1166,50 @@ def registrar_emprestimo():
             }), 201
     
     except psycopg2.errors.ForeignKeyViolation as e:
-        # Erro de chave estrangeira (veículo ou funcionário não existe)
-        conn.rollback() 
+        # Erro de chave estrangeira (funcionário não existe); o comando inteiro foi desfeito
         print(f"Erro de chave estrangeira: {e}") 
         return jsonify({"erro": "ID de veículo ou funcionário inválido."}), 404
 
     except psycopg2.Error as e:
-        conn.rollback()
         print(f"Erro no banco de dados ao registrar empréstimo: {e}") 
         return jsonify({"erro": "Erro interno ao registrar empréstimo."}), 500
         
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 ## LISTAR EMPRÉSTIMOS (GET)
 @app.route('/emprestimos', methods=['GET'])
+@leitura_em_replica
+@versoes_tabelas.condicional('emprestimos', 'veiculos', 'funcionarios', variante=quer_ndjson)
 def listar_emprestimos():
+    """
+    Lista os empréstimos do mais recente para o mais antigo (data_saida, id).
+    Filtros opcionais: veiculo_id, funcionario_id, data_inicio, data_fim (inclusiva),
+    status (abertos | finalizados).
+    Paginação por cursor: limit e after (valor de X-Proximo-Cursor da página anterior).
+    fields: colunas a devolver (ex.: fields=veiculo_placa,data_saida,data_retorno); sem ele,
+    todas. As junções com veiculos e funcionarios só entram se veiculo_placa ou
+    funcionario_nome forem pedidos.
+    """
+    try:
+        filtros = ler_filtros_emprestimos(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    streaming = quer_ndjson()
+    sql, params = consultas.listar_emprestimos(filtros, a_mais=not streaming)
+
+    if streaming:
+        return resposta_ndjson(sql, params, "empréstimos")
+
+    if json_no_banco():
+        return resposta_json_do_banco(
+            sql, params, consultas.campos_json(consultas.CAMPOS_EMPRESTIMOS, filtros["campos"]),
+            "empréstimos", filtros["limite"],
+            ("data_saida", "id"), lambda e: (e['data_saida'].isoformat(), e['id']),
+            ordem=("data_saida DESC", "id DESC")
+        )
+
     conn = get_db_connection()
 
     if conn is None:
@@ -565,38 +1217,23 @@ def listar_emprestimos():
     
     try:
         with conn.cursor() as cur:
-            # Seleciona todos os campos de empréstimos
-            sql = """
-                SELECT 
-                    e.id, 
-                    e.veiculo_id, 
-                    v.placa AS veiculo_placa,
-                    e.funcionario_id, 
-                    f.nome AS funcionario_nome,
-                    e.data_saida, 
-                    e.km_saida, 
-                    e.data_retorno, 
-                    e.km_retorno, 
-                    e.observacao, 
-                    e.criado_em
-                FROM emprestimos e
-                JOIN veiculos v ON e.veiculo_id = v.id
-                JOIN funcionarios f ON e.funcionario_id = f.id
-                ORDER BY e.data_saida DESC;
-            """
-            cur.execute(sql)
+            cur.execute(sql + ";", params)
             
             column_names = [desc[0] for desc in cur.description]
             emprestimos = [dict(zip(column_names, row)) for row in cur.fetchall()]
+            emprestimos, proximo_cursor = fatiar_pagina(
+                emprestimos, filtros["limite"], lambda e: (e['data_saida'].isoformat(), e['id'])
+            )
+            emprestimos = recortar_campos(emprestimos, filtros["campos"])
             
-            return jsonify(emprestimos), 200
+            return resposta_paginada(emprestimos, proximo_cursor), 200
 
     except psycopg2.Error as e:
         print(f"Erro no banco de dados ao listar empréstimos: {e}") 
         return jsonify({"erro": "Erro interno ao listar empréstimos."}), 500
         
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 ## FINALIZAR EMPRÉSTIMO (PATCH)
 @app.route('/emprestimos/<int:emprestimo_id>/finalizar', methods=['PATCH'])
@@ -605,15 +1242,14 @@ def finalizar_emprestimo(emprestimo_id):
     Finaliza um empréstimo registrando a data de retorno e km de retorno.
     Também atualiza o status do veículo para disponível (ativo=True).
     """
-    data = request.get_json()
-    
     # Validação de campos obrigatórios
-    if not data or 'data_retorno' not in data or 'km_retorno' not in data:
-        return jsonify({"erro": "Dados incompletos (data_retorno e km_retorno são obrigatórios)"}), 400
-    
-    data_retorno = data['data_retorno']
-    km_retorno = data['km_retorno']
-    observacao_adicional = data.get('observacao')
+    try:
+        params = validar_finalizacao(request.get_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    params['id'] = emprestimo_id
+    km_retorno = params['km_retorno']
     
     conn = get_db_connection()
     
@@ -622,98 +1258,147 @@ def finalizar_emprestimo(emprestimo_id):
     
     try:
         with conn.cursor() as cur:
-            # Busca o empréstimo e verifica se existe
-            sql_select = """
-                SELECT id, veiculo_id, funcionario_id, data_saida, km_saida, 
-                       data_retorno, km_retorno, observacao
-                FROM emprestimos 
-                WHERE id = %s;
-            """
-            cur.execute(sql_select, (emprestimo_id,))
-            emprestimo = cur.fetchone()
-            
-            if not emprestimo:
+            # Finalização num único comando (ver consultas.SQL_FINALIZAR_EMPRESTIMO).
+            # O comando já é atômico: em autocommit ele é a própria transação (uma ida ao banco)
+            conn.autocommit = True
+            cur.execute(consultas.SQL_FINALIZAR_EMPRESTIMO, params)
+            row = cur.fetchone()
+            
+            if not row:
                 return jsonify({"erro": f"Empréstimo com ID {emprestimo_id} não encontrado"}), 404
             
-            # Mapeia o resultado
             column_names = [desc[0] for desc in cur.description]
-            emprestimo_data = dict(zip(column_names, emprestimo))
+            resultado = dict(zip(column_names, row))
+            km_saida = resultado.pop('km_saida_atual')
+            data_retorno_anterior = resultado.pop('data_retorno_anterior')
+            resultado.pop('evento_id')
             
             # Verifica se o empréstimo já foi finalizado
-            if emprestimo_data['data_retorno'] is not None:
+            if data_retorno_anterior is not None:
                 return jsonify({
                     "erro": "Este empréstimo já foi finalizado",
-                    "data_retorno_anterior": str(emprestimo_data['data_retorno'])
+                    "data_retorno_anterior": str(data_retorno_anterior)
                 }), 400
             
             # Validação: km_retorno deve ser maior ou igual a km_saida
-            if float(km_retorno) < float(emprestimo_data['km_saida']):
+            if resultado['id'] is None:
                 return jsonify({
                     "erro": "A quilometragem de retorno não pode ser menor que a quilometragem de saída",
-                    "km_saida": str(emprestimo_data['km_saida']),
+                    "km_saida": str(km_saida),
                     "km_retorno_informado": str(km_retorno)
                 }), 400
             
-            # Monta a observação final (concatena se já existir uma)
-            observacao_final = emprestimo_data['observacao']
-            if observacao_adicional:
-                if observacao_final:
-                    observacao_final = f"{observacao_final} | Retorno: {observacao_adicional}"
-                else:
-                    observacao_final = f"Retorno: {observacao_adicional}"
-            
-            # Atualiza o empréstimo com os dados de retorno
-            sql_update_emprestimo = """
-                UPDATE emprestimos 
-                SET data_retorno = %s, 
-                    km_retorno = %s,
-                    observacao = %s
-                WHERE id = %s
-                RETURNING id, veiculo_id, funcionario_id, data_saida, km_saida, 
-                          data_retorno, km_retorno, observacao;
-            """
-            cur.execute(sql_update_emprestimo, (data_retorno, km_retorno, observacao_final, emprestimo_id))
-            
-            updated_row = cur.fetchone()
-            column_names = [desc[0] for desc in cur.description]
-            emprestimo_finalizado = dict(zip(column_names, updated_row))
-            
-            # Atualiza o status do veículo para disponível (ativo = True)
-            veiculo_id = emprestimo_finalizado['veiculo_id']
-            sql_update_veiculo = """
-                UPDATE veiculos 
-                SET ativo = TRUE 
-                WHERE id = %s;
-            """
-            cur.execute(sql_update_veiculo, (veiculo_id,))
-            
-            conn.commit()
+            cache_respostas.invalidar('veiculos')
             
             # Calcula a distância percorrida
-            distancia_percorrida = float(km_retorno) - float(emprestimo_data['km_saida'])
+            distancia_percorrida = float(km_retorno) - float(km_saida)
             
             return jsonify({
                 "mensagem": "Empréstimo finalizado com sucesso",
-                "emprestimo": emprestimo_finalizado,
+                "emprestimo": resultado,
                 "distancia_percorrida_km": round(distancia_percorrida, 2),
                 "veiculo_disponivel": True
             }), 200
     
     except psycopg2.Error as e:
-        conn.rollback()
         print(f"Erro no banco de dados ao finalizar empréstimo: {e}")
         return jsonify({"erro": "Erro interno ao finalizar empréstimo."}), 500
     
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+def resposta_lote_emprestimos(validar_item, sql, parametros, resultados, acao, status_gravado):
+    """
+    Executa um lote de empréstimos (ver emprestimos_lote): valida os itens, roda o comando
+    único do lote e confirma ou desfaz a transação conforme o modo.
+    """
+    try:
+        modo, total, itens, erros = validar_lote_emprestimos(request.get_json(), validar_item)
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    # Nada a gravar: itens todos inválidos, ou algum inválido no modo atomico
+    if not itens or (erros and modo == 'atomico'):
+        corpo, status, _ = emprestimos_lote.montar_resposta(modo, total, erros, [], acao, status_gravado)
+        return jsonify(corpo), status
+
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    try:
+        with conn.cursor() as cur:
+            # No modo parcial o comando é a própria transação (autocommit, uma ida ao banco);
+            # no atomico a transação fica aberta até sabermos se algum item foi recusado
+            conn.autocommit = modo == 'parcial'
+            cur.execute(sql, parametros(itens))
+
+            column_names = [desc[0] for desc in cur.description]
+            linhas = [dict(zip(column_names, row)) for row in cur.fetchall()]
+            corpo, status, gravar = emprestimos_lote.montar_resposta(
+                modo, total, erros, resultados(itens, linhas), acao, status_gravado
+            )
+
+            if gravar:
+                conn.commit()
+                cache_respostas.invalidar('veiculos')
+            else:
+                conn.rollback()
+
+            return jsonify(corpo), status
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Erro no banco de dados no lote de empréstimos ({acao}): {e}")
+        return jsonify({"erro": "Erro interno ao processar o lote de empréstimos."}), 500
+
+    finally:
+        release_db_connection(conn)
+
+## REGISTRAR EMPRÉSTIMOS EM LOTE (POST)
+@app.route('/emprestimos/lote', methods=['POST'])
+def registrar_emprestimos_lote():
+    """
+    Registra a saída de vários veículos numa única transação (ex.: troca de turno).
+    Corpo: {"modo": "atomico" | "parcial", "emprestimos": [{veiculo_id, funcionario_id,
+    data_saida, km_saida, observacao}, ...]}. Retorna o resultado de cada item.
+    """
+    return resposta_lote_emprestimos(
+        validar_emprestimo_lote, consultas.SQL_REGISTRAR_EMPRESTIMOS_LOTE,
+        emprestimos_lote.parametros_registro, emprestimos_lote.resultados_registro,
+        "registrados", 201
+    )
+
+## FINALIZAR EMPRÉSTIMOS EM LOTE (PATCH)
+@app.route('/emprestimos/finalizar-lote', methods=['PATCH'])
+def finalizar_emprestimos_lote():
+    """
+    Finaliza vários empréstimos numa única transação, com as regras da finalização unitária.
+    Corpo: {"modo": "atomico" | "parcial", "emprestimos": [{id, data_retorno, km_retorno,
+    observacao}, ...]}. Retorna o resultado de cada item.
+    """
+    return resposta_lote_emprestimos(
+        validar_finalizacao_lote, consultas.SQL_FINALIZAR_EMPRESTIMOS_LOTE,
+        emprestimos_lote.parametros_finalizacao, emprestimos_lote.resultados_finalizacao,
+        "finalizados", 200
+    )
 
 ## BUSCAR EMPRÉSTIMOS ATIVOS (GET)
 @app.route('/emprestimos/ativos', methods=['GET'])
+@leitura_em_replica
+@versoes_tabelas.condicional('emprestimos', 'veiculos', 'funcionarios')
 def listar_emprestimos_ativos():
     """
     Lista apenas os empréstimos que ainda não foram finalizados (data_retorno = NULL).
     Útil para visualizar quais veículos estão emprestados no momento.
     """
+    if json_no_banco():
+        return resposta_json_do_banco(consultas.SQL_EMPRESTIMOS_ATIVOS, None,
+                                      consultas.CAMPOS_EMPRESTIMOS_ATIVOS,
+                                      "empréstimos ativos", envelope="emprestimos",
+                                      ordem=("data_saida DESC",))
+
     conn = get_db_connection()
     
     if conn is None:
@@ -721,26 +1406,7 @@ def listar_emprestimos_ativos():
     
     try:
         with conn.cursor() as cur:
-            sql = """
-                SELECT 
-                    e.id, 
-                    e.veiculo_id, 
-                    v.placa AS veiculo_placa,
-                    v.modelo AS veiculo_modelo,
-                    v.marca AS veiculo_marca,
-                    e.funcionario_id, 
-                    f.nome AS funcionario_nome,
-                    e.data_saida, 
-                    e.km_saida, 
-                    e.observacao, 
-                    e.criado_em
-                FROM emprestimos e
-                JOIN veiculos v ON e.veiculo_id = v.id
-                JOIN funcionarios f ON e.funcionario_id = f.id
-                WHERE e.data_retorno IS NULL
-                ORDER BY e.data_saida DESC;
-            """
-            cur.execute(sql)
+            cur.execute(consultas.SQL_EMPRESTIMOS_ATIVOS)
             
             column_names = [desc[0] for desc in cur.description]
             emprestimos_ativos = [dict(zip(column_names, row)) for row in cur.fetchall()]
@@ -755,7 +1421,318 @@ def listar_emprestimos_ativos():
         return jsonify({"erro": "Erro interno ao listar empréstimos ativos."}), 500
     
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+# =============================================================================
+# BUSCA
+# =============================================================================
+
+# Se a busca aproximada (índices de trigramas da migração 0006) está disponível;
+# verificado na primeira busca
+busca_aproximada = None
+
+## AUTOCOMPLETAR (GET)
+@app.route('/busca', methods=['GET'])
+@leitura_em_replica
+@versoes_tabelas.condicional('veiculos', 'funcionarios')
+def buscar():
+    """
+    Autocompletar de veículos (placa, modelo, marca) e funcionários (nome, matrícula).
+    Parâmetros: q (ao menos 2 caracteres), tipo (veiculo | funcionario) e limit (padrão 10).
+    Resultados por relevância: prefixo da placa/matrícula, prefixo dos demais campos e,
+    com pg_trgm, semelhança (erros de digitação, palavras do meio do nome).
+    """
+    global busca_aproximada
+    try:
+        filtros = ler_busca(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    try:
+        with conn.cursor() as cur:
+            if busca_aproximada is None:
+                cur.execute(consultas.SQL_BUSCA_APROXIMADA)
+                busca_aproximada = cur.fetchone()[0]
+
+            sql, params = consultas.busca(filtros["termo"], filtros["tipos"], filtros["limite"],
+                                          busca_aproximada)
+            cur.execute(sql + ";", params)
+
+            column_names = [desc[0] for desc in cur.description]
+            resultados = [dict(zip(column_names, row)) for row in cur.fetchall()]
+
+            return jsonify({
+                "total": len(resultados),
+                "aproximada": busca_aproximada,
+                "resultados": resultados
+            }), 200
+
+    except psycopg2.Error as e:
+        print(f"Erro no banco de dados na busca: {e}")
+        return jsonify({"erro": "Erro interno na busca."}), 500
+
+    finally:
+        release_db_connection(conn)
+
+# =============================================================================
+# EVENTOS EM TEMPO REAL
+# =============================================================================
+
+## ASSINATURA DE EVENTOS (GET)
+@app.route('/eventos', methods=['GET'])
+def assinar_eventos():
+    """
+    Server-Sent Events com as mudanças de disponibilidade: veiculo_cadastrado,
+    veiculos_importados, veiculo_status, veiculos_status_lote, emprestimo_registrado,
+    emprestimos_registrados, emprestimo_finalizado e emprestimos_finalizados
+    (e 'reset' quando o cliente deve recarregar as listagens).
+    Retomada com o cabeçalho Last-Event-ID (enviado pelo EventSource) ou ?ultimo_id=.
+    """
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_id')
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id else None
+    except ValueError:
+        ultimo_id = -1  # id desconhecido: o fluxo começa com um 'reset'
+
+    central_eventos.iniciar()
+    resposta = Response(central_eventos.fluxo(ultimo_id), mimetype='text/event-stream')
+    resposta.headers['Cache-Control'] = 'no-cache'
+    # Evita que proxies (nginx) segurem o fluxo em buffer
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
+
+# =============================================================================
+# RELATÓRIOS DE USO
+# =============================================================================
+
+def resposta_serie_uso(dimensao, chave):
+    """
+    Empréstimos, km rodados e horas em uso por dia ou mês (?agrupar=dia|mes, inicio, fim),
+    lidos dos resumos uso_diario/uso_mensal, mais o total do período.
+    """
+    try:
+        filtros = ler_filtros_uso(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    sql, params = consultas.serie_uso(dimensao, chave, filtros)
+
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql + ";", params)
+
+            column_names = [desc[0] for desc in cur.description]
+            periodos = [dict(zip(column_names, row)) for row in cur.fetchall()]
+
+    except psycopg2.Error as e:
+        print(f"Erro no banco de dados ao gerar relatório de uso: {e}")
+        return jsonify({"erro": "Erro interno ao gerar relatório de uso."}), 500
+
+    finally:
+        release_db_connection(conn)
+
+    return jsonify({
+        "agrupar": filtros["agrupar"],
+        "inicio": filtros["inicio"] and filtros["inicio"].isoformat(),
+        "fim": filtros["fim"] and filtros["fim"].isoformat(),
+        "periodos": periodos,
+        "total": {
+            "emprestimos": sum(p["emprestimos"] for p in periodos),
+            "km": round(sum(p["km"] for p in periodos), 2),
+            "horas": round(sum(p["horas"] for p in periodos), 2)
+        }
+    }), 200
+
+def resposta_ranking_uso(dimensao):
+    """Os que mais rodaram no mês (?mes=AAAA-MM, padrão o mês atual; ?limit=)."""
+    try:
+        filtros = ler_ranking_uso(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    sql, params = consultas.ranking_uso(dimensao, filtros["mes"], filtros["limite"])
+
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql + ";", params)
+
+            column_names = [desc[0] for desc in cur.description]
+            ranking = [dict(zip(column_names, row)) for row in cur.fetchall()]
+
+            return jsonify({
+                "mes": filtros["mes"].strftime('%Y-%m'),
+                "ranking": ranking
+            }), 200
+
+    except psycopg2.Error as e:
+        print(f"Erro no banco de dados ao gerar ranking de uso: {e}")
+        return jsonify({"erro": "Erro interno ao gerar relatório de uso."}), 500
+
+    finally:
+        release_db_connection(conn)
+
+## USO DA FROTA (GET)
+@app.route('/relatorios/uso', methods=['GET'])
+@leitura_em_replica
+def relatorio_uso_frota():
+    return resposta_serie_uso('frota', 0)
+
+## USO DE UM VEÍCULO (GET)
+@app.route('/relatorios/uso/veiculos/<int:veiculo_id>', methods=['GET'])
+@leitura_em_replica
+def relatorio_uso_veiculo(veiculo_id):
+    return resposta_serie_uso('veiculo', veiculo_id)
+
+## USO DE UM FUNCIONÁRIO (GET)
+@app.route('/relatorios/uso/funcionarios/<int:funcionario_id>', methods=['GET'])
+@leitura_em_replica
+def relatorio_uso_funcionario(funcionario_id):
+    return resposta_serie_uso('funcionario', funcionario_id)
+
+## VEÍCULOS QUE MAIS RODARAM NO MÊS (GET)
+@app.route('/relatorios/uso/veiculos', methods=['GET'])
+@leitura_em_replica
+def ranking_uso_veiculos():
+    return resposta_ranking_uso('veiculo')
+
+## FUNCIONÁRIOS QUE MAIS RODARAM NO MÊS (GET)
+@app.route('/relatorios/uso/funcionarios', methods=['GET'])
+@leitura_em_replica
+def ranking_uso_funcionarios():
+    return resposta_ranking_uso('funcionario')
+
+# =============================================================================
+# ROTAS DO ARQUIVO DO HISTÓRICO
+# =============================================================================
+
+## MESES ARQUIVADOS (GET)
+@app.route('/arquivo/emprestimos', methods=['GET'])
+@leitura_em_replica
+def listar_meses_arquivados():
+    """Meses tirados do banco por 'python migrar.py arquivar': linhas, bytes e sha256 do arquivo."""
+    conn = get_db_connection()
+
+    if conn is None:
+        return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(consultas.SQL_MESES_ARQUIVADOS)
+
+            column_names = [desc[0] for desc in cur.description]
+            meses = [dict(zip(column_names, row)) for row in cur.fetchall()]
+
+            return jsonify(meses), 200
+
+    except psycopg2.Error as e:
+        print(f"Erro no banco de dados ao listar meses arquivados: {e}")
+        return jsonify({"erro": "Erro interno ao listar meses arquivados."}), 500
+
+    finally:
+        release_db_connection(conn)
+
+## EMPRÉSTIMOS DE UM MÊS ARQUIVADO (GET)
+@app.route('/arquivo/emprestimos/<mes>', methods=['GET'])
+@cache_respostas.em_cache('arquivo')
+def listar_emprestimos_arquivados(mes):
+    """
+    Empréstimos de um mês arquivado (AAAA-MM), lidos do arquivo em ARQUIVO_CONFIG["diretorio"],
+    sem ir ao banco. Do mais antigo para o mais recente (data_saida, id), com as colunas e os
+    formatos de GET /emprestimos.
+    Filtros opcionais: veiculo_id, funcionario_id, fields.
+    Paginação por cursor: limit (padrão 100) e after (valor de X-Proximo-Cursor).
+    O arquivo não tem índice: cada página descompacta e converte o mês desde a primeira
+    linha até o fim da página, então o custo de uma página funda cresce com o número de
+    empréstimos do mês (o cache de respostas só ajuda quando a mesma página se repete).
+    """
+    try:
+        filtros = ler_filtros_arquivo(mes, request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        emprestimos = arquivamento.consultar_mes(ARQUIVO_CONFIG["diretorio"], filtros)
+    except FileNotFoundError:
+        return jsonify({"erro": f"Mês {filtros['mes']:%Y-%m} não está no arquivo"}), 404
+    except (OSError, EOFError, ValueError) as e:
+        print(f"Erro ao ler o arquivo de {filtros['mes']:%Y-%m}: {e}")
+        return jsonify({"erro": "Erro interno ao ler o arquivo de empréstimos."}), 500
+
+    emprestimos, proximo_cursor = fatiar_pagina(
+        emprestimos, filtros["limite"], lambda e: (e['data_saida'].isoformat(), e['id'])
+    )
+    emprestimos = recortar_campos(emprestimos, filtros["campos"])
+
+    return resposta_paginada(emprestimos, proximo_cursor), 200
+
+# =============================================================================
+# ROTAS DE DIAGNÓSTICO
+# =============================================================================
+
+## ESTATÍSTICAS DO POOL DE CONEXÕES (GET)
+@app.route('/status/pool', methods=['GET'])
+def estatisticas_pool():
+    """Conexões em uso/ociosas, esperas e tempo de espera por conexão."""
+    return jsonify(db_pool.estatisticas()), 200
+
+## ESTADO DAS RÉPLICAS DE LEITURA (GET)
+@app.route('/status/replicas', methods=['GET'])
+def estatisticas_replicas():
+    """Réplicas configuradas: saúde, atraso de replicação e pool de cada uma."""
+    return jsonify(roteador_leituras.estatisticas()), 200
+
+## ESTATÍSTICAS DOS EVENTOS (GET)
+@app.route('/status/eventos', methods=['GET'])
+def estatisticas_eventos():
+    return jsonify(central_eventos.estatisticas()), 200
+
+## ESTATÍSTICAS DO CACHE DE RESPOSTAS (GET)
+@app.route('/status/cache', methods=['GET'])
+def estatisticas_cache():
+    return jsonify(cache_respostas.estatisticas()), 200
+
+## ESTATÍSTICAS DO IDEMPOTENCY-KEY (GET)
+@app.route('/status/idempotencia', methods=['GET'])
+def estatisticas_idempotencia():
+    """Requisições executadas, repetidas (respostas guardadas), esperas e conflitos."""
+    return jsonify(registro_idempotencia.estatisticas()), 200
+
+## ESTATÍSTICAS DOS TOKENS DE SESSÃO (GET)
+@app.route('/status/tokens', methods=['GET'])
+def estatisticas_tokens():
+    """Acertos dos caches de tokens validados e de usuários, recusas e invalidações."""
+    return jsonify(servico_tokens.estatisticas()), 200
+
+## MÉTRICAS NO FORMATO PROMETHEUS (GET)
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    """Requisições, latências e fases por rota, mais o estado atual do pool de conexões."""
+    pool = db_pool.estatisticas()
+    medidores = [(
+        "frota_pool_conexoes", "Conexões do pool por estado.", ("estado",),
+        [((estado,), pool[estado]) for estado in ("em_uso", "ociosas", "total")]
+    ), (
+        "frota_pool_aguardando", "Requisições esperando uma conexão livre.", (),
+        [((), pool["aguardando"])]
+    )]
+    return Response(registro_metricas.exportar(medidores),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8'), 200
 
 if __name__ == '__main__':
+    db_pool.preencher()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,1170 @@
+# -*- coding: utf-8 -*-
+"""
+Variante assíncrona (ASGI) da API da Frota Simples.
+
+Mesmas rotas e mesmos contratos JSON do app.py, mas sobre asyncio (Quart) e com o driver
+assíncrono psycopg 3 e seu próprio pool (psycopg_pool.AsyncConnectionPool). Enquanto uma
+requisição espera o PostgreSQL, o mesmo processo atende outras, sem uma thread por
+requisição. O SQL (consultas.py) e a validação (validacao.py) são os mesmos do app.py.
+
+Uso:
+    uvicorn app_async:app --host 0.0.0.0 --port 5001 --workers 4
+    (ou: hypercorn app_async:app --bind 0.0.0.0:5001 --workers 4)
+
+Diferenças em relação ao app.py:
+- a importação em lote (/funcionarios/lote e /veiculos/lote) continua só no app.py:
+  ela depende do execute_values do psycopg2 e não ganha nada com concorrência;
+- não há cache de respostas local (X-Cache); GETs condicionais (ETag/304) funcionam igual
+  e as escritas em veículos invalidam o cache compartilhado, se CACHE_CONFIG usar Redis;
+- o hashing de senhas roda no mesmo ServicoSenhas, chamado fora do event loop
+  (asyncio.to_thread), então a fila limitada e o 503 continuam valendo;
+- GET /eventos (SSE), /metrics e o cabeçalho Server-Timing existem só no app.py; as
+  escritas feitas por aqui emitem os mesmos eventos (NOTIFY), entregues pelos processos
+  do app.py aos seus clientes;
+- o Idempotency-Key segue as mesmas regras (idempotencia.py), mas cada aplicação guarda as
+  respostas na memória do seu processo: a repetição só é reconhecida pelo processo que
+  atendeu a original.
+"""
+import asyncio
+import functools
+import json
+from urllib.parse import urlencode
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from quart import Quart, Response, abort, g, jsonify, make_response, request
+
+from config import (
+    DB_CONFIG, POOL_CONFIG, SENHA_CONFIG, CACHE_CONFIG, NDJSON_ITERSIZE, IDEMPOTENCIA_CONFIG, TOKENS_CONFIG,
+    ARQUIVO_CONFIG
+)
+from paginacao import ParametroInvalido, fatiar_pagina, recortar_campos
+from validacao import (
+    DadosInvalidos, validar_usuario, validar_login, validar_renovacao, validar_troca_senha, validar_funcionario,
+    validar_veiculo, validar_status_veiculo, validar_status_lote, validar_emprestimo,
+    validar_finalizacao, validar_lote_emprestimos, validar_emprestimo_lote,
+    validar_finalizacao_lote, ler_filtros_usuarios, ler_filtros_funcionarios, ler_filtros_veiculos,
+    ler_filtros_emprestimos, ler_filtros_uso, ler_ranking_uso, ler_busca, ler_filtros_arquivo
+)
+import consultas
+import arquivamento
+import emprestimos_lote
+from senhas import ServicoSenhas, ServicoSenhasOcupado
+from tokens import ServicoTokens, TokenInvalido, TIPO_RENOVACAO, token_do_cabecalho
+from cache import criar_cache
+from versoes import SQL_VERSOES, calcular_etag
+from idempotencia import (
+    CONFLITO, EM_ANDAMENTO, EXECUTAR, ERRO_CONFLITO, ERRO_EM_ANDAMENTO, CABECALHO_REPETIDA,
+    ChaveInvalida, RegistroIdempotencia, chave_requisicao, cabecalhos_guardados, impressao_requisicao
+)
+
+ORIGEM_CORS = "http://localhost:4200"
+CABECALHOS_EXPOSTOS = f"X-Proximo-Cursor, Link, ETag, {CABECALHO_REPETIDA}"
+
+app = Quart(__name__)
+
+
+def _conninfo(db_config):
+    """DB_CONFIG usa 'database' (psycopg2); a string de conexão do libpq usa 'dbname'."""
+    config = dict(db_config)
+    config["dbname"] = config.pop("database")
+    return make_conninfo(**config)
+
+
+# O pool só abre no início do servidor (before_serving), dentro do event loop
+db_pool = AsyncConnectionPool(
+    _conninfo(DB_CONFIG),
+    min_size=POOL_CONFIG["minimo"],
+    max_size=POOL_CONFIG["maximo"],
+    timeout=POOL_CONFIG["timeout"],
+    max_lifetime=POOL_CONFIG["vida_maxima"],
+    open=False
+)
+servico_senhas = ServicoSenhas(**SENHA_CONFIG)
+cache_respostas = criar_cache(CACHE_CONFIG)
+registro_idempotencia = RegistroIdempotencia(**IDEMPOTENCIA_CONFIG)
+
+
+@app.before_serving
+async def abrir_pool():
+    await db_pool.open(wait=False)
+
+
+@app.after_serving
+async def fechar_pool():
+    await db_pool.close()
+    servico_senhas.encerrar()
+
+
+@app.after_request
+async def cabecalhos_cors(resposta):
+    """Equivalente ao CORS(...) do app.py (mesma origem e mesmos cabeçalhos expostos)."""
+    if request.headers.get('Origin') == ORIGEM_CORS:
+        resposta.headers['Access-Control-Allow-Origin'] = ORIGEM_CORS
+        resposta.headers['Access-Control-Expose-Headers'] = CABECALHOS_EXPOSTOS
+        resposta.headers['Vary'] = 'Origin'
+        if request.method == 'OPTIONS':
+            resposta.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, PATCH, DELETE, OPTIONS'
+            resposta.headers['Access-Control-Allow-Headers'] = (
+                request.headers.get('Access-Control-Request-Headers', 'Content-Type')
+            )
+    return resposta
+
+
+@app.before_request
+async def repetir_escrita_idempotente():
+    """
+    Idempotency-Key nas rotas de escrita, com as mesmas regras do app.py (idempotencia.py).
+    A espera pela original em andamento roda numa thread, sem travar o event loop.
+    """
+    try:
+        chave = chave_requisicao(request.method, request.endpoint, request.path,
+                                 request.headers.get('Idempotency-Key'))
+    except ChaveInvalida as e:
+        return jsonify({"erro": str(e)}), 400
+    if chave is None:
+        return None
+
+    impressao = impressao_requisicao(await request.get_data(), request.headers.get('Authorization'))
+    resultado, guardada = registro_idempotencia.iniciar(chave, impressao, esperar=False)
+    if resultado == EM_ANDAMENTO:
+        resultado, guardada = await asyncio.to_thread(registro_idempotencia.iniciar, chave, impressao)
+    if resultado == EXECUTAR:
+        g.idempotencia = chave
+        return None
+    if resultado == CONFLITO:
+        return jsonify({"erro": ERRO_CONFLITO}), 422
+    if resultado == EM_ANDAMENTO:
+        resposta = jsonify({"erro": ERRO_EM_ANDAMENTO})
+        resposta.headers['Retry-After'] = '1'
+        return resposta, 409
+
+    status, cabecalhos, corpo = guardada
+    resposta = Response(corpo, status=status, headers=cabecalhos)
+    resposta.headers[CABECALHO_REPETIDA] = 'true'
+    return resposta
+
+
+@app.after_request
+async def guardar_escrita_idempotente(resposta):
+    """Guarda a resposta da requisição original com Idempotency-Key (5xx libera a chave)."""
+    chave = g.pop('idempotencia', None)
+    if chave is not None:
+        registro_idempotencia.concluir(chave, resposta.status_code,
+                                       cabecalhos_guardados(resposta.headers), await resposta.get_data())
+    return resposta
+
+
+@app.teardown_request
+async def liberar_escrita_idempotente(erro):
+    """Sem passar pelo after_request (exceção), a chave é liberada para uma nova tentativa."""
+    chave = g.pop('idempotencia', None)
+    if chave is not None:
+        registro_idempotencia.abandonar(chave)
+
+
+# =============================================================================
+# AUXILIARES
+# =============================================================================
+
+def resposta_sem_conexao():
+    return jsonify({"erro": "Falha na conexão com o banco de dados"}), 503
+
+
+async def notificar_evento(conn, tipo, dados):
+    """Emite um evento de /eventos na transação atual (entregue só no commit)."""
+    await conn.execute(consultas.SQL_NOTIFICAR_EVENTO, (tipo, json.dumps(dados)))
+
+
+def resposta_servico_ocupado():
+    """503 para quando a fila de hashing de senhas está cheia."""
+    resposta = jsonify({"erro": "Servidor ocupado, tente novamente em instantes"})
+    resposta.headers['Retry-After'] = '1'
+    return resposta, 503
+
+
+async def ler_json():
+    """Corpo JSON da requisição (415 se o Content-Type não for JSON, como no Flask)."""
+    if not request.is_json:
+        abort(415)
+    return await request.get_json()
+
+
+async def carregar_usuario_sessao(usuario_id):
+    """Usuário de um token (só na falta no cache do ServicoTokens); None se não existe."""
+    async with db_pool.connection() as conn:
+        cur = await conn.execute(consultas.SQL_USUARIO_SESSAO, (usuario_id,))
+        registros = como_dicionarios(cur, await cur.fetchall())
+    return registros[0] if registros else None
+
+
+servico_tokens = ServicoTokens(carregar_usuario_sessao, **TOKENS_CONFIG)
+
+
+def resposta_nao_autenticado(mensagem):
+    """401 com o desafio Bearer (token ausente, inválido, expirado ou revogado)."""
+    resposta = jsonify({"erro": mensagem})
+    resposta.headers['WWW-Authenticate'] = 'Bearer error="invalid_token"'
+    return resposta, 401
+
+
+def requer_autenticacao(rota):
+    """Como o requer_autenticacao do app.py: exige o token de acesso e guarda o usuário em g.usuario."""
+    @functools.wraps(rota)
+    async def envoltorio(*args, **kwargs):
+        try:
+            g.usuario = await servico_tokens.verificar_assincrono(
+                token_do_cabecalho(request.headers.get('Authorization')))
+        except TokenInvalido as e:
+            return resposta_nao_autenticado(str(e))
+        except (PoolTimeout, psycopg.Error) as e:
+            print(f"Erro no banco de dados ao verificar o token: {e}")
+            return resposta_sem_conexao()
+        return await rota(*args, **kwargs)
+    return envoltorio
+
+
+async def em_thread(funcao, *args):
+    """Executa uma chamada bloqueante (hashing de senha, leitura do arquivo) fora do event loop."""
+    return await asyncio.to_thread(funcao, *args)
+
+
+def como_dicionarios(cur, linhas):
+    column_names = [desc.name for desc in cur.description]
+    return [dict(zip(column_names, row)) for row in linhas]
+
+
+def resposta_paginada(itens, proximo_cursor):
+    """Mesmo formato do app.py: a lista no corpo e o cursor em X-Proximo-Cursor e Link."""
+    resposta = jsonify(itens)
+    if proximo_cursor:
+        args = request.args.to_dict()
+        args['after'] = proximo_cursor
+        resposta.headers['X-Proximo-Cursor'] = proximo_cursor
+        resposta.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return resposta
+
+
+def quer_ndjson():
+    """O cliente pediu streaming (?stream=1 ou Accept: application/x-ndjson)?"""
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    melhor = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return melhor == 'application/x-ndjson'
+
+
+async def resposta_ndjson(sql, params, descricao):
+    """
+    Transmite o resultado como NDJSON com um cursor nomeado (lado do servidor), como o
+    app.py. A conexão fica com o gerador e volta ao pool quando a transmissão termina.
+    """
+    try:
+        conn = await db_pool.getconn()
+    except PoolTimeout as e:
+        print(f"DB Pool exhausted: {e}")
+        return resposta_sem_conexao()
+
+    async def gerar():
+        try:
+            async with conn.cursor(name='listagem_ndjson') as cur:
+                cur.itersize = NDJSON_ITERSIZE
+                await cur.execute(sql, params)
+                column_names = None
+                async for row in cur:
+                    if column_names is None:
+                        column_names = [desc.name for desc in cur.description]
+                    yield app.json.dumps(dict(zip(column_names, row)), separators=(',', ':')) + '\n'
+        except psycopg.Error as e:
+            # O status 200 já foi enviado: o erro vai como última linha do fluxo
+            print(f"Erro no banco de dados ao transmitir {descricao}: {e}")
+            yield app.json.dumps({"erro": f"Erro interno ao transmitir {descricao}."}) + '\n'
+        finally:
+            await db_pool.putconn(conn)
+
+    resposta = Response(gerar(), mimetype='application/x-ndjson')
+    # Evita que proxies (nginx) segurem o fluxo em buffer
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
+
+
+def condicional(*tabelas, variante=None):
+    """GET condicional (ETag / If-None-Match), como ControleVersoes.condicional do app.py."""
+    def decorador(rota):
+        @functools.wraps(rota)
+        async def envoltorio(*args, **kwargs):
+            try:
+                async with db_pool.connection() as conn:
+                    cur = await conn.execute(SQL_VERSOES, (list(tabelas),))
+                    versoes = dict(await cur.fetchall())
+                versoes = {tabela: versoes.get(tabela, 0) for tabela in tabelas}
+            except (PoolTimeout, psycopg.Error) as e:
+                # Sem versões (tabela ausente ou banco indisponível): resposta normal, sem ETag
+                print(f"Erro ao consultar versoes_tabelas: {e}")
+                return await rota(*args, **kwargs)
+
+            etag = calcular_etag(request.full_path, variante() if variante else None, versoes)
+            if request.if_none_match.contains(etag):
+                resposta = Response("", status=304)
+                resposta.set_etag(etag)
+                return resposta
+
+            resposta = await make_response(await rota(*args, **kwargs))
+            if resposta.status_code == 200:
+                resposta.set_etag(etag)
+            return resposta
+        return envoltorio
+    return decorador
+
+
+# =============================================================================
+# ROTAS DE USUÁRIOS
+# =============================================================================
+
+@app.route('/usuarios', methods=['POST'])
+async def criar_usuario():
+    try:
+        nome, email, senha_plana, funcionario_id = validar_usuario(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        senha_hash = await em_thread(servico_senhas.gerar_hash, senha_plana)
+    except ServicoSenhasOcupado:
+        return resposta_servico_ocupado()
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(
+                consultas.SQL_INSERIR_USUARIO, (nome, email, senha_hash, funcionario_id)
+            )
+            novo_id = (await cur.fetchone())[0]
+
+        return jsonify({
+            "mensagem": "Usuário criado com sucesso",
+            "id": novo_id,
+            "email": email
+        }), 201
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.errors.UniqueViolation:
+        return jsonify({"erro": "O email já está em uso"}), 409
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados: {e}")
+        return jsonify({"erro": "Erro interno ao criar usuário."}), 500
+
+
+@app.route('/usuarios', methods=['GET'])
+@condicional('usuarios')
+async def listar_usuarios():
+    try:
+        filtros = ler_filtros_usuarios(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    sql, params = consultas.listar_usuarios(filtros)
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            usuarios = como_dicionarios(cur, await cur.fetchall())
+
+        usuarios, proximo_cursor = fatiar_pagina(usuarios, filtros["limite"], lambda u: (u['id'],))
+        usuarios = recortar_campos(usuarios, filtros["campos"])
+        return resposta_paginada(usuarios, proximo_cursor), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao listar usuários: {e}")
+        return jsonify({"erro": "Erro interno ao listar usuários."}), 500
+
+
+@app.route('/login', methods=['POST'])
+async def login_usuario():
+    try:
+        email, senha_plana = validar_login(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        # A conexão volta ao pool antes da verificação da senha (que é lenta de propósito)
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(consultas.SQL_LOGIN, (email,))
+            registros = como_dicionarios(cur, await cur.fetchall())
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados durante o login: {e}")
+        return jsonify({"erro": "Erro interno ao tentar login."}), 500
+
+    if not registros:
+        return jsonify({"erro": "Email ou senha incorretos"}), 401
+
+    user_data = registros[0]
+
+    try:
+        senha_correta = await em_thread(servico_senhas.verificar, user_data['senha_hash'], senha_plana)
+    except ServicoSenhasOcupado:
+        return resposta_servico_ocupado()
+
+    if not senha_correta:
+        return jsonify({"erro": "Email ou senha incorretos"}), 401
+
+    # Autenticação bem-sucedida: atualiza o hash se foi gerado com parâmetros antigos
+    if servico_senhas.precisa_rehash(user_data['senha_hash']):
+        await atualizar_hash_desatualizado(user_data['id'], user_data['senha_hash'], senha_plana)
+
+    del user_data['senha_hash']
+    versao_senha = user_data.pop('versao_senha')
+
+    return jsonify({
+        "mensagem": "Login bem-sucedido",
+        "usuario": user_data,
+        **servico_tokens.emitir(user_data['id'], versao_senha)
+    }), 200
+
+
+@app.route('/login/renovar', methods=['POST'])
+async def renovar_tokens():
+    """Troca um token de renovação válido por um par novo, sem pedir a senha."""
+    try:
+        token = validar_renovacao(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        usuario = await servico_tokens.verificar_assincrono(token, TIPO_RENOVACAO)
+    except TokenInvalido as e:
+        return resposta_nao_autenticado(str(e))
+    except (PoolTimeout, psycopg.Error) as e:
+        print(f"Erro no banco de dados ao renovar o token: {e}")
+        return resposta_sem_conexao()
+
+    return jsonify({
+        "mensagem": "Tokens renovados",
+        **servico_tokens.emitir(usuario['id'], usuario['versao_senha'])
+    }), 200
+
+
+@app.route('/usuarios/eu', methods=['GET'])
+@requer_autenticacao
+async def usuario_autenticado():
+    """Dono do token de acesso, lido do cache (sem ir ao banco na maioria das chamadas)."""
+    return jsonify({
+        campo: valor for campo, valor in g.usuario.items() if campo != 'versao_senha'
+    }), 200
+
+
+async def atualizar_hash_desatualizado(usuario_id, senha_hash_antigo, senha_plana):
+    """Mesmo comportamento do app.py: melhor esforço, sem impedir o login."""
+    try:
+        novo_hash = await em_thread(servico_senhas.gerar_hash, senha_plana)
+        async with db_pool.connection() as conn:
+            await conn.execute(consultas.SQL_REGRAVAR_HASH, (novo_hash, usuario_id, senha_hash_antigo))
+    except ServicoSenhasOcupado:
+        return
+    except (PoolTimeout, psycopg.Error) as e:
+        print(f"Erro ao atualizar hash de senha desatualizado: {e}")
+
+
+@app.route('/usuarios/<int:usuario_id>/senha', methods=['PUT'])
+async def atualizar_senha_usuario(usuario_id):
+    try:
+        senha_atual, nova_senha = validar_troca_senha(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        # A conexão volta ao pool enquanto o hashing roda
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(consultas.SQL_SENHA_USUARIO, (usuario_id,))
+            result = await cur.fetchone()
+
+        if not result:
+            return jsonify({"erro": "Usuário não encontrado"}), 404
+
+        try:
+            if senha_atual:
+                if not await em_thread(servico_senhas.verificar, result[0], senha_atual):
+                    return jsonify({"erro": "Senha atual incorreta"}), 401
+            nova_senha_hash = await em_thread(servico_senhas.gerar_hash, nova_senha)
+        except ServicoSenhasOcupado:
+            return resposta_servico_ocupado()
+
+        async with db_pool.connection() as conn:
+            await conn.execute(consultas.SQL_ATUALIZAR_SENHA, (nova_senha_hash, usuario_id))
+        # Os tokens emitidos com a senha antiga deixam de valer (versao_senha mudou)
+        servico_tokens.invalidar_usuario(usuario_id)
+
+        return jsonify({
+            "mensagem": "Senha atualizada com sucesso"
+        }), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro ao atualizar senha: {e}")
+        return jsonify({"erro": "Erro interno ao atualizar senha"}), 500
+
+
+# =============================================================================
+# ROTAS DE FUNCIONÁRIOS
+# =============================================================================
+
+@app.route('/funcionarios', methods=['POST'])
+async def criar_funcionario():
+    try:
+        nome, matricula, cargo = validar_funcionario(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(consultas.SQL_INSERIR_FUNCIONARIO, (nome, matricula, cargo))
+            novo_id = (await cur.fetchone())[0]
+
+        return jsonify({
+            "mensagem": "Funcionário cadastrado com sucesso",
+            "id": novo_id,
+            "nome": nome
+        }), 201
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.errors.UniqueViolation:
+        return jsonify({"erro": "A matrícula já está em uso"}), 409
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados: {e}")
+        return jsonify({"erro": "Erro interno ao cadastrar funcionário."}), 500
+
+
+@app.route('/funcionarios', methods=['GET'])
+@condicional('funcionarios', variante=quer_ndjson)
+async def listar_funcionarios():
+    try:
+        filtros = ler_filtros_funcionarios(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    streaming = quer_ndjson()
+    sql, params = consultas.listar_funcionarios(filtros, a_mais=not streaming)
+
+    if streaming:
+        return await resposta_ndjson(sql, params, "funcionários")
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            funcionarios = como_dicionarios(cur, await cur.fetchall())
+
+        funcionarios, proximo_cursor = fatiar_pagina(funcionarios, filtros["limite"], lambda f: (f['id'],))
+        funcionarios = recortar_campos(funcionarios, filtros["campos"])
+        return resposta_paginada(funcionarios, proximo_cursor), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao listar funcionários: {e}")
+        return jsonify({"erro": "Erro interno ao listar funcionários."}), 500
+
+
+# =============================================================================
+# ROTAS DE VEÍCULOS
+# =============================================================================
+
+@app.route('/veiculos', methods=['POST'])
+async def cadastrar_veiculo():
+    try:
+        modelo, marca, ano, placa, tipo = validar_veiculo(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(consultas.SQL_INSERIR_VEICULO, (modelo, marca, ano, placa, tipo))
+            novo_id = (await cur.fetchone())[0]
+            await notificar_evento(conn, 'veiculo_cadastrado', {"id": novo_id, "placa": placa, "tipo": tipo})
+        cache_respostas.invalidar('veiculos')
+
+        return jsonify({
+            "mensagem": "Veículo cadastrado com sucesso",
+            "id": novo_id,
+            "placa": placa,
+            "tipo" : tipo
+        }), 201
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.errors.UniqueViolation:
+        return jsonify({"erro": "A placa já está em uso"}), 409
+
+    except psycopg.errors.CheckViolation:
+        return jsonify({"erro": "O ano do veículo não é válido (deve ser >= 1900)"}), 400
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados: {e}")
+        return jsonify({"erro": "Erro interno ao cadastrar veículo."}), 500
+
+
+@app.route('/veiculos', methods=['GET'])
+@condicional('veiculos', variante=quer_ndjson)
+async def listar_veiculos():
+    try:
+        filtros = ler_filtros_veiculos(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    streaming = quer_ndjson()
+    sql, params = consultas.listar_veiculos(filtros, a_mais=not streaming)
+
+    if streaming:
+        return await resposta_ndjson(sql, params, "veículos")
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            veiculos = como_dicionarios(cur, await cur.fetchall())
+
+        veiculos, proximo_cursor = fatiar_pagina(veiculos, filtros["limite"], lambda v: (v['id'],))
+        veiculos = recortar_campos(veiculos, filtros["campos"])
+        return resposta_paginada(veiculos, proximo_cursor), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao listar veículos: {e}")
+        return jsonify({"erro": "Erro interno ao listar veículos."}), 500
+
+
+@app.route('/veiculos/<int:veiculo_id>/status', methods=['PATCH'])
+async def atualizar_status_veiculo(veiculo_id):
+    try:
+        ativo = validar_status_veiculo(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(consultas.SQL_VEICULO_EXISTE, (veiculo_id,))
+            if not await cur.fetchone():
+                return jsonify({"erro": f"Veículo com ID {veiculo_id} não encontrado"}), 404
+
+            cur = await conn.execute(consultas.SQL_ATUALIZAR_STATUS_VEICULO, (ativo, veiculo_id))
+            veiculo_atualizado = como_dicionarios(cur, await cur.fetchall())[0]
+            await notificar_evento(conn, 'veiculo_status', {"id": veiculo_id, "ativo": ativo})
+        cache_respostas.invalidar('veiculos')
+
+        status_texto = "disponível" if ativo else "indisponível"
+
+        return jsonify({
+            "mensagem": f"Status do veículo atualizado para {status_texto}",
+            "veiculo": veiculo_atualizado
+        }), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao atualizar status: {e}")
+        return jsonify({"erro": "Erro interno ao atualizar status do veículo."}), 500
+
+
+@app.route('/veiculos/status', methods=['PATCH'])
+async def atualizar_status_veiculos_lote():
+    try:
+        modo, *dados = validar_status_lote(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    if modo == 'lista':
+        sql, params = consultas.SQL_ATUALIZAR_STATUS_LOTE, dados
+    else:
+        sql, params = consultas.atualizar_status_por_filtro(*dados)
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            veiculos = como_dicionarios(cur, await cur.fetchall())
+            alterados = sum(veiculo.pop('alterado') for veiculo in veiculos)
+            if alterados:
+                await notificar_evento(conn, 'veiculos_status_lote', {"quantidade": alterados})
+        if alterados:
+            cache_respostas.invalidar('veiculos')
+
+        encontrados = {veiculo['id'] for veiculo in veiculos}
+        nao_encontrados = [i for i in dados[0] if i not in encontrados] if modo == 'lista' else []
+
+        return jsonify({
+            "mensagem": f"{len(veiculos)} veículos atualizados ({alterados} mudaram de status)",
+            "atualizados": len(veiculos),
+            "alterados": alterados,
+            "veiculos": veiculos,
+            "nao_encontrados": nao_encontrados
+        }), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao atualizar status em lote: {e}")
+        return jsonify({"erro": "Erro interno ao atualizar status dos veículos."}), 500
+
+
+@app.route('/veiculos/disponiveis', methods=['GET'])
+@condicional('veiculos')
+async def listar_veiculos_disponiveis():
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(consultas.SQL_VEICULOS_DISPONIVEIS)
+            veiculos_disponiveis = como_dicionarios(cur, await cur.fetchall())
+
+        return jsonify({
+            "total": len(veiculos_disponiveis),
+            "veiculos": veiculos_disponiveis
+        }), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao listar veículos disponíveis: {e}")
+        return jsonify({"erro": "Erro interno ao listar veículos disponíveis."}), 500
+
+
+# =============================================================================
+# ROTAS DE EMPRÉSTIMOS
+# =============================================================================
+
+@app.route('/emprestimos', methods=['POST'])
+async def registrar_emprestimo():
+    try:
+        params = validar_emprestimo(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    veiculo_id = params['veiculo_id']
+    funcionario_id = params['funcionario_id']
+
+    try:
+        # Checkout num único comando (ver consultas.SQL_REGISTRAR_EMPRESTIMO), em autocommit
+        async with db_pool.connection() as conn:
+            await conn.set_autocommit(True)
+            try:
+                cur = await conn.execute(consultas.SQL_REGISTRAR_EMPRESTIMO, params)
+                novo_id, veiculo_existe, _ = await cur.fetchone()
+            finally:
+                await conn.set_autocommit(False)
+
+        if novo_id is None:
+            if not veiculo_existe:
+                return jsonify({"erro": "ID de veículo ou funcionário inválido."}), 404
+            return jsonify({"erro": f"O veículo {veiculo_id} não está disponível para empréstimo"}), 409
+
+        cache_respostas.invalidar('veiculos')
+
+        return jsonify({
+            "mensagem": "Empréstimo (Saída) registrado com sucesso",
+            "id": novo_id,
+            "veiculo_id": veiculo_id,
+            "funcionario_id": funcionario_id
+        }), 201
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.errors.ForeignKeyViolation as e:
+        print(f"Erro de chave estrangeira: {e}")
+        return jsonify({"erro": "ID de veículo ou funcionário inválido."}), 404
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao registrar empréstimo: {e}")
+        return jsonify({"erro": "Erro interno ao registrar empréstimo."}), 500
+
+
+@app.route('/emprestimos', methods=['GET'])
+@condicional('emprestimos', 'veiculos', 'funcionarios', variante=quer_ndjson)
+async def listar_emprestimos():
+    try:
+        filtros = ler_filtros_emprestimos(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    streaming = quer_ndjson()
+    sql, params = consultas.listar_emprestimos(filtros, a_mais=not streaming)
+
+    if streaming:
+        return await resposta_ndjson(sql, params, "empréstimos")
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            emprestimos = como_dicionarios(cur, await cur.fetchall())
+
+        emprestimos, proximo_cursor = fatiar_pagina(
+            emprestimos, filtros["limite"], lambda e: (e['data_saida'].isoformat(), e['id'])
+        )
+        emprestimos = recortar_campos(emprestimos, filtros["campos"])
+        return resposta_paginada(emprestimos, proximo_cursor), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao listar empréstimos: {e}")
+        return jsonify({"erro": "Erro interno ao listar empréstimos."}), 500
+
+
+@app.route('/emprestimos/<int:emprestimo_id>/finalizar', methods=['PATCH'])
+async def finalizar_emprestimo(emprestimo_id):
+    try:
+        params = validar_finalizacao(await ler_json())
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    params['id'] = emprestimo_id
+    km_retorno = params['km_retorno']
+
+    try:
+        # Finalização num único comando (ver consultas.SQL_FINALIZAR_EMPRESTIMO), em autocommit
+        async with db_pool.connection() as conn:
+            await conn.set_autocommit(True)
+            try:
+                cur = await conn.execute(consultas.SQL_FINALIZAR_EMPRESTIMO, params)
+                linhas = como_dicionarios(cur, await cur.fetchall())
+            finally:
+                await conn.set_autocommit(False)
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao finalizar empréstimo: {e}")
+        return jsonify({"erro": "Erro interno ao finalizar empréstimo."}), 500
+
+    if not linhas:
+        return jsonify({"erro": f"Empréstimo com ID {emprestimo_id} não encontrado"}), 404
+
+    resultado = linhas[0]
+    km_saida = resultado.pop('km_saida_atual')
+    data_retorno_anterior = resultado.pop('data_retorno_anterior')
+    resultado.pop('evento_id')
+
+    if data_retorno_anterior is not None:
+        return jsonify({
+            "erro": "Este empréstimo já foi finalizado",
+            "data_retorno_anterior": str(data_retorno_anterior)
+        }), 400
+
+    if resultado['id'] is None:
+        return jsonify({
+            "erro": "A quilometragem de retorno não pode ser menor que a quilometragem de saída",
+            "km_saida": str(km_saida),
+            "km_retorno_informado": str(km_retorno)
+        }), 400
+
+    cache_respostas.invalidar('veiculos')
+
+    distancia_percorrida = float(km_retorno) - float(km_saida)
+
+    return jsonify({
+        "mensagem": "Empréstimo finalizado com sucesso",
+        "emprestimo": resultado,
+        "distancia_percorrida_km": round(distancia_percorrida, 2),
+        "veiculo_disponivel": True
+    }), 200
+
+
+async def resposta_lote_emprestimos(validar_item, sql, parametros, resultados, acao, status_gravado):
+    """Mesmo fluxo do app.py: um comando por lote, confirmado ou desfeito conforme o modo."""
+    try:
+        modo, total, itens, erros = validar_lote_emprestimos(await ler_json(), validar_item)
+    except DadosInvalidos as e:
+        return jsonify({"erro": str(e)}), 400
+
+    if not itens or (erros and modo == 'atomico'):
+        corpo, status, _ = emprestimos_lote.montar_resposta(modo, total, erros, [], acao, status_gravado)
+        return jsonify(corpo), status
+
+    try:
+        async with db_pool.connection() as conn:
+            await conn.set_autocommit(modo == 'parcial')
+            try:
+                cur = await conn.execute(sql, parametros(itens))
+                linhas = como_dicionarios(cur, await cur.fetchall())
+                corpo, status, gravar = emprestimos_lote.montar_resposta(
+                    modo, total, erros, resultados(itens, linhas), acao, status_gravado
+                )
+                if not gravar:
+                    await conn.rollback()
+            finally:
+                # No modo atomico a transação segue aberta e é confirmada na saída do 'with'
+                if conn.autocommit:
+                    await conn.set_autocommit(False)
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados no lote de empréstimos ({acao}): {e}")
+        return jsonify({"erro": "Erro interno ao processar o lote de empréstimos."}), 500
+
+    if gravar:
+        cache_respostas.invalidar('veiculos')
+    return jsonify(corpo), status
+
+
+@app.route('/emprestimos/lote', methods=['POST'])
+async def registrar_emprestimos_lote():
+    return await resposta_lote_emprestimos(
+        validar_emprestimo_lote, consultas.SQL_REGISTRAR_EMPRESTIMOS_LOTE,
+        emprestimos_lote.parametros_registro, emprestimos_lote.resultados_registro,
+        "registrados", 201
+    )
+
+
+@app.route('/emprestimos/finalizar-lote', methods=['PATCH'])
+async def finalizar_emprestimos_lote():
+    return await resposta_lote_emprestimos(
+        validar_finalizacao_lote, consultas.SQL_FINALIZAR_EMPRESTIMOS_LOTE,
+        emprestimos_lote.parametros_finalizacao, emprestimos_lote.resultados_finalizacao,
+        "finalizados", 200
+    )
+
+
+@app.route('/emprestimos/ativos', methods=['GET'])
+@condicional('emprestimos', 'veiculos', 'funcionarios')
+async def listar_emprestimos_ativos():
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(consultas.SQL_EMPRESTIMOS_ATIVOS)
+            emprestimos_ativos = como_dicionarios(cur, await cur.fetchall())
+
+        return jsonify({
+            "total": len(emprestimos_ativos),
+            "emprestimos": emprestimos_ativos
+        }), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao listar empréstimos ativos: {e}")
+        return jsonify({"erro": "Erro interno ao listar empréstimos ativos."}), 500
+
+
+# =============================================================================
+# BUSCA
+# =============================================================================
+
+# Mesmo papel do app.py: verificado na primeira busca
+busca_aproximada = None
+
+
+@app.route('/busca', methods=['GET'])
+@condicional('veiculos', 'funcionarios')
+async def buscar():
+    global busca_aproximada
+    try:
+        filtros = ler_busca(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        async with db_pool.connection() as conn:
+            if busca_aproximada is None:
+                cur = await conn.execute(consultas.SQL_BUSCA_APROXIMADA)
+                busca_aproximada = (await cur.fetchone())[0]
+
+            sql, params = consultas.busca(filtros["termo"], filtros["tipos"], filtros["limite"],
+                                          busca_aproximada)
+            cur = await conn.execute(sql, params)
+            resultados = como_dicionarios(cur, await cur.fetchall())
+
+        return jsonify({
+            "total": len(resultados),
+            "aproximada": busca_aproximada,
+            "resultados": resultados
+        }), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados na busca: {e}")
+        return jsonify({"erro": "Erro interno na busca."}), 500
+
+
+# =============================================================================
+# RELATÓRIOS DE USO
+# =============================================================================
+
+async def resposta_serie_uso(dimensao, chave):
+    try:
+        filtros = ler_filtros_uso(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    sql, params = consultas.serie_uso(dimensao, chave, filtros)
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            periodos = como_dicionarios(cur, await cur.fetchall())
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao gerar relatório de uso: {e}")
+        return jsonify({"erro": "Erro interno ao gerar relatório de uso."}), 500
+
+    return jsonify({
+        "agrupar": filtros["agrupar"],
+        "inicio": filtros["inicio"] and filtros["inicio"].isoformat(),
+        "fim": filtros["fim"] and filtros["fim"].isoformat(),
+        "periodos": periodos,
+        "total": {
+            "emprestimos": sum(p["emprestimos"] for p in periodos),
+            "km": round(sum(p["km"] for p in periodos), 2),
+            "horas": round(sum(p["horas"] for p in periodos), 2)
+        }
+    }), 200
+
+
+async def resposta_ranking_uso(dimensao):
+    try:
+        filtros = ler_ranking_uso(request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    sql, params = consultas.ranking_uso(dimensao, filtros["mes"], filtros["limite"])
+
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            ranking = como_dicionarios(cur, await cur.fetchall())
+
+        return jsonify({
+            "mes": filtros["mes"].strftime('%Y-%m'),
+            "ranking": ranking
+        }), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao gerar ranking de uso: {e}")
+        return jsonify({"erro": "Erro interno ao gerar relatório de uso."}), 500
+
+
+@app.route('/relatorios/uso', methods=['GET'])
+async def relatorio_uso_frota():
+    return await resposta_serie_uso('frota', 0)
+
+
+@app.route('/relatorios/uso/veiculos/<int:veiculo_id>', methods=['GET'])
+async def relatorio_uso_veiculo(veiculo_id):
+    return await resposta_serie_uso('veiculo', veiculo_id)
+
+
+@app.route('/relatorios/uso/funcionarios/<int:funcionario_id>', methods=['GET'])
+async def relatorio_uso_funcionario(funcionario_id):
+    return await resposta_serie_uso('funcionario', funcionario_id)
+
+
+@app.route('/relatorios/uso/veiculos', methods=['GET'])
+async def ranking_uso_veiculos():
+    return await resposta_ranking_uso('veiculo')
+
+
+@app.route('/relatorios/uso/funcionarios', methods=['GET'])
+async def ranking_uso_funcionarios():
+    return await resposta_ranking_uso('funcionario')
+
+
+# =============================================================================
+# ROTAS DO ARQUIVO DO HISTÓRICO
+# =============================================================================
+
+@app.route('/arquivo/emprestimos', methods=['GET'])
+async def listar_meses_arquivados():
+    """Meses tirados do banco por 'python migrar.py arquivar': linhas, bytes e sha256 do arquivo."""
+    try:
+        async with db_pool.connection() as conn:
+            cur = await conn.execute(consultas.SQL_MESES_ARQUIVADOS)
+            meses = como_dicionarios(cur, await cur.fetchall())
+
+        return jsonify(meses), 200
+
+    except PoolTimeout:
+        return resposta_sem_conexao()
+
+    except psycopg.Error as e:
+        print(f"Erro no banco de dados ao listar meses arquivados: {e}")
+        return jsonify({"erro": "Erro interno ao listar meses arquivados."}), 500
+
+
+@app.route('/arquivo/emprestimos/<mes>', methods=['GET'])
+async def listar_emprestimos_arquivados(mes):
+    """
+    Como no app.py. A leitura do arquivo (descompactar e converter o CSV) roda numa thread,
+    fora do event loop, e também relê o mês do início a cada página.
+    """
+    try:
+        filtros = ler_filtros_arquivo(mes, request.args)
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    try:
+        emprestimos = await em_thread(arquivamento.consultar_mes, ARQUIVO_CONFIG["diretorio"], filtros)
+    except FileNotFoundError:
+        return jsonify({"erro": f"Mês {filtros['mes']:%Y-%m} não está no arquivo"}), 404
+    except (OSError, EOFError, ValueError) as e:
+        print(f"Erro ao ler o arquivo de {filtros['mes']:%Y-%m}: {e}")
+        return jsonify({"erro": "Erro interno ao ler o arquivo de empréstimos."}), 500
+
+    emprestimos, proximo_cursor = fatiar_pagina(
+        emprestimos, filtros["limite"], lambda e: (e['data_saida'].isoformat(), e['id'])
+    )
+    emprestimos = recortar_campos(emprestimos, filtros["campos"])
+
+    return resposta_paginada(emprestimos, proximo_cursor), 200
+
+
+# =============================================================================
+# ROTAS DE DIAGNÓSTICO
+# =============================================================================
+
+@app.route('/status/pool', methods=['GET'])
+async def estatisticas_pool():
+    """Estatísticas do AsyncConnectionPool (nomes do psycopg_pool, não os do PoolConexoes)."""
+    return jsonify(db_pool.get_stats()), 200
+
+
+@app.route('/status/tokens', methods=['GET'])
+async def estatisticas_tokens():
+    """Acertos dos caches de tokens validados e de usuários, recusas e invalidações."""
+    return jsonify(servico_tokens.estatisticas()), 200
+
+
+@app.route('/status/idempotencia', methods=['GET'])
+async def estatisticas_idempotencia():
+    """Requisições executadas, repetidas (respostas guardadas), esperas e conflitos."""
+    return jsonify(registro_idempotencia.estatisticas()), 200
+
+
+if __name__ == '__main__':
+    app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Arquivo frio do histórico de empréstimos (tabela particionada por mês, migração 0008).
+
+- "python migrar.py particoes" cria as partições mensais dos próximos meses.
+- "python migrar.py arquivar" grava cada mês anterior ao corte num CSV compactado
+  (emprestimos_AAAA_MM.csv.gz em ARQUIVO_CONFIG["diretorio"]), desanexa e apaga a partição
+  e registra o mês em emprestimos_arquivados. Meses com empréstimos abertos ficam no banco.
+- GET /arquivo/emprestimos/<AAAA-MM> lê esses arquivos, sem ir ao banco.
+
+Cada arquivo tem as colunas de GET /emprestimos (placa e nome já resolvidos na hora do
+arquivamento), em ordem de (data_saida, id), com NULL escrito como \\N.
+"""
+import csv
+import gzip
+import hashlib
+import os
+import re
+from datetime import date, datetime
+from decimal import Decimal
+
+import consultas
+
+NULO = '\\N'
+
+CONVERSORES = {
+    "id": int,
+    "veiculo_id": int,
+    "funcionario_id": int,
+    "data_saida": datetime.fromisoformat,
+    "km_saida": Decimal,
+    "data_retorno": datetime.fromisoformat,
+    "km_retorno": Decimal,
+    "criado_em": datetime.fromisoformat,
+}
+
+PADRAO_PARTICAO = re.compile(r'^emprestimos_(\d{4})_(\d{2})$')
+
+SQL_PARTICOES = """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'emprestimos'::regclass
+    ORDER BY c.relname;
+"""
+
+SQL_CRIAR_PARTICOES = """
+    SELECT criar_particoes_emprestimos(
+        date_trunc('month', now())::date,
+        (date_trunc('month', now()) + make_interval(months => %s))::date
+    );
+"""
+
+SQL_EXPORTAR = "COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER, NULL '\\N')"
+
+SQL_CONTAR = "SELECT count(*), count(*) FILTER (WHERE data_retorno IS NULL) FROM {particao};"
+
+# DETACH e DROP não disparam trg_versao_emprestimos: o mesmo incremento da função
+# incrementar_versao_tabela (migrações 0003 e 0009), para as ETags de /emprestimos mudarem
+SQL_INCREMENTAR_VERSAO = """
+    INSERT INTO versoes_tabelas (tabela, versao)
+    VALUES ('emprestimos', 1)
+    ON CONFLICT (tabela) DO UPDATE SET versao = versoes_tabelas.versao + 1;
+"""
+
+SQL_REGISTRAR = """
+    INSERT INTO emprestimos_arquivados (mes, arquivo, linhas, bytes, sha256)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (mes) DO UPDATE
+    SET arquivo = EXCLUDED.arquivo, linhas = EXCLUDED.linhas, bytes = EXCLUDED.bytes,
+        sha256 = EXCLUDED.sha256, arquivado_em = NOW();
+"""
+
+
+def nome_particao(mes):
+    return f"emprestimos_{mes:%Y_%m}"
+
+
+def caminho_mes(diretorio, mes):
+    return os.path.join(diretorio, f"emprestimos_{mes:%Y_%m}.csv.gz")
+
+
+# =============================================================================
+# MANUTENÇÃO (migrar.py)
+# =============================================================================
+
+def criar_particoes(conn, meses_futuros):
+    """Cria as partições do mês atual até meses_futuros à frente. Retorna os nomes criados."""
+    with conn.cursor() as cur:
+        cur.execute(SQL_CRIAR_PARTICOES, (meses_futuros,))
+        criadas = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    return criadas
+
+
+def particoes_mensais(conn):
+    """[(primeiro dia do mês, nome da partição)] das partições mensais anexadas, em ordem."""
+    with conn.cursor() as cur:
+        cur.execute(SQL_PARTICOES)
+        nomes = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    particoes = []
+    for nome in nomes:
+        encontrado = PADRAO_PARTICAO.match(nome)
+        if encontrado:
+            particoes.append((date(int(encontrado.group(1)), int(encontrado.group(2)), 1), nome))
+    return particoes
+
+
+def arquivar(conn, diretorio, corte, manter_tabelas=False):
+    """
+    Arquiva as partições dos meses anteriores a 'corte' (primeiro dia de um mês), um mês por
+    transação. Retorna [(mês, linhas ou None, motivo)]; linhas None = mês mantido no banco.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    resultados = []
+    for mes, nome in particoes_mensais(conn):
+        if mes >= corte:
+            break
+        resultados.append((mes, *arquivar_mes(conn, diretorio, mes, nome, manter_tabelas)))
+    return resultados
+
+
+def arquivar_mes(conn, diretorio, mes, particao, manter_tabela=False):
+    """
+    Grava o mês no arquivo e desanexa a partição. Sem travar o mês durante a cópia: os
+    empréstimos fechados não mudam mais, e a contagem é refeita depois do DETACH (que trava a
+    partição); se alguém escreveu no mês nesse meio tempo, nada é desanexado.
+    Retorna (linhas, None) ou (None, motivo).
+    """
+    caminho = caminho_mes(diretorio, mes)
+    temporario = caminho + '.parcial'
+    try:
+        with conn.cursor() as cur:
+            # Não fica na fila atrás de consultas longas segurando a tabela inteira
+            cur.execute("SET LOCAL lock_timeout = '5s';")
+            cur.execute("SET LOCAL DateStyle = 'ISO, YMD';")
+            cur.execute(SQL_CONTAR.format(particao=particao))
+            linhas, abertos = cur.fetchone()
+            if abertos:
+                conn.rollback()
+                return None, f"{abertos} empréstimo(s) aberto(s)"
+
+            with gzip.open(temporario, 'wb') as arquivo:
+                cur.copy_expert(SQL_EXPORTAR.format(consultas.selecionar_mes_emprestimos(particao)), arquivo)
+            gravadas, tamanho, resumo = _conferir(temporario)
+            if gravadas != linhas:
+                raise RuntimeError(f"{particao}: {gravadas} linhas no arquivo, {linhas} na tabela")
+
+            cur.execute(f"ALTER TABLE emprestimos DETACH PARTITION {particao};")
+            cur.execute(SQL_CONTAR.format(particao=particao))
+            if cur.fetchone() != (linhas, 0):
+                conn.rollback()
+                os.remove(temporario)
+                return None, "alterado durante o arquivamento; rode de novo"
+
+            if not manter_tabela:
+                cur.execute(f"DROP TABLE {particao};")
+            cur.execute(SQL_INCREMENTAR_VERSAO)
+            cur.execute(SQL_REGISTRAR, (mes, os.path.basename(caminho), linhas, tamanho, resumo))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    # Só depois do commit: se ele falhar, o mês continua no banco e não aparece no arquivo
+    try:
+        os.replace(temporario, caminho)
+    except OSError as e:
+        raise RuntimeError(f"{particao} arquivada, mas o arquivo ficou em {temporario}; "
+                           f"renomeie para {caminho}: {e}") from e
+    return linhas, None
+
+
+def _conferir(caminho):
+    """Relê o arquivo gravado: (linhas de dados, bytes, sha256 do arquivo compactado)."""
+    with gzip.open(caminho, 'rt', encoding='utf-8', newline='') as arquivo:
+        linhas = sum(1 for _ in csv.reader(arquivo)) - 1
+    resumo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b''):
+            resumo.update(bloco)
+        os.fsync(arquivo.fileno())
+    return linhas, os.path.getsize(caminho), resumo.hexdigest()
+
+
+# =============================================================================
+# LEITURA (GET /arquivo/emprestimos/<AAAA-MM>)
+# =============================================================================
+
+def ler_mes(diretorio, mes):
+    """Gera os empréstimos arquivados do mês, com os tipos da tabela. Lança FileNotFoundError."""
+    with gzip.open(caminho_mes(diretorio, mes), 'rt', encoding='utf-8', newline='') as arquivo:
+        leitor = csv.reader(arquivo)
+        colunas = next(leitor)
+        conversores = [CONVERSORES.get(coluna, str) for coluna in colunas]
+        for linha in leitor:
+            yield {
+                coluna: None if valor == NULO else converter(valor)
+                for coluna, converter, valor in zip(colunas, conversores, linha)
+            }
+
+
+def consultar_mes(diretorio, filtros):
+    """
+    Empréstimos do mês filtrados por veiculo_id e funcionario_id, depois do cursor
+    (data_saida, id), até limite + 1 (para paginacao.fatiar_pagina). O arquivo está na ordem
+    do cursor, então a leitura para assim que a página enche; mas sempre começa da primeira
+    linha do mês, então uma página funda custa O(linhas do mês até ela).
+    """
+    cursor = filtros["cursor"] and (datetime.fromisoformat(filtros["cursor"][0]), filtros["cursor"][1])
+    itens = []
+    for item in ler_mes(diretorio, filtros["mes"]):
+        if cursor and (item["data_saida"], item["id"]) <= cursor:
+            continue
+        if filtros["veiculo_id"] is not None and item["veiculo_id"] != filtros["veiculo_id"]:
+            continue
+        if filtros["funcionario_id"] is not None and item["funcionario_id"] != filtros["funcionario_id"]:
+            continue
+        itens.append(item)
+        if len(itens) > filtros["limite"]:
+            break
+    return itens
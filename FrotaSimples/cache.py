@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, make_response, request
+
+
+# =============================================================================
+# BACKENDS
+# =============================================================================
+
+class BackendLRU:
+    """
+    Cache em memória do próprio processo, com TTL e limite de itens (LRU).
+    Serve para um único nó e como substituto do backend compartilhado nos testes.
+    """
+
+    def __init__(self, max_itens=256):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        # As gerações ficam fora do LRU: se fossem despejadas, entradas antigas voltariam a valer
+        self._geracoes = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            valor, expira_em = item
+            if expira_em <= time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def gravar(self, chave, valor, ttl):
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic() + ttl)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def geracao(self, namespace):
+        with self._lock:
+            return self._geracoes.get(namespace, 0)
+
+    def incrementar_geracao(self, namespace):
+        with self._lock:
+            self._geracoes[namespace] = self._geracoes.get(namespace, 0) + 1
+
+
+class BackendRedis:
+    """
+    Cache compartilhado entre workers/nós via Redis (dependência opcional 'redis').
+    O despejo por tamanho fica a cargo do maxmemory-policy do servidor (ex.: allkeys-lru).
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", prefixo="frota:cache:"):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.prefixo = prefixo
+
+    def obter(self, chave):
+        return self._redis.get(self.prefixo + chave)
+
+    def gravar(self, chave, valor, ttl):
+        self._redis.set(self.prefixo + chave, valor, ex=max(int(ttl), 1))
+
+    def geracao(self, namespace):
+        valor = self._redis.get(self.prefixo + "geracao:" + namespace)
+        return int(valor) if valor is not None else 0
+
+    def incrementar_geracao(self, namespace):
+        self._redis.incr(self.prefixo + "geracao:" + namespace)
+
+
+# =============================================================================
+# CACHE DE RESPOSTAS
+# =============================================================================
+
+# Cabeçalhos da resposta original que são guardados junto com o corpo. Com o cache por fora
+# de versoes.ControleVersoes.condicional, a ETag guardada responde o If-None-Match de um
+# acerto sem ir ao banco: as rotas que invalidam o namespace são as que mudam as tabelas.
+CABECALHOS_EM_CACHE = ('X-Proximo-Cursor', 'Link', 'ETag')
+
+
+class CacheRespostas:
+    """
+    Guarda o corpo já serializado das respostas 200 de rotas GET.
+
+    As entradas são agrupadas por namespace (ex.: 'veiculos'). Cada namespace tem uma
+    geração que faz parte da chave; invalidar() incrementa a geração, o que torna todas as
+    entradas anteriores inalcançáveis de uma vez (elas expiram pelo TTL/LRU).
+    """
+
+    def __init__(self, backend, ttl=30):
+        self.backend = backend
+        self.ttl = ttl
+        self._stats = {"hits": 0, "misses": 0, "invalidacoes": 0}
+
+    def _chave(self, namespace):
+        geracao = self.backend.geracao(namespace)
+        return f"{namespace}:{geracao}:{request.full_path}"
+
+    def em_cache(self, namespace, ignorar=None):
+        """
+        Decorador de rota. 'ignorar' é uma função opcional que, retornando True,
+        faz a requisição passar direto pelo cache (ex.: modo streaming).
+        """
+        def decorador(rota):
+            @functools.wraps(rota)
+            def envoltorio(*args, **kwargs):
+                if ignorar is not None and ignorar():
+                    return rota(*args, **kwargs)
+
+                chave = self._chave(namespace)
+                armazenado = self.backend.obter(chave)
+                if armazenado is not None:
+                    self._stats["hits"] += 1
+                    cabecalhos, corpo = armazenado.split(b'\n', 1)
+                    resposta = Response(corpo, status=200, mimetype='application/json')
+                    resposta.headers.update(json.loads(cabecalhos))
+                    resposta.headers['X-Cache'] = 'HIT'
+                    etag, _ = resposta.get_etag()
+                    if etag and request.if_none_match.contains(etag):
+                        resposta = Response(status=304)
+                        resposta.set_etag(etag)
+                        resposta.headers['X-Cache'] = 'HIT'
+                    return resposta
+
+                self._stats["misses"] += 1
+                resposta = make_response(rota(*args, **kwargs))
+                if resposta.status_code == 200 and not resposta.is_streamed:
+                    cabecalhos = {
+                        nome: resposta.headers[nome]
+                        for nome in CABECALHOS_EM_CACHE if nome in resposta.headers
+                    }
+                    self.backend.gravar(
+                        chave, json.dumps(cabecalhos).encode('utf-8') + b'\n' + resposta.get_data(), self.ttl
+                    )
+                    resposta.headers['X-Cache'] = 'MISS'
+                return resposta
+            return envoltorio
+        return decorador
+
+    def invalidar(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.incrementar_geracao(namespace)
+            self._stats["invalidacoes"] += 1
+
+    def estatisticas(self):
+        return dict(self._stats)
+
+
+def criar_cache(config):
+    """Monta o CacheRespostas a partir de CACHE_CONFIG ('backend': 'lru' ou 'redis')."""
+    if config.get("backend") == "redis":
+        backend = BackendRedis(config.get("redis_url", "redis://localhost:6379/0"))
+    else:
+        backend = BackendLRU(config.get("max_itens", 256))
+    return CacheRespostas(backend, ttl=config.get("ttl", 30))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Configuração compartilhada pela aplicação síncrona (app.py), pela assíncrona
+(app_async.py) e pelo migrador (migrar.py).
+"""
+import os
+
+# Configuração do Banco de Dados
+# ATENÇÃO: Adicionado 'client_encoding' para mitigar o erro 'UnicodeDecodeError'
+DB_CONFIG = {
+    "host": "localhost",
+    "database": "FrotaSimples",
+    "user": "postgres",
+    "password": "123",
+    "port": "5432"
+}
+
+# Configuração do Pool de Conexões
+# timeout: segundos que uma requisição espera por uma conexão livre antes de responder 503
+# vida_maxima: segundos até uma conexão ser reciclada
+# validar_apos: conexões ociosas há mais tempo que isso são testadas antes do uso
+POOL_CONFIG = {
+    "minimo": 2,
+    "maximo": 20,
+    "timeout": 5.0,
+    "vida_maxima": 1800.0,
+    "validar_apos": 30.0
+}
+
+# Configuração do hashing de senhas
+# metodo: método e custo do werkzeug ("scrypt:32768:8:1", "pbkdf2:sha256:600000", ...).
+#         Hashes gravados com outro método são regerados no próximo login bem-sucedido.
+# processos: tamanho do pool de processos (0 = na própria thread)
+# fila_maxima: operações aguardando além das em execução; acima disso a rota responde 503
+SENHA_CONFIG = {
+    "metodo": "scrypt:32768:8:1",
+    "processos": 2,
+    "fila_maxima": 32,
+    "timeout": 10.0
+}
+
+# Tokens de sessão do /login (tokens.py)
+# segredo: chave da assinatura, igual em todos os processos (None = aleatória por processo,
+#          só para desenvolvimento); defina FROTA_SEGREDO_TOKENS em produção
+# acesso_ttl / renovacao_ttl: validade em segundos dos tokens de acesso e de renovação
+# max_tokens: tokens já validados guardados em memória
+# usuarios_ttl / max_usuarios: cache dos usuários autenticados; é também o tempo máximo que
+#                              outro processo leva para recusar tokens após uma troca de senha
+TOKENS_CONFIG = {
+    "segredo": os.environ.get("FROTA_SEGREDO_TOKENS"),
+    "acesso_ttl": 900,
+    "renovacao_ttl": 604800,
+    "max_tokens": 10000,
+    "usuarios_ttl": 60.0,
+    "max_usuarios": 1000
+}
+
+# Idempotency-Key nas rotas de escrita (idempotencia.py)
+# ttl: segundos que a resposta de uma requisição fica disponível para as repetições
+# max_itens: respostas guardadas em memória (LRU)
+# espera: segundos que uma repetição espera a original ainda em andamento antes de um 409
+IDEMPOTENCIA_CONFIG = {
+    "ttl": 86400,
+    "max_itens": 10000,
+    "espera": 30.0
+}
+
+# Configuração do cache de respostas de /veiculos e /veiculos/disponiveis
+# backend: "lru" (memória do processo, um único worker) ou "redis" (compartilhado entre workers)
+# ttl: segundos de validade de uma entrada; max_itens: limite do LRU
+CACHE_CONFIG = {
+    "backend": "lru",
+    "ttl": 30,
+    "max_itens": 256,
+    "redis_url": "redis://localhost:6379/0"
+}
+
+# Linhas buscadas por ida ao servidor no modo streaming (cursor nomeado)
+NDJSON_ITERSIZE = 2000
+
+# Listagens com o array JSON montado pelo próprio PostgreSQL (consultas.como_json), sem
+# dicionários nem jsonify por linha. A saída é idêntica byte a byte à do jsonify compacto;
+# no modo debug o Flask indenta o JSON, então o caminho normal é usado.
+JSON_NO_BANCO = False
+
+# Métricas por rota em GET /metrics (formato Prometheus): contagem por status, histograma de
+# duração e tempo nas fases conexao, espera_conexao, execucao, senha e serializacao.
+METRICAS_ATIVAS = True
+
+# Rastreio de comandos SQL (rastreio.py)
+# consulta_lenta_ms: comandos a partir dessa duração vão para o log de consultas lentas (None desliga)
+# amostra_explain: fração (0 a 1) das consultas lentas de leitura reexecutadas com EXPLAIN ANALYZE
+#                  para registrar o plano junto (cada amostra repete a consulta no banco)
+# arquivo: log com uma linha JSON por consulta lenta (None = saída padrão)
+# server_timing: envia o cabeçalho Server-Timing com o tempo de cada fase da requisição
+RASTREIO_CONFIG = {
+    "consulta_lenta_ms": 200.0,
+    "amostra_explain": 0.0,
+    "arquivo": None,
+    "server_timing": True
+}
+
+# Eventos em tempo real (GET /eventos, Server-Sent Events via LISTEN/NOTIFY)
+# historico: eventos guardados em memória para a retomada com Last-Event-ID
+# heartbeat: segundos sem eventos até enviar um comentário de keepalive
+EVENTOS_CONFIG = {
+    "historico": 1000,
+    "heartbeat": 15.0
+}
+
+# Réplicas de leitura (replicas.py): listagens, busca e relatórios do app.py leem delas
+# replicas: dicionários sobrepostos a DB_CONFIG, um por réplica (ex.: {"host": "replica1"},
+#           {"port": "5433"}); vazia = tudo no primário. Cada uma tem um pool como o POOL_CONFIG.
+# intervalo: segundos entre as verificações de saúde
+# atraso_maximo: réplica com atraso de replicação maior que isso (segundos) sai do rodízio
+# janela_escrita: segundos que um cliente continua lendo do primário depois de uma escrita
+REPLICAS_CONFIG = {
+    "replicas": [],
+    "intervalo": 5.0,
+    "atraso_maximo": 5.0,
+    "janela_escrita": 10.0
+}
+
+# Servidor com greenlets (servidor_gevent.py)
+# conexoes: requisições HTTP atendidas ao mesmo tempo por processo (as demais esperam no accept)
+# pool_maximo: conexões com o banco por processo nesse modo (no lugar de POOL_CONFIG["maximo"]);
+#              requisições além disso esperam uma conexão livre, até POOL_CONFIG["timeout"]
+GEVENT_CONFIG = {
+    "host": "0.0.0.0",
+    "porta": 5000,
+    "conexoes": 2000,
+    "pool_maximo": 50
+}
+
+# Histórico de empréstimos particionado por mês e arquivado (migração 0008, arquivamento.py)
+# meses_futuros: partições criadas à frente do mês atual por "python migrar.py particoes" (rode todo mês)
+# reter_meses: meses completos mantidos no banco antes do atual; "python migrar.py arquivar"
+#              leva os anteriores para arquivos em 'diretorio'
+# diretorio: onde ficam os emprestimos_AAAA_MM.csv.gz lidos por GET /arquivo/emprestimos/<AAAA-MM>
+#            (com vários servidores, um volume compartilhado por todos)
+ARQUIVO_CONFIG = {
+    "meses_futuros": 3,
+    "reter_meses": 24,
+    "diretorio": os.path.join(os.path.dirname(os.path.abspath(__file__)), "arquivo")
+}
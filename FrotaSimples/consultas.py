@@ -0,0 +1,844 @@
+# -*- coding: utf-8 -*-
+"""
+SQL das rotas, compartilhado pela aplicação síncrona (app.py, psycopg2), pela assíncrona
+(app_async.py, psycopg 3) e pela verificação de planos (migrar.py verificar-planos).
+
+Os placeholders seguem o formato %s / %(nome)s, aceito pelos dois drivers. O psycopg 3
+envia os parâmetros separados do texto (binding no servidor), então valores que não
+têm o tipo deduzido pelo contexto (ex.: na lista do SELECT de um INSERT ... SELECT)
+levam cast explícito.
+
+As listagens paginadas são montadas por funções que recebem os filtros já validados
+(validacao.ler_filtros_*) e retornam (sql, params), sem ';' no final para poderem ser
+usadas também num cursor nomeado (streaming).
+"""
+
+# =============================================================================
+# USUÁRIOS
+# =============================================================================
+
+SQL_INSERIR_USUARIO = """
+    INSERT INTO usuarios (nome, email, senha_hash, funcionario_id)
+    VALUES (%s, %s, %s, %s)
+    RETURNING id;
+"""
+
+SQL_LOGIN = """
+    SELECT id, nome, email, senha_hash, funcionario_id, versao_senha
+    FROM usuarios
+    WHERE email = %s;
+"""
+
+# Usuário autenticado por token (cache de usuários do tokens.ServicoTokens)
+SQL_USUARIO_SESSAO = """
+    SELECT id, nome, email, funcionario_id, versao_senha
+    FROM usuarios
+    WHERE id = %s;
+"""
+
+SQL_SENHA_USUARIO = "SELECT senha_hash FROM usuarios WHERE id = %s;"
+
+# A nova versão invalida os tokens de sessão emitidos com a senha antiga
+SQL_ATUALIZAR_SENHA = """
+    UPDATE usuarios
+    SET senha_hash = %s, versao_senha = versao_senha + 1
+    WHERE id = %s;
+"""
+
+# Só regrava se o hash não mudou desde o login (ex.: troca de senha concorrente)
+SQL_REGRAVAR_HASH = "UPDATE usuarios SET senha_hash = %s WHERE id = %s AND senha_hash = %s;"
+
+
+# =============================================================================
+# FUNCIONÁRIOS
+# =============================================================================
+
+SQL_INSERIR_FUNCIONARIO = """
+    INSERT INTO funcionarios (nome, matricula, cargo)
+    VALUES (%s, %s, %s)
+    RETURNING id;
+"""
+
+SQL_LOTE_FUNCIONARIOS = """
+    INSERT INTO funcionarios (nome, matricula, cargo)
+    VALUES %s
+    ON CONFLICT DO NOTHING
+    RETURNING id, matricula;
+"""
+
+
+# =============================================================================
+# VEÍCULOS
+# =============================================================================
+
+SQL_INSERIR_VEICULO = """
+    INSERT INTO veiculos (modelo, marca, ano, placa, tipo)
+    VALUES (%s, %s, %s, %s, %s)
+    RETURNING id;
+"""
+
+SQL_LOTE_VEICULOS = """
+    INSERT INTO veiculos (modelo, marca, ano, placa, tipo)
+    VALUES %s
+    ON CONFLICT DO NOTHING
+    RETURNING id, placa;
+"""
+
+SQL_VEICULO_EXISTE = "SELECT id, modelo, placa FROM veiculos WHERE id = %s;"
+
+SQL_ATUALIZAR_STATUS_VEICULO = """
+    UPDATE veiculos
+    SET ativo = %s
+    WHERE id = %s
+    RETURNING id, modelo, marca, ano, placa, tipo, ativo;
+"""
+
+# PATCH /veiculos/status com uma lista de {id, ativo}: um único UPDATE sobre os arrays de ids
+# e de status (unnest), seja qual for o tamanho da lista.
+# - trava as linhas em ordem de id antes da escrita, para que dois lotes concorrentes com
+#   veículos em comum não entrem em deadlock; o FOR UPDATE devolve a versão mais recente;
+# - só regrava os veículos cujo status muda (sem versões de linha nem WAL à toa);
+# - devolve todos os veículos encontrados, no status final, com 'alterado'.
+# Os ids que não voltam não existem.
+SQL_ATUALIZAR_STATUS_LOTE = """
+    WITH pedidos AS (
+        SELECT * FROM unnest(%s::integer[], %s::boolean[]) AS p (id, ativo)
+    ), travados AS MATERIALIZED (
+        SELECT v.id, v.modelo, v.marca, v.ano, v.placa, v.tipo, v.ativo, p.ativo AS novo
+        FROM veiculos v
+        JOIN pedidos p ON p.id = v.id
+        ORDER BY v.id
+        FOR UPDATE OF v
+    ), atualizados AS (
+        UPDATE veiculos v
+        SET ativo = t.novo
+        FROM travados t
+        WHERE v.id = t.id AND t.ativo IS DISTINCT FROM t.novo
+        RETURNING v.id, v.modelo, v.marca, v.ano, v.placa, v.tipo, v.ativo, TRUE AS alterado
+    )
+    SELECT * FROM atualizados
+    UNION ALL
+    SELECT id, modelo, marca, ano, placa, tipo, ativo, FALSE
+    FROM travados
+    WHERE ativo = novo
+    ORDER BY id;
+"""
+
+
+def atualizar_status_por_filtro(ativo, filtros):
+    """PATCH /veiculos/status por tipo e/ou marca, no mesmo formato de SQL_ATUALIZAR_STATUS_LOTE."""
+    condicoes = []
+    params = []
+    for campo in ('tipo', 'marca'):
+        if filtros[campo]:
+            condicoes.append(f"{campo} = %s")
+            params.append(filtros[campo])
+    sql = f"""
+        WITH travados AS MATERIALIZED (
+            SELECT id, modelo, marca, ano, placa, tipo, ativo, %s::boolean AS novo
+            FROM veiculos
+            WHERE {" AND ".join(condicoes)}
+            ORDER BY id
+            FOR UPDATE
+        ), atualizados AS (
+            UPDATE veiculos v
+            SET ativo = t.novo
+            FROM travados t
+            WHERE v.id = t.id AND t.ativo IS DISTINCT FROM t.novo
+            RETURNING v.id, v.modelo, v.marca, v.ano, v.placa, v.tipo, v.ativo, TRUE AS alterado
+        )
+        SELECT * FROM atualizados
+        UNION ALL
+        SELECT id, modelo, marca, ano, placa, tipo, ativo, FALSE
+        FROM travados
+        WHERE ativo = novo
+        ORDER BY id
+    """
+    return sql, [ativo] + params
+
+
+SQL_VEICULOS_DISPONIVEIS = """
+    SELECT id, modelo, marca, ano, placa, tipo, criado_em
+    FROM veiculos
+    WHERE ativo = TRUE
+    ORDER BY modelo, marca;
+"""
+
+
+# =============================================================================
+# EMPRÉSTIMOS
+# =============================================================================
+
+# CTEs que somam os empréstimos de 'finalizado' aos resumos de uso (uso_diario/uso_mensal) do
+# veículo, do funcionário e da frota, no dia e no mês da data_saida. As parcelas são agregadas
+# antes do upsert (num lote, vários empréstimos caem na mesma linha de resumo) e gravadas
+# sempre na mesma ordem, para que finalizações concorrentes não se travem mutuamente.
+_SOMAR_USO = """parcelas AS (
+        SELECT d.dimensao, d.chave, f.data_saida::date AS dia, count(*) AS emprestimos,
+               sum(f.km_retorno - f.km_saida) AS km,
+               sum(round(extract(epoch FROM f.data_retorno - f.data_saida), 3)) AS segundos
+        FROM finalizado f
+        CROSS JOIN LATERAL (VALUES ('veiculo', f.veiculo_id), ('funcionario', f.funcionario_id),
+                                   ('frota', 0)) d (dimensao, chave)
+        GROUP BY d.dimensao, d.chave, f.data_saida::date
+    ), uso_dia AS (
+        INSERT INTO uso_diario AS u (dimensao, chave, dia, emprestimos, km, segundos)
+        SELECT dimensao, chave, dia, emprestimos, km, segundos
+        FROM parcelas
+        ORDER BY dimensao, chave, dia
+        ON CONFLICT (dimensao, chave, dia) DO UPDATE
+        SET emprestimos = u.emprestimos + EXCLUDED.emprestimos,
+            km = u.km + EXCLUDED.km,
+            segundos = u.segundos + EXCLUDED.segundos
+    ), uso_mes AS (
+        INSERT INTO uso_mensal AS u (dimensao, chave, mes, emprestimos, km, segundos)
+        SELECT dimensao, chave, date_trunc('month', dia)::date, sum(emprestimos), sum(km), sum(segundos)
+        FROM parcelas
+        GROUP BY dimensao, chave, date_trunc('month', dia)
+        ORDER BY dimensao, chave, date_trunc('month', dia)
+        ON CONFLICT (dimensao, chave, mes) DO UPDATE
+        SET emprestimos = u.emprestimos + EXCLUDED.emprestimos,
+            km = u.km + EXCLUDED.km,
+            segundos = u.segundos + EXCLUDED.segundos
+    )"""
+
+# Um único comando: marca o veículo como indisponível somente se ele estiver
+# disponível (a linha fica travada até o fim) e só então insere o empréstimo.
+# Em checkouts concorrentes do mesmo veículo, apenas o primeiro encontra ativo = TRUE.
+# Retorna (id do empréstimo ou NULL, se o veículo existe, id do evento 'emprestimo_registrado').
+SQL_REGISTRAR_EMPRESTIMO = """
+    WITH veiculo AS (
+        UPDATE veiculos
+        SET ativo = FALSE
+        WHERE id = %(veiculo_id)s AND ativo = TRUE
+        RETURNING id
+    ), novo AS (
+        INSERT INTO emprestimos (veiculo_id, funcionario_id, data_saida, km_saida, observacao)
+        SELECT id, %(funcionario_id)s::integer, %(data_saida)s::timestamp,
+               %(km_saida)s::numeric, %(observacao)s::text
+        FROM veiculo
+        RETURNING id
+    )
+    SELECT (SELECT id FROM novo),
+           EXISTS (SELECT 1 FROM veiculos WHERE id = %(veiculo_id)s),
+           (SELECT notificar_evento('emprestimo_registrado', jsonb_build_object(
+                'id', id, 'veiculo_id', %(veiculo_id)s::integer,
+                'funcionario_id', %(funcionario_id)s::integer))
+            FROM novo);
+"""
+
+# Um único comando:
+# - trava a linha do empréstimo (FOR UPDATE), serializando finalizações concorrentes;
+# - só atualiza se ainda estiver aberto e se km_retorno >= km_saida;
+# - concatena a observação de retorno à existente;
+# - devolve o veículo (ativo = TRUE) se a finalização aconteceu;
+# - soma o empréstimo aos resumos de uso (uso_diario/uso_mensal) do veículo, do funcionário
+#   e da frota, no dia e no mês da data_saida;
+# - emite o evento 'emprestimo_finalizado' (evento_id), entregue no commit.
+# A linha 'alvo' volta sempre (se existir), para explicar uma eventual recusa.
+SQL_FINALIZAR_EMPRESTIMO = f"""
+    WITH alvo AS (
+        SELECT id, km_saida, data_retorno
+        FROM emprestimos
+        WHERE id = %(id)s
+        FOR UPDATE
+    ), finalizado AS (
+        UPDATE emprestimos e
+        SET data_retorno = %(data_retorno)s::timestamp,
+            km_retorno = %(km_retorno)s::numeric,
+            observacao = CASE
+                WHEN %(observacao)s::text IS NULL THEN e.observacao
+                WHEN e.observacao IS NULL OR e.observacao = '' THEN 'Retorno: ' || %(observacao)s::text
+                ELSE e.observacao || ' | Retorno: ' || %(observacao)s::text
+            END
+        FROM alvo
+        WHERE e.id = alvo.id
+          AND alvo.data_retorno IS NULL
+          AND %(km_retorno)s::numeric >= alvo.km_saida
+        RETURNING e.id, e.veiculo_id, e.funcionario_id, e.data_saida, e.km_saida,
+                  e.data_retorno, e.km_retorno, e.observacao
+    ), veiculo AS (
+        UPDATE veiculos
+        SET ativo = TRUE
+        WHERE id = (SELECT veiculo_id FROM finalizado)
+    ), {_SOMAR_USO}
+    SELECT alvo.km_saida AS km_saida_atual,
+           alvo.data_retorno AS data_retorno_anterior,
+           (SELECT notificar_evento('emprestimo_finalizado', jsonb_build_object(
+                'id', id, 'veiculo_id', veiculo_id))
+            FROM finalizado) AS evento_id,
+           finalizado.*
+    FROM alvo
+    LEFT JOIN finalizado ON TRUE;
+"""
+
+# POST /emprestimos/lote: vários checkouts num único comando, com as regras de
+# SQL_REGISTRAR_EMPRESTIMO aplicadas a cada item (arrays por campo, via unnest):
+# - um veículo repetido no lote só concorre no primeiro item em que aparece;
+# - itens com funcionário inexistente ficam de fora (em vez de abortar o comando pela FK);
+# - os veículos disponíveis são travados em ordem de id (sem deadlock entre lotes
+#   concorrentes) e só então marcados como indisponíveis e emprestados;
+# - emite um único evento 'emprestimos_registrados' com a quantidade.
+# Retorna uma linha por item, na ordem do lote: item, id do empréstimo (NULL se recusado),
+# veiculo_existe, funcionario_existe, repetido e evento_id.
+SQL_REGISTRAR_EMPRESTIMOS_LOTE = """
+    WITH pedidos AS (
+        SELECT *
+        FROM unnest(%(itens)s::integer[], %(veiculos)s::integer[], %(funcionarios)s::integer[],
+                    %(datas)s::timestamp[], %(kms)s::numeric[], %(observacoes)s::text[])
+             AS p (item, veiculo_id, funcionario_id, data_saida, km_saida, observacao)
+    ), primeiros AS (
+        SELECT DISTINCT ON (veiculo_id) *
+        FROM pedidos
+        ORDER BY veiculo_id, item
+    ), disponiveis AS MATERIALIZED (
+        SELECT v.id
+        FROM veiculos v
+        JOIN primeiros p ON p.veiculo_id = v.id
+        JOIN funcionarios f ON f.id = p.funcionario_id
+        WHERE v.ativo = TRUE
+        ORDER BY v.id
+        FOR UPDATE OF v
+    ), veiculo AS (
+        UPDATE veiculos v
+        SET ativo = FALSE
+        FROM disponiveis d
+        WHERE v.id = d.id
+        RETURNING v.id
+    ), novos AS (
+        INSERT INTO emprestimos (veiculo_id, funcionario_id, data_saida, km_saida, observacao)
+        SELECT p.veiculo_id, p.funcionario_id, p.data_saida, p.km_saida, p.observacao
+        FROM primeiros p
+        JOIN veiculo v ON v.id = p.veiculo_id
+        ORDER BY p.item
+        RETURNING id, veiculo_id
+    )
+    SELECT p.item, n.id,
+           EXISTS (SELECT 1 FROM veiculos WHERE id = p.veiculo_id) AS veiculo_existe,
+           EXISTS (SELECT 1 FROM funcionarios WHERE id = p.funcionario_id) AS funcionario_existe,
+           pr.item IS NULL AS repetido,
+           (SELECT notificar_evento('emprestimos_registrados', jsonb_build_object('quantidade', count(*)))
+            FROM novos HAVING count(*) > 0) AS evento_id
+    FROM pedidos p
+    LEFT JOIN primeiros pr ON pr.item = p.item
+    LEFT JOIN novos n ON n.veiculo_id = pr.veiculo_id
+    ORDER BY p.item;
+"""
+
+# PATCH /emprestimos/finalizar-lote: as regras de SQL_FINALIZAR_EMPRESTIMO aplicadas a cada
+# item num único comando (arrays por campo, via unnest):
+# - um empréstimo repetido no lote só é considerado no primeiro item em que aparece;
+# - trava os empréstimos em ordem de id (FOR UPDATE) e só finaliza os abertos com
+#   km_retorno >= km_saida, concatenando a observação de retorno;
+# - devolve os veículos (travados também em ordem de id) e soma os resumos de uso;
+# - emite um único evento 'emprestimos_finalizados' com a quantidade.
+# Retorna uma linha por item, na ordem do lote, com item, km_saida_atual e
+# data_retorno_anterior (NULL se o empréstimo não existe), repetido, evento_id e as colunas
+# do empréstimo finalizado (NULL se recusado).
+SQL_FINALIZAR_EMPRESTIMOS_LOTE = f"""
+    WITH pedidos AS (
+        SELECT *
+        FROM unnest(%(itens)s::integer[], %(ids)s::integer[], %(datas)s::timestamp[],
+                    %(kms)s::numeric[], %(observacoes)s::text[])
+             AS p (item, id, data_retorno, km_retorno, observacao)
+    ), primeiros AS (
+        SELECT DISTINCT ON (id) *
+        FROM pedidos
+        ORDER BY id, item
+    ), alvo AS MATERIALIZED (
+        SELECT e.id, e.km_saida, e.data_retorno
+        FROM emprestimos e
+        WHERE e.id IN (SELECT id FROM primeiros)
+        ORDER BY e.id
+        FOR UPDATE OF e
+    ), finalizado AS (
+        UPDATE emprestimos e
+        SET data_retorno = p.data_retorno,
+            km_retorno = p.km_retorno,
+            observacao = CASE
+                WHEN p.observacao IS NULL THEN e.observacao
+                WHEN e.observacao IS NULL OR e.observacao = '' THEN 'Retorno: ' || p.observacao
+                ELSE e.observacao || ' | Retorno: ' || p.observacao
+            END
+        FROM primeiros p
+        JOIN alvo ON alvo.id = p.id
+        WHERE e.id = p.id
+          AND alvo.data_retorno IS NULL
+          AND p.km_retorno >= alvo.km_saida
+        RETURNING e.id, e.veiculo_id, e.funcionario_id, e.data_saida, e.km_saida,
+                  e.data_retorno, e.km_retorno, e.observacao
+    ), devolvidos AS MATERIALIZED (
+        SELECT id
+        FROM veiculos
+        WHERE id IN (SELECT veiculo_id FROM finalizado)
+        ORDER BY id
+        FOR UPDATE
+    ), veiculo AS (
+        UPDATE veiculos
+        SET ativo = TRUE
+        WHERE id IN (SELECT id FROM devolvidos)
+    ), {_SOMAR_USO}
+    SELECT p.item,
+           alvo.km_saida AS km_saida_atual,
+           alvo.data_retorno AS data_retorno_anterior,
+           pr.item IS NULL AS repetido,
+           (SELECT notificar_evento('emprestimos_finalizados', jsonb_build_object('quantidade', count(*)))
+            FROM finalizado HAVING count(*) > 0) AS evento_id,
+           f.*
+    FROM pedidos p
+    LEFT JOIN primeiros pr ON pr.item = p.item
+    LEFT JOIN alvo ON alvo.id = p.id
+    LEFT JOIN finalizado f ON f.id = pr.id
+    ORDER BY p.item;
+"""
+
+SQL_EMPRESTIMOS_ATIVOS = """
+    SELECT
+        e.id,
+        e.veiculo_id,
+        v.placa AS veiculo_placa,
+        v.modelo AS veiculo_modelo,
+        v.marca AS veiculo_marca,
+        e.funcionario_id,
+        f.nome AS funcionario_nome,
+        e.data_saida,
+        e.km_saida,
+        e.observacao,
+        e.criado_em
+    FROM emprestimos e
+    JOIN veiculos v ON e.veiculo_id = v.id
+    JOIN funcionarios f ON e.funcionario_id = f.id
+    WHERE e.data_retorno IS NULL
+    ORDER BY e.data_saida DESC;
+"""
+
+
+# Eventos de GET /eventos (migração 0005): chamado na transação da escrita, antes do commit
+SQL_NOTIFICAR_EVENTO = "SELECT notificar_evento(%s, %s::jsonb);"
+
+
+# =============================================================================
+# RELATÓRIOS DE USO
+# =============================================================================
+
+# Reconstrói os resumos a partir do histórico (python migrar.py recalcular-uso).
+# O LOCK trava as tabelas até o commit: finalizações concorrentes esperam e somam o
+# seu empréstimo depois, sobre os resumos já reconstruídos (sem perder nem contar duas vezes).
+# Os meses arquivados (emprestimos_arquivados, migração 0008) não estão mais em emprestimos:
+# os seus resumos ficam como estão.
+SQL_RECALCULAR_USO = """
+    LOCK TABLE uso_diario, uso_mensal IN ACCESS EXCLUSIVE MODE;
+
+    DELETE FROM uso_diario
+    WHERE date_trunc('month', dia)::date NOT IN (SELECT mes FROM emprestimos_arquivados);
+    DELETE FROM uso_mensal
+    WHERE mes NOT IN (SELECT mes FROM emprestimos_arquivados);
+
+    INSERT INTO uso_diario (dimensao, chave, dia, emprestimos, km, segundos)
+    SELECT d.dimensao, d.chave, e.data_saida::date, count(*),
+           sum(e.km_retorno - e.km_saida),
+           sum(round(extract(epoch FROM e.data_retorno - e.data_saida), 3))
+    FROM emprestimos e
+    CROSS JOIN LATERAL (VALUES ('veiculo', e.veiculo_id), ('funcionario', e.funcionario_id),
+                               ('frota', 0)) d (dimensao, chave)
+    WHERE e.data_retorno IS NOT NULL
+      AND date_trunc('month', e.data_saida)::date NOT IN (SELECT mes FROM emprestimos_arquivados)
+    GROUP BY d.dimensao, d.chave, e.data_saida::date;
+
+    INSERT INTO uso_mensal (dimensao, chave, mes, emprestimos, km, segundos)
+    SELECT dimensao, chave, date_trunc('month', dia)::date, sum(emprestimos), sum(km), sum(segundos)
+    FROM uso_diario
+    WHERE date_trunc('month', dia)::date NOT IN (SELECT mes FROM emprestimos_arquivados)
+    GROUP BY dimensao, chave, date_trunc('month', dia);
+"""
+
+# Colunas de cada agrupamento: (tabela, coluna do período, formato do período)
+AGRUPAMENTOS_USO = {
+    "dia": ("uso_diario", "dia", "YYYY-MM-DD"),
+    "mes": ("uso_mensal", "mes", "YYYY-MM"),
+}
+
+RANKINGS_USO = {
+    "veiculo": ("veiculo_id", "JOIN veiculos x ON x.id = u.chave", "x.placa, x.modelo, x.marca"),
+    "funcionario": ("funcionario_id", "JOIN funcionarios x ON x.id = u.chave", "x.nome, x.matricula"),
+}
+
+
+def serie_uso(dimensao, chave, filtros):
+    """
+    Série de uso de uma dimensão ('veiculo', 'funcionario' ou 'frota' com chave 0) por dia ou
+    mês, entre filtros['inicio'] e filtros['fim'] (inclusivos). Retorna (sql, params).
+    """
+    tabela, periodo, formato = AGRUPAMENTOS_USO[filtros["agrupar"]]
+    condicoes = ["dimensao = %s", "chave = %s"]
+    params = [dimensao, chave]
+    if filtros["inicio"] is not None:
+        condicoes.append(f"{periodo} >= %s")
+        params.append(filtros["inicio"])
+    if filtros["fim"] is not None:
+        condicoes.append(f"{periodo} <= %s")
+        params.append(filtros["fim"])
+    sql = f"""
+        SELECT to_char({periodo}, '{formato}') AS periodo, emprestimos, km::float8 AS km,
+               round(segundos / 3600, 2)::float8 AS horas
+        FROM {tabela}
+        WHERE {" AND ".join(condicoes)}
+        ORDER BY {periodo}
+    """
+    return sql, params
+
+
+def ranking_uso(dimensao, mes, limite):
+    """Veículos ou funcionários que mais rodaram (km) no mês. Retorna (sql, params)."""
+    coluna_id, juncao, colunas = RANKINGS_USO[dimensao]
+    sql = f"""
+        SELECT u.chave AS {coluna_id}, {colunas}, u.emprestimos, u.km::float8 AS km,
+               round(u.segundos / 3600, 2)::float8 AS horas
+        FROM uso_mensal u
+        {juncao}
+        WHERE u.dimensao = %s AND u.mes = %s
+        ORDER BY u.km DESC, u.chave
+        LIMIT %s
+    """
+    return sql, [dimensao, mes, limite]
+
+
+# =============================================================================
+# BUSCA (AUTOCOMPLETAR)
+# =============================================================================
+
+# Se os índices de trigramas da migração 0006 existem (pg_trgm instalado no servidor)
+SQL_BUSCA_APROXIMADA = """
+    SELECT to_regclass('idx_veiculos_busca_trgm') IS NOT NULL
+       AND to_regclass('idx_funcionarios_busca_trgm') IS NOT NULL;
+"""
+
+# Por tipo de resultado: tabela, colunas com índice de prefixo (peso na relevância; a primeira
+# é a chave, que ganha +1 quando igual ao termo), título, detalhe e o texto da busca
+# aproximada (idêntico à expressão do índice GiST da migração 0006).
+BUSCAS = {
+    "veiculo": {
+        "tabela": "veiculos",
+        "prefixos": (('lower(placa) COLLATE "C"', 2), ('lower(modelo) COLLATE "C"', 1), ('lower(marca) COLLATE "C"', 1)),
+        "titulo": "placa",
+        "detalhe": "modelo || ' ' || marca",
+        "texto": "(placa || ' ' || modelo || ' ' || marca)",
+    },
+    "funcionario": {
+        "tabela": "funcionarios",
+        "prefixos": (('lower(matricula) COLLATE "C"', 2), ('lower(nome) COLLATE "C"', 1)),
+        "titulo": "nome",
+        "detalhe": "matricula",
+        "texto": "(nome || ' ' || matricula)",
+    },
+}
+
+
+def _prefixo_like(termo):
+    """'ab_c' -> 'ab\\_c%': o termo vale literalmente, só o final é curinga."""
+    return termo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def busca(termo, tipos, limite, aproximada):
+    """
+    GET /busca. Para cada tipo, reúne candidatos:
+    - por prefixo: uma faixa de cada índice btree, com LIMIT (nunca a tabela inteira);
+    - com aproximada=True, os 'limite' vizinhos mais próximos por trigramas (índice GiST,
+      word_similarity acima do limiar do pg_trgm).
+    Relevância: peso do prefixo (2 placa/matrícula, 1 demais), +1 se a chave é igual ao
+    termo, + word_similarity. termo já vem em minúsculas. Retorna (sql, params).
+    """
+    partes = []
+    for tipo in tipos:
+        config = BUSCAS[tipo]
+        tabela, texto = config["tabela"], config["texto"]
+        candidatos = [
+            f"(SELECT id, {peso} FROM {tabela} WHERE {coluna} LIKE %(prefixo)s "
+            f"ORDER BY {coluna}, id LIMIT %(limite)s)"
+            for coluna, peso in config["prefixos"]
+        ]
+        similaridade = "0"
+        if aproximada:
+            candidatos.append(
+                f"(SELECT id, 0 FROM {tabela} WHERE %(termo)s <%% {texto} "
+                f"ORDER BY %(termo)s <<-> {texto} LIMIT %(limite)s)"
+            )
+            similaridade = f"word_similarity(%(termo)s, {texto})"
+        chave = config["prefixos"][0][0]
+        partes.append(f"""
+            SELECT '{tipo}' AS tipo, x.id, {config["titulo"]} AS titulo, {config["detalhe"]} AS detalhe,
+                   round((c.peso + CASE WHEN {chave} = %(termo)s THEN 1 ELSE 0 END
+                          + {similaridade})::numeric, 3)::float8 AS relevancia
+            FROM (
+                SELECT id, max(peso) AS peso
+                FROM ({" UNION ALL ".join(candidatos)}) u (id, peso)
+                GROUP BY id
+            ) c
+            JOIN {tabela} x ON x.id = c.id
+        """)
+    sql = f"""
+        SELECT *
+        FROM ({" UNION ALL ".join(partes)}) r
+        ORDER BY relevancia DESC, length(titulo), titulo, tipo, id
+        LIMIT %(limite)s
+    """
+    return sql, {"termo": termo, "prefixo": _prefixo_like(termo), "limite": limite}
+
+
+# =============================================================================
+# LISTAGENS PAGINADAS
+# =============================================================================
+
+# Colunas que cada listagem pode devolver ({nome: expressão no SELECT}), na ordem da resposta.
+# São também a lista de valores aceitos em ?fields=.
+COLUNAS_USUARIOS = {
+    # ATENÇÃO: 'senha_hash' fica de fora da listagem por segurança.
+    "id": "id", "nome": "nome", "email": "email", "funcionario_id": "funcionario_id",
+    "criado_em": "criado_em",
+}
+COLUNAS_FUNCIONARIOS = {
+    "id": "id", "nome": "nome", "matricula": "matricula", "cargo": "cargo", "criado_em": "criado_em",
+}
+COLUNAS_VEICULOS = {
+    "id": "id", "modelo": "modelo", "marca": "marca", "ano": "ano", "placa": "placa",
+    "tipo": "tipo", "ativo": "ativo", "criado_em": "criado_em",
+}
+COLUNAS_EMPRESTIMOS = {
+    "id": "e.id",
+    "veiculo_id": "e.veiculo_id",
+    "veiculo_placa": "v.placa",
+    "funcionario_id": "e.funcionario_id",
+    "funcionario_nome": "f.nome",
+    "data_saida": "e.data_saida",
+    "km_saida": "e.km_saida",
+    "data_retorno": "e.data_retorno",
+    "km_retorno": "e.km_retorno",
+    "observacao": "e.observacao",
+    "criado_em": "e.criado_em",
+}
+# Junções de listar_emprestimos, pelo alias usado em COLUNAS_EMPRESTIMOS. Só entram quando
+# alguma coluna pedida vem delas; veiculo_id e funcionario_id são NOT NULL com chave
+# estrangeira, então deixar a junção de fora não muda as linhas, só o custo.
+JUNCOES_EMPRESTIMOS = {
+    "v": "JOIN veiculos v ON e.veiculo_id = v.id",
+    "f": "JOIN funcionarios f ON e.funcionario_id = f.id",
+}
+
+
+def _montar(select, condicoes, params, ordem, limite, a_mais):
+    """
+    Junta SELECT, WHERE, ORDER BY e LIMIT. Com a_mais=True busca uma linha além do
+    limite, para fatiar_pagina saber se há próxima página (no streaming, a_mais=False).
+    """
+    sql = select
+    if condicoes:
+        sql += " WHERE " + " AND ".join(condicoes)
+    sql += " ORDER BY " + ordem
+    if limite:
+        sql += " LIMIT %s"
+        params.append(limite + 1 if a_mais else limite)
+    return sql, params
+
+
+def _selecionadas(colunas, filtros, chave, a_mais):
+    """
+    Nomes das colunas do SELECT: as pedidas em ?fields= (filtros["campos"]; None = todas)
+    mais as da chave, que dão o cursor da próxima página e a ordem das linhas em
+    como_json (paginacao.recortar_campos as tira da resposta depois). No streaming
+    (a_mais=False) não há nem uma coisa nem outra.
+    """
+    campos = filtros["campos"]
+    extras = chave if a_mais else ()
+    return [nome for nome in colunas if campos is None or nome in campos or nome in extras]
+
+
+def _lista_select(colunas, nomes):
+    return ", ".join(
+        colunas[nome] if colunas[nome] == nome else f"{colunas[nome]} AS {nome}" for nome in nomes
+    )
+
+
+def campos_json(campos_formato, campos):
+    """Os formatos de um dos CAMPOS_* (abaixo) restritos às colunas pedidas em ?fields=."""
+    if campos is None:
+        return campos_formato
+    return {nome: campos_formato[nome] for nome in campos}
+
+
+def listar_usuarios(filtros, a_mais=True):
+    condicoes = []
+    params = []
+    if filtros["cursor"]:
+        condicoes.append("id > %s")
+        params.append(filtros["cursor"][0])
+    nomes = _selecionadas(COLUNAS_USUARIOS, filtros, ("id",), a_mais)
+    select = f"SELECT {_lista_select(COLUNAS_USUARIOS, nomes)} FROM usuarios"
+    return _montar(select, condicoes, params, "id", filtros["limite"], a_mais)
+
+
+def listar_funcionarios(filtros, a_mais=True):
+    condicoes = []
+    params = []
+    if filtros["cursor"]:
+        condicoes.append("id > %s")
+        params.append(filtros["cursor"][0])
+    nomes = _selecionadas(COLUNAS_FUNCIONARIOS, filtros, ("id",), a_mais)
+    select = f"SELECT {_lista_select(COLUNAS_FUNCIONARIOS, nomes)} FROM funcionarios"
+    return _montar(select, condicoes, params, "id", filtros["limite"], a_mais)
+
+
+def listar_veiculos(filtros, a_mais=True):
+    condicoes = []
+    params = []
+    if filtros["tipo"] is not None:
+        condicoes.append("tipo = %s")
+        params.append(filtros["tipo"])
+    if filtros["marca"] is not None:
+        condicoes.append("marca = %s")
+        params.append(filtros["marca"])
+    if filtros["ativo"] is not None:
+        condicoes.append("ativo = %s")
+        params.append(filtros["ativo"])
+    if filtros["cursor"]:
+        condicoes.append("id > %s")
+        params.append(filtros["cursor"][0])
+    nomes = _selecionadas(COLUNAS_VEICULOS, filtros, ("id",), a_mais)
+    select = f"SELECT {_lista_select(COLUNAS_VEICULOS, nomes)} FROM veiculos"
+    return _montar(select, condicoes, params, "id", filtros["limite"], a_mais)
+
+
+def listar_emprestimos(filtros, a_mais=True):
+    condicoes = []
+    params = []
+    if filtros["veiculo_id"] is not None:
+        condicoes.append("e.veiculo_id = %s")
+        params.append(filtros["veiculo_id"])
+    if filtros["funcionario_id"] is not None:
+        condicoes.append("e.funcionario_id = %s")
+        params.append(filtros["funcionario_id"])
+    if filtros["data_inicio"] is not None:
+        condicoes.append("e.data_saida >= %s")
+        params.append(filtros["data_inicio"])
+    if filtros["data_fim"] is not None:
+        condicoes.append("e.data_saida < %s")
+        params.append(filtros["data_fim"])
+    if filtros["status"] == 'abertos':
+        condicoes.append("e.data_retorno IS NULL")
+    elif filtros["status"] == 'finalizados':
+        condicoes.append("e.data_retorno IS NOT NULL")
+    if filtros["cursor"]:
+        # Keyset: continua exatamente depois do último item da página anterior
+        condicoes.append("(e.data_saida, e.id) < (%s::timestamp, %s)")
+        params.extend(filtros["cursor"])
+
+    nomes = _selecionadas(COLUNAS_EMPRESTIMOS, filtros, ("data_saida", "id"), a_mais)
+    # Filtros, cursor e ordenação usam só colunas de 'e': as junções dependem apenas do SELECT
+    juncoes = [
+        juncao for alias, juncao in JUNCOES_EMPRESTIMOS.items()
+        if any(COLUNAS_EMPRESTIMOS[nome].startswith(alias + ".") for nome in nomes)
+    ]
+    select = f"SELECT {_lista_select(COLUNAS_EMPRESTIMOS, nomes)} FROM emprestimos e"
+    if juncoes:
+        select += " " + " ".join(juncoes)
+    return _montar(select, condicoes, params, "e.data_saida DESC, e.id DESC", filtros["limite"], a_mais)
+
+
+# =============================================================================
+# ARQUIVO DO HISTÓRICO (arquivamento.py, migração 0008)
+# =============================================================================
+
+SQL_MESES_ARQUIVADOS = """
+    SELECT to_char(mes, 'YYYY-MM') AS mes, linhas, bytes, sha256, arquivado_em
+    FROM emprestimos_arquivados
+    ORDER BY mes;
+"""
+
+
+def selecionar_mes_emprestimos(particao):
+    """Todas as colunas de GET /emprestimos de uma partição mensal, na ordem (data_saida, id)."""
+    return (
+        f"SELECT {_lista_select(COLUNAS_EMPRESTIMOS, COLUNAS_EMPRESTIMOS)} FROM {particao} e "
+        + " ".join(JUNCOES_EMPRESTIMOS.values())
+        + " ORDER BY e.data_saida, e.id"
+    )
+
+
+# =============================================================================
+# JSON RENDERIZADO NO BANCO
+# =============================================================================
+
+# Formatos iguais aos do provedor JSON do Flask:
+# - timestamp -> data HTTP ("Mon, 01 Jan 2024 08:00:00 GMT"; to_char sem TM não depende de locale)
+# - numeric   -> string ("100.00"), como str(Decimal)
+# Colunas sem formato (inteiros, booleanos, texto) saem como o próprio row_to_json as escreve.
+DATA_HTTP = "to_char({}, 'Dy, DD Mon YYYY HH24:MI:SS \"GMT\"')"
+DECIMAL = "({})::text"
+
+CAMPOS_USUARIOS = {
+    "id": None, "nome": None, "email": None, "funcionario_id": None, "criado_em": DATA_HTTP,
+}
+CAMPOS_FUNCIONARIOS = {
+    "id": None, "nome": None, "matricula": None, "cargo": None, "criado_em": DATA_HTTP,
+}
+CAMPOS_VEICULOS = {
+    "id": None, "modelo": None, "marca": None, "ano": None, "placa": None, "tipo": None,
+    "ativo": None, "criado_em": DATA_HTTP,
+}
+CAMPOS_VEICULOS_DISPONIVEIS = {
+    "id": None, "modelo": None, "marca": None, "ano": None, "placa": None, "tipo": None,
+    "criado_em": DATA_HTTP,
+}
+CAMPOS_EMPRESTIMOS = {
+    "id": None, "veiculo_id": None, "veiculo_placa": None, "funcionario_id": None,
+    "funcionario_nome": None, "data_saida": DATA_HTTP, "km_saida": DECIMAL,
+    "data_retorno": DATA_HTTP, "km_retorno": DECIMAL, "observacao": None, "criado_em": DATA_HTTP,
+}
+CAMPOS_EMPRESTIMOS_ATIVOS = {
+    "id": None, "veiculo_id": None, "veiculo_placa": None, "veiculo_modelo": None,
+    "veiculo_marca": None, "funcionario_id": None, "funcionario_nome": None,
+    "data_saida": DATA_HTTP, "km_saida": DECIMAL, "observacao": None, "criado_em": DATA_HTTP,
+}
+
+
+def como_json(sql, params, campos, limite=None, chave=(), ordem=None):
+    """
+    Envolve uma listagem para que o PostgreSQL devolva o array JSON já pronto, numa única
+    linha: (texto do array, linhas lidas, *valores da chave do último item da página).
+
+    - campos: {coluna: formato} (um dos CAMPOS_*); as chaves saem em ordem alfabética,
+      como no jsonify (sort_keys), e sem espaços, como no modo compacto.
+    - limite: a listagem busca limite+1 linhas; só as 'limite' primeiras entram no array
+      e 'linhas > limite' indica que há próxima página.
+    - chave: colunas usadas para montar o cursor da próxima página (ex.: ('id',)).
+    - ordem: o ORDER BY da listagem sobre as colunas que ela devolve (ex.:
+      ('data_saida DESC', 'id DESC')); padrão: a chave, crescente. Numera as linhas: a
+      ordem da subconsulta não é garantida fora dela.
+    """
+    colunas = ", ".join(
+        f"{(campos[nome] or '{}').format('b.' + nome)} AS {nome}" for nome in sorted(campos)
+    )
+    filtro = ""
+    params_externos = []
+    if limite:
+        filtro = " FILTER (WHERE p.pos <= %s)"
+        params_externos.append(limite)
+    agregados = [
+        f"'[' || coalesce(string_agg(p.json, ',' ORDER BY p.pos){filtro}, '') || ']'",
+        "count(*)",
+    ]
+    if limite:
+        for nome in chave:
+            agregados.append(f"max(p.{nome}) FILTER (WHERE p.pos = %s)")
+            params_externos.append(limite)
+
+    chaves = "".join(f", b.{nome}" for nome in chave)
+    numeracao = ", ".join(f"b.{termo}" for termo in (ordem or chave))
+    sql_json = f"""
+        SELECT {', '.join(agregados)}
+        FROM (
+            SELECT row_to_json(r)::text AS json, row_number() OVER (ORDER BY {numeracao}) AS pos{chaves}
+            FROM ({sql.strip().rstrip(';')}) b,
+                 LATERAL (SELECT {colunas}) r
+        ) p
+    """
+    return sql_json, params_externos + list(params or [])
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Retirada e devolução de vários empréstimos numa requisição (POST /emprestimos/lote e
+PATCH /emprestimos/finalizar-lote), compartilhado por app.py e app_async.py.
+
+Os itens aceitos por validacao.validar_lote_emprestimos vão ao banco num único comando
+(consultas.SQL_REGISTRAR_EMPRESTIMOS_LOTE / SQL_FINALIZAR_EMPRESTIMOS_LOTE), com um array
+por campo. O comando devolve uma linha por item, que aqui vira o resultado do item: o
+empréstimo gravado ou o motivo da recusa, com as mesmas mensagens das rotas unitárias.
+
+Modos:
+- 'atomico' (padrão): se algum item for recusado (na validação ou no banco), a transação
+  é desfeita e nada é gravado;
+- 'parcial': os itens aceitos são gravados e os recusados voltam com o motivo.
+"""
+
+NAO_GRAVADO = "Não gravado: outro item do lote foi recusado (modo atomico)"
+
+
+def _arrays(itens, campos):
+    """{nome do array: [valor do campo em cada item]}, mais o array 'itens' com os números."""
+    arrays = {"itens": [numero for numero, _ in itens]}
+    for nome, campo in campos.items():
+        arrays[nome] = [params[campo] for _, params in itens]
+    return arrays
+
+
+def parametros_registro(itens):
+    return _arrays(itens, {
+        "veiculos": "veiculo_id",
+        "funcionarios": "funcionario_id",
+        "datas": "data_saida",
+        "kms": "km_saida",
+        "observacoes": "observacao",
+    })
+
+
+def parametros_finalizacao(itens):
+    return _arrays(itens, {
+        "ids": "id",
+        "datas": "data_retorno",
+        "kms": "km_retorno",
+        "observacoes": "observacao",
+    })
+
+
+def resultados_registro(itens, linhas):
+    """Resultado de cada item a partir das linhas de SQL_REGISTRAR_EMPRESTIMOS_LOTE."""
+    params = dict(itens)
+    resultados = []
+    for linha in linhas:
+        item = params[linha['item']]
+        veiculo_id = item['veiculo_id']
+        resultado = {"item": linha['item']}
+        if linha['id'] is not None:
+            resultado.update(id=linha['id'], veiculo_id=veiculo_id, funcionario_id=item['funcionario_id'])
+        elif linha['repetido']:
+            resultado["erro"] = f"O veículo {veiculo_id} aparece mais de uma vez no lote"
+        elif not linha['veiculo_existe'] or not linha['funcionario_existe']:
+            resultado["erro"] = "ID de veículo ou funcionário inválido."
+        else:
+            resultado["erro"] = f"O veículo {veiculo_id} não está disponível para empréstimo"
+        resultados.append(resultado)
+    return resultados
+
+
+def resultados_finalizacao(itens, linhas):
+    """Resultado de cada item a partir das linhas de SQL_FINALIZAR_EMPRESTIMOS_LOTE."""
+    params = dict(itens)
+    resultados = []
+    for linha in linhas:
+        numero = linha.pop('item')
+        item = params[numero]
+        km_saida = linha.pop('km_saida_atual')
+        data_retorno_anterior = linha.pop('data_retorno_anterior')
+        repetido = linha.pop('repetido')
+        linha.pop('evento_id')
+        resultado = {"item": numero}
+        if repetido:
+            resultado["erro"] = f"O empréstimo {item['id']} aparece mais de uma vez no lote"
+        elif km_saida is None:
+            resultado["erro"] = f"Empréstimo com ID {item['id']} não encontrado"
+        elif data_retorno_anterior is not None:
+            resultado.update(erro="Este empréstimo já foi finalizado",
+                             data_retorno_anterior=str(data_retorno_anterior))
+        elif linha['id'] is None:
+            resultado.update(erro="A quilometragem de retorno não pode ser menor que a quilometragem de saída",
+                             km_saida=str(km_saida), km_retorno_informado=str(item['km_retorno']))
+        else:
+            resultado.update(emprestimo=linha,
+                             distancia_percorrida_km=round(float(item['km_retorno']) - float(km_saida), 2))
+        resultados.append(resultado)
+    return resultados
+
+
+def montar_resposta(modo, total, erros, resultados, acao, status_gravado):
+    """
+    Junta os itens recusados na validação (erros) aos resultados do banco, na ordem do lote,
+    e decide se a transação é confirmada. Retorna (corpo, status HTTP, gravar).
+    """
+    aceitos = [resultado for resultado in resultados if "erro" not in resultado]
+    gravar = bool(aceitos) and (modo == 'parcial' or len(aceitos) == total)
+
+    por_item = {resultado["item"]: resultado for resultado in erros + resultados}
+    if not gravar:
+        for resultado in aceitos:
+            por_item[resultado["item"]] = {"item": resultado["item"], "erro": NAO_GRAVADO}
+    gravados = len(aceitos) if gravar else 0
+
+    corpo = {
+        "mensagem": f"{gravados} de {total} empréstimos {acao}",
+        "modo": modo,
+        "total": total,
+        acao: gravados,
+        "resultados": [por_item.get(numero, {"item": numero, "erro": NAO_GRAVADO})
+                       for numero in range(1, total + 1)]
+    }
+    if gravar:
+        status = status_gravado
+    else:
+        status = 400 if erros else 409
+    return corpo, status, gravar
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Distribuição dos eventos do banco (LISTEN/NOTIFY) para os clientes de GET /eventos (SSE).
+
+Cada processo da API mantém uma única conexão em LISTEN frota_eventos, numa thread, e guarda
+os últimos 'historico' eventos em memória. Os clientes conectados esperam numa Condition e
+recebem cada evento assim que ele chega, sem consultar o banco.
+
+Retomada: o navegador (EventSource) reenvia o id do último evento recebido no cabeçalho
+Last-Event-ID ao reconectar. O PostgreSQL entrega as notificações a todas as sessões na
+ordem dos commits, então o histórico é o mesmo em todos os processos e o cliente recebe,
+em ordem, tudo o que veio depois daquele id. Se o id já saiu do histórico (ou a escuta
+caiu e pode ter perdido eventos), o cliente recebe um evento 'reset' e deve recarregar
+as listagens.
+"""
+import json
+import selectors
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+CANAL = "frota_eventos"
+
+
+def formatar_sse(tipo, dados, evento_id=None):
+    """Um evento no formato text/event-stream."""
+    linhas = []
+    if evento_id is not None:
+        linhas.append(f"id: {evento_id}")
+    linhas.append(f"event: {tipo}")
+    linhas.append(f"data: {json.dumps(dados, ensure_ascii=False, separators=(',', ':'))}")
+    return "\n".join(linhas) + "\n\n"
+
+
+class CentralEventos:
+    """
+    - historico: quantos eventos ficam em memória para a retomada por Last-Event-ID.
+    - heartbeat: segundos sem eventos até enviar um comentário (mantém proxies e o
+      navegador com a conexão aberta e detecta clientes que foram embora).
+    - reconexao: segundos entre tentativas quando a conexão de escuta cai.
+    """
+
+    def __init__(self, db_config, historico=1000, heartbeat=15.0, reconexao=2.0):
+        self.db_config = db_config
+        self.heartbeat = heartbeat
+        self.reconexao = reconexao
+        self._cond = threading.Condition(threading.Lock())
+        # (posição local, id do evento ou None, texto SSE); a posição cresce 1 por entrada
+        self._eventos = deque(maxlen=historico)
+        self._posicao = 0
+        self._thread = None
+        self._clientes = 0
+
+    def iniciar(self):
+        """Sobe a thread de escuta na primeira assinatura (idempotente)."""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._escutar, name='eventos-listen', daemon=True)
+            self._thread.start()
+
+    # -------------------------------------------------------------------------
+    # Escuta (LISTEN)
+    # -------------------------------------------------------------------------
+
+    def _escutar(self):
+        primeira = True
+        while True:
+            conn = None
+            try:
+                # Cursor comum: a conexão de escuta não entra no rastreio de consultas
+                conn = psycopg2.connect(**dict(self.db_config, cursor_factory=extensions.cursor))
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CANAL};")
+                if not primeira:
+                    # Eventos emitidos enquanto a escuta estava fora se perderam
+                    self._publicar(None, formatar_sse("reset", {"motivo": "escuta reiniciada"}))
+                primeira = False
+
+                # selectors (epoll), e não select.select: com milhares de clientes no mesmo
+                # processo (servidor_gevent.py) o descritor passa do limite de 1024 do select()
+                with selectors.DefaultSelector() as seletor:
+                    seletor.register(conn, selectors.EVENT_READ)
+                    while True:
+                        if not seletor.select(30.0):
+                            continue
+                        conn.poll()
+                        while conn.notifies:
+                            self._receber(conn.notifies.pop(0).payload)
+
+            except psycopg2.Error as e:
+                print(f"Eventos: conexão de escuta perdida: {e}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            time.sleep(self.reconexao)
+
+    def _receber(self, payload):
+        try:
+            evento = json.loads(payload)
+            evento_id = int(evento["id"])
+            texto = formatar_sse(evento["tipo"], evento["dados"], evento_id)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Eventos: notificação inválida ignorada ({e}): {payload[:200]}")
+            return
+        self._publicar(evento_id, texto)
+
+    def _publicar(self, evento_id, texto):
+        with self._cond:
+            self._posicao += 1
+            self._eventos.append((self._posicao, evento_id, texto))
+            self._cond.notify_all()
+
+    # -------------------------------------------------------------------------
+    # Assinantes
+    # -------------------------------------------------------------------------
+
+    def _posicao_inicial(self, ultimo_id):
+        """(posição a partir da qual enviar, se precisa de 'reset'). Chamado com o lock."""
+        if ultimo_id is None:
+            return self._posicao, False
+        for posicao, evento_id, _ in self._eventos:
+            if evento_id == ultimo_id:
+                return posicao, False
+        return self._posicao, True
+
+    def _aguardar(self, posicao):
+        """Entradas depois de 'posicao' (espera até heartbeat segundos) e se o cliente ficou para trás."""
+        with self._cond:
+            if self._posicao == posicao:
+                self._cond.wait(self.heartbeat)
+            if self._eventos and self._eventos[0][0] > posicao + 1:
+                return [], True
+            return [entrada for entrada in self._eventos if entrada[0] > posicao], False
+
+    def fluxo(self, ultimo_id=None):
+        """Gerador do corpo text/event-stream de um cliente."""
+        with self._cond:
+            posicao, reset = self._posicao_inicial(ultimo_id)
+            self._clientes += 1
+        try:
+            # Intervalo de reconexão sugerido ao EventSource (ms)
+            yield f"retry: {int(self.reconexao * 1000)}\n\n"
+            if reset:
+                yield formatar_sse("reset", {"motivo": "eventos anteriores indisponíveis"})
+            while True:
+                entradas, atrasado = self._aguardar(posicao)
+                if atrasado:
+                    with self._cond:
+                        posicao = self._posicao
+                    yield formatar_sse("reset", {"motivo": "cliente atrasado"})
+                    continue
+                if not entradas:
+                    yield ": keepalive\n\n"
+                    continue
+                for posicao, _, texto in entradas:
+                    yield texto
+        finally:
+            with self._cond:
+                self._clientes -= 1
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                "clientes": self._clientes,
+                "eventos_em_memoria": len(self._eventos),
+                "ultimo_id": next((e[1] for e in reversed(self._eventos) if e[1] is not None), None),
+                "escutando": self._thread is not None and self._thread.is_alive(),
+            }
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Cabeçalho Idempotency-Key nas rotas de escrita do app.py.
+
+O cliente que repete uma escrita (ex.: depois de um timeout) manda a mesma chave. A primeira
+requisição com a chave executa normalmente e a resposta fica guardada; as repetições recebem
+essa resposta sem executar a rota nem ir ao banco. Uma repetição que chega enquanto a original
+ainda executa espera por ela, em vez de executar de novo.
+
+- A chave vale por método e caminho, e é amarrada ao corpo e ao cabeçalho Authorization (a
+  impressão): a mesma chave com outra requisição é um conflito (422).
+- Respostas 5xx não são guardadas: a chave é liberada e a próxima tentativa executa de novo.
+- Guarda em memória do processo, por ttl segundos e até max_itens respostas (LRU). Com vários
+  workers, as repetições só são reconhecidas se caírem no mesmo processo.
+
+As regras (quais requisições usam a chave, mensagens, cabeçalhos guardados) ficam aqui e valem
+para o app.py e o app_async.py; cada um só traduz os resultados para o seu framework.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Resultados de RegistroIdempotencia.iniciar()
+EXECUTAR = "executar"
+REPETIR = "repetir"
+CONFLITO = "conflito"
+EM_ANDAMENTO = "em_andamento"
+
+TAMANHO_MAXIMO_CHAVE = 255
+
+METODOS_ESCRITA = ('POST', 'PUT', 'PATCH', 'DELETE')
+# Rotas de escrita que ignoram o Idempotency-Key: autenticação não altera dados e a resposta
+# traz tokens
+ROTAS_SEM_IDEMPOTENCIA = {'login_usuario', 'renovar_tokens'}
+
+ERRO_CONFLITO = "Idempotency-Key já usada com outra requisição"
+ERRO_EM_ANDAMENTO = "A requisição com esta Idempotency-Key ainda está em andamento"
+# Marca as respostas repetidas (e exposto no CORS)
+CABECALHO_REPETIDA = 'Idempotent-Replayed'
+# Não voltam na repetição: o tamanho é recalculado e o cookie é do cliente original
+CABECALHOS_NAO_GUARDADOS = ('Content-Length', 'Set-Cookie')
+
+
+class ChaveInvalida(Exception):
+    """Idempotency-Key vazia ou longa demais; vira uma resposta 400."""
+
+
+def chave_requisicao(metodo, endpoint, caminho, valor):
+    """
+    Chave interna da requisição, ou None se ela não usa o Idempotency-Key (sem o cabeçalho,
+    método de leitura, rota inexistente ou em ROTAS_SEM_IDEMPOTENCIA). Lança ChaveInvalida.
+    """
+    if (valor is None or metodo not in METODOS_ESCRITA
+            or endpoint is None or endpoint in ROTAS_SEM_IDEMPOTENCIA):
+        return None
+    return RegistroIdempotencia.chave(metodo, caminho, valor)
+
+
+def cabecalhos_guardados(cabecalhos):
+    """[(nome, valor)] da resposta original que voltam nas repetições."""
+    return [(nome, valor) for nome, valor in cabecalhos if nome not in CABECALHOS_NAO_GUARDADOS]
+
+
+def impressao_requisicao(corpo, autorizacao):
+    """Resumo do corpo e do Authorization, para recusar a mesma chave numa requisição diferente."""
+    resumo = hashlib.sha256(corpo)
+    resumo.update(b'\0' + (autorizacao or '').encode('utf-8'))
+    return resumo.hexdigest()
+
+
+class _Entrada:
+    __slots__ = ("impressao", "concluida", "resposta", "expira_em")
+
+    def __init__(self, impressao):
+        self.impressao = impressao
+        self.concluida = threading.Event()
+        # (status, cabeçalhos, corpo) quando a original termina; None se ela falhou
+        self.resposta = None
+        self.expira_em = None
+
+
+class RegistroIdempotencia:
+    """
+    - ttl: segundos que uma resposta fica disponível para repetições.
+    - max_itens: respostas guardadas; acima disso as menos usadas são descartadas.
+    - espera: segundos que uma repetição espera a original em andamento (depois, 409).
+    """
+
+    def __init__(self, ttl=86400, max_itens=10000, espera=30.0):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self.espera = espera
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"executadas": 0, "repetidas": 0, "esperas": 0, "conflitos": 0, "descartadas": 0}
+
+    @staticmethod
+    def chave(metodo, caminho, valor):
+        """Chave interna de um Idempotency-Key; lança ChaveInvalida."""
+        valor = (valor or '').strip()
+        if not valor or len(valor) > TAMANHO_MAXIMO_CHAVE:
+            raise ChaveInvalida(f"Idempotency-Key deve ter de 1 a {TAMANHO_MAXIMO_CHAVE} caracteres")
+        return f"{metodo} {caminho} {valor}"
+
+    def iniciar(self, chave, impressao, esperar=True):
+        """
+        Retorna (resultado, resposta):
+        - (EXECUTAR, None): a requisição é a original; chame concluir() ou abandonar() no fim;
+        - (REPETIR, (status, cabeçalhos, corpo)): devolva a resposta guardada;
+        - (CONFLITO, None): a chave já foi usada com outra requisição;
+        - (EM_ANDAMENTO, None): a original não terminou dentro de 'espera' segundos.
+        Com esperar=False, EM_ANDAMENTO volta na hora, sem bloquear: o app_async.py só espera
+        (chamando de novo, numa thread à parte) quando a original ainda está executando.
+        """
+        limite = time.monotonic() + self.espera
+        esperou = False
+        while True:
+            with self._lock:
+                entrada = self._itens.get(chave)
+                if entrada is not None and entrada.expira_em is not None and entrada.expira_em <= time.monotonic():
+                    del self._itens[chave]
+                    entrada = None
+                if entrada is None:
+                    self._itens[chave] = _Entrada(impressao)
+                    self._descartar_excesso()
+                    self._stats["executadas"] += 1
+                    return EXECUTAR, None
+                if entrada.impressao != impressao:
+                    self._stats["conflitos"] += 1
+                    return CONFLITO, None
+                if entrada.resposta is not None:
+                    self._itens.move_to_end(chave)
+                    self._stats["repetidas"] += 1
+                    return REPETIR, entrada.resposta
+                if not esperar:
+                    return EM_ANDAMENTO, None
+                if not esperou:
+                    self._stats["esperas"] += 1
+                    esperou = True
+
+            # A original está executando: espera ela terminar. Se falhar (5xx), a entrada some
+            # e a volta do laço faz desta requisição a nova original.
+            restante = limite - time.monotonic()
+            if restante <= 0 or not entrada.concluida.wait(restante):
+                return EM_ANDAMENTO, None
+            if entrada.resposta is not None:
+                with self._lock:
+                    self._stats["repetidas"] += 1
+                return REPETIR, entrada.resposta
+
+    def concluir(self, chave, status, cabecalhos, corpo):
+        """Guarda a resposta da original (5xx libera a chave) e acorda quem espera."""
+        if status >= 500:
+            self.abandonar(chave)
+            return
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is None or entrada.resposta is not None:
+                return
+            entrada.resposta = (status, cabecalhos, corpo)
+            entrada.expira_em = time.monotonic() + self.ttl
+            entrada.concluida.set()
+
+    def abandonar(self, chave):
+        """A original falhou: libera a chave para uma nova tentativa."""
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is None or entrada.resposta is not None:
+                return
+            del self._itens[chave]
+        entrada.concluida.set()
+
+    def _descartar_excesso(self):
+        # Só descarta respostas já guardadas: as em andamento têm quem espere por elas
+        excesso = len(self._itens) - self.max_itens
+        if excesso <= 0:
+            return
+        descartar = []
+        for chave, entrada in self._itens.items():
+            if len(descartar) == excesso:
+                break
+            if entrada.resposta is not None:
+                descartar.append(chave)
+        for chave in descartar:
+            del self._itens[chave]
+        self._stats["descartadas"] += len(descartar)
+
+    def estatisticas(self):
+        with self._lock:
+            return dict(self._stats, guardadas=len(self._itens))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Montagem das respostas cujo JSON foi gerado pelo próprio PostgreSQL (consultas.como_json).
+
+O texto chega do banco como bytes (sem decodificação para str) e vai direto para a resposta.
+O único ajuste é o ensure_ascii do jsonify: o banco escreve acentos em UTF-8, o Flask
+escreve \\uXXXX. Corpos só com ASCII (o caso comum) passam sem cópia.
+"""
+import codecs
+
+
+def _escapar_unicode(erro):
+    """Handler de encode: troca cada caractere não ASCII por \\uXXXX (pares substitutos acima de U+FFFF)."""
+    partes = []
+    for caractere in erro.object[erro.start:erro.end]:
+        codigo = ord(caractere)
+        if codigo > 0xFFFF:
+            codigo -= 0x10000
+            partes.append('\\u%04x\\u%04x' % (0xD800 | (codigo >> 10), 0xDC00 | (codigo & 0x3FF)))
+        else:
+            partes.append('\\u%04x' % codigo)
+    return ''.join(partes), erro.end
+
+
+codecs.register_error('json_ascii', _escapar_unicode)
+
+
+def para_ascii(corpo):
+    """Aplica o ensure_ascii do json.dumps a um JSON em UTF-8 (bytes)."""
+    if corpo.isascii():
+        return corpo
+    return corpo.decode('utf-8').encode('ascii', 'json_ascii')
+
+
+def montar_corpo(array, total=None, envelope=None):
+    """
+    Corpo final, byte a byte igual ao do jsonify no modo compacto (com a quebra de linha final).
+    Sem envelope: o próprio array. Com envelope: {"<envelope>": [...], "total": n}, com as
+    chaves na ordem alfabética do sort_keys.
+    """
+    array = para_ascii(bytes(array))
+    if envelope is None:
+        return array + b'\n'
+    partes = [(envelope.encode('ascii'), array), (b'total', str(total).encode('ascii'))]
+    partes.sort()
+    return b'{' + b','.join(b'"' + nome + b'":' + valor for nome, valor in partes) + b'}\n'
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+# Linhas enviadas por INSERT (execute_values)
+LOTE_TAMANHO = 1000
+# Máximo de registros aceitos numa única requisição de importação
+LOTE_MAXIMO = 100000
+
+
+class LoteInvalido(ValueError):
+    """Corpo da importação em lote ilegível ou vazio; vira uma resposta 400."""
+
+
+def ler_registros(request):
+    """
+    Lê os registros de uma importação em lote. Aceita:
+    - um array JSON de objetos;
+    - um arquivo CSV enviado como multipart (campo 'arquivo');
+    - um corpo CSV com Content-Type text/csv.
+    No CSV a primeira linha traz os nomes dos campos. Retorna uma lista de dicionários.
+    """
+    if request.files:
+        arquivo = request.files.get('arquivo') or next(iter(request.files.values()))
+        registros = _ler_csv(arquivo.read())
+    elif request.mimetype in ('text/csv', 'application/csv'):
+        registros = _ler_csv(request.get_data())
+    else:
+        registros = request.get_json(silent=True)
+        if not isinstance(registros, list):
+            raise LoteInvalido("Envie um array JSON de registros ou um arquivo CSV")
+
+    if not registros:
+        raise LoteInvalido("Nenhum registro enviado")
+    if len(registros) > LOTE_MAXIMO:
+        raise LoteInvalido(f"Máximo de {LOTE_MAXIMO} registros por importação")
+    return registros
+
+
+def _ler_csv(conteudo):
+    try:
+        texto = conteudo.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise LoteInvalido("O arquivo CSV deve estar em UTF-8")
+    leitor = csv.DictReader(io.StringIO(texto))
+    if leitor.fieldnames:
+        leitor.fieldnames = [campo.strip() for campo in leitor.fieldnames]
+    return [
+        {campo: (valor.strip() if isinstance(valor, str) else valor) for campo, valor in linha.items()}
+        for linha in leitor
+    ]
+
+
+def inserir_em_lote(conn, sql, linhas, indice_chave, mensagens, mensagem_padrao):
+    """
+    Insere as linhas em blocos de LOTE_TAMANHO com execute_values, sem abortar o lote inteiro
+    por causa de uma linha ruim.
+
+    - sql: INSERT ... VALUES %s ON CONFLICT DO NOTHING RETURNING id, <coluna chave>
+    - linhas: lista de (numero_da_linha, tupla_de_valores)
+    - indice_chave: posição, na tupla, da coluna única usada para casar o RETURNING com a linha
+    - mensagens: {classe de erro psycopg2: mensagem}; UniqueViolation também é usada
+      para as linhas ignoradas pelo ON CONFLICT e para chaves repetidas dentro do próprio lote
+
+    Cada bloco roda num SAVEPOINT; se ele falhar (ex.: CheckViolation), o bloco é refeito
+    linha a linha para isolar as linhas com erro. Não faz commit.
+    Retorna (criados, erros): [(numero_da_linha, id)] e [{"linha": n, "erro": msg}].
+    """
+    mensagem_duplicada = mensagens.get(psycopg2.errors.UniqueViolation, mensagem_padrao)
+    criados = []
+    erros = []
+
+    # Chaves repetidas dentro do lote: só a primeira ocorrência é inserida
+    vistas = set()
+    unicas = []
+    for numero, valores in linhas:
+        if valores[indice_chave] in vistas:
+            erros.append({"linha": numero, "erro": mensagem_duplicada})
+        else:
+            vistas.add(valores[indice_chave])
+            unicas.append((numero, valores))
+
+    with conn.cursor() as cur:
+        for inicio in range(0, len(unicas), LOTE_TAMANHO):
+            bloco = unicas[inicio:inicio + LOTE_TAMANHO]
+            cur.execute("SAVEPOINT lote;")
+            try:
+                retorno = execute_values(
+                    cur, sql, [valores for _, valores in bloco], page_size=len(bloco), fetch=True
+                )
+                cur.execute("RELEASE SAVEPOINT lote;")
+            except psycopg2.Error:
+                cur.execute("ROLLBACK TO SAVEPOINT lote;")
+                _inserir_linha_a_linha(cur, sql, bloco, indice_chave, mensagens,
+                                       mensagem_padrao, criados, erros)
+                continue
+
+            ids = {chave: novo_id for novo_id, chave in retorno}
+            for numero, valores in bloco:
+                novo_id = ids.get(valores[indice_chave])
+                if novo_id is None:
+                    erros.append({"linha": numero, "erro": mensagem_duplicada})
+                else:
+                    criados.append((numero, novo_id))
+
+    erros.sort(key=lambda erro: erro["linha"])
+    return criados, erros
+
+
+def _inserir_linha_a_linha(cur, sql, bloco, indice_chave, mensagens, mensagem_padrao, criados, erros):
+    mensagem_duplicada = mensagens.get(psycopg2.errors.UniqueViolation, mensagem_padrao)
+    for numero, valores in bloco:
+        cur.execute("SAVEPOINT linha;")
+        try:
+            retorno = execute_values(cur, sql, [valores], fetch=True)
+            cur.execute("RELEASE SAVEPOINT linha;")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT linha;")
+            mensagem = next(
+                (msg for classe, msg in mensagens.items() if isinstance(e, classe)), None
+            )
+            if mensagem is None:
+                print(f"Erro no banco de dados na linha {numero} do lote: {e}")
+                mensagem = mensagem_padrao
+            erros.append({"linha": numero, "erro": mensagem})
+            continue
+
+        if retorno:
+            criados.append((numero, retorno[0][0]))
+        else:
+            erros.append({"linha": numero, "erro": mensagem_duplicada})
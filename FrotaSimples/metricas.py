@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas da aplicação no formato texto do Prometheus (GET /metrics).
+
+- Por rota (o padrão da rota, ex.: /veiculos/<int:veiculo_id>/status) e método: total de
+  requisições por status e histograma da duração.
+- Por rota e fase: tempo gasto abrindo conexões com o banco, esperando uma conexão livre
+  do pool, executando SQL (medido por rastreio.CursorRastreado), calculando hashes de
+  senha e serializando JSON.
+
+As fases são somadas por requisição numa variável local da thread (cada requisição roda
+inteira numa thread do servidor WSGI) e viram uma observação por fase no fim da requisição.
+Fora de uma requisição (aquecimento do pool, restante de um streaming) nada é registrado.
+Os valores ficam na memória do processo: com vários workers, cada um expõe os seus.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from flask.json.provider import DefaultJSONProvider
+
+# Limites (em segundos) dos buckets dos histogramas
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FASES = ("conexao", "espera_conexao", "execucao", "senha", "serializacao")
+
+_local = threading.local()
+
+
+# =============================================================================
+# FASES DA REQUISIÇÃO ATUAL
+# =============================================================================
+
+def iniciar_requisicao():
+    _local.inicio = time.perf_counter()
+    _local.fases = {}
+    _local.comandos = 0
+
+
+def registrar_fase(fase, segundos):
+    """Soma 'segundos' à fase na requisição atual (sem requisição ativa, não faz nada)."""
+    fases = getattr(_local, 'fases', None)
+    if fases is not None:
+        fases[fase] = fases.get(fase, 0.0) + segundos
+
+
+def registrar_comando(segundos):
+    """Um comando SQL executado na requisição atual (fase 'execucao')."""
+    fases = getattr(_local, 'fases', None)
+    if fases is not None:
+        fases["execucao"] = fases.get("execucao", 0.0) + segundos
+        _local.comandos += 1
+
+
+def encerrar_requisicao():
+    """
+    Retorna (duração em segundos, {fase: segundos}, comandos SQL) da requisição atual
+    e para de acumular.
+    """
+    fases = getattr(_local, 'fases', None)
+    if fases is None:
+        return None, {}, 0
+    _local.fases = None
+    return time.perf_counter() - _local.inicio, fases, _local.comandos
+
+
+class JSONMedido(DefaultJSONProvider):
+    """Provedor JSON do Flask que registra o tempo de serialização (jsonify, NDJSON)."""
+
+    def dumps(self, obj, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            registrar_fase("serializacao", time.perf_counter() - inicio)
+
+
+# =============================================================================
+# REGISTRO E EXPORTAÇÃO
+# =============================================================================
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, extra=""):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class Histograma:
+    """Contagens por bucket (não cumulativas), soma e total de uma série."""
+
+    __slots__ = ("contagens", "soma", "total")
+
+    def __init__(self):
+        self.contagens = [0] * (len(BUCKETS) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect_left(BUCKETS, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class RegistroMetricas:
+    """Contadores e histogramas thread-safe, indexados pelos valores dos rótulos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requisicoes = {}    # (rota, metodo, status) -> contagem
+        self._duracao = {}        # (rota, metodo) -> Histograma
+        self._fases = {}          # (rota, fase) -> Histograma
+
+    def observar_requisicao(self, rota, metodo, status, duracao, fases):
+        with self._lock:
+            chave = (rota, metodo, status)
+            self._requisicoes[chave] = self._requisicoes.get(chave, 0) + 1
+
+            histograma = self._duracao.get((rota, metodo))
+            if histograma is None:
+                histograma = self._duracao[(rota, metodo)] = Histograma()
+            histograma.observar(duracao)
+
+            for fase, segundos in fases.items():
+                histograma = self._fases.get((rota, fase))
+                if histograma is None:
+                    histograma = self._fases[(rota, fase)] = Histograma()
+                histograma.observar(segundos)
+
+    def _copiar(self):
+        with self._lock:
+            requisicoes = dict(self._requisicoes)
+            duracao = {chave: (list(h.contagens), h.soma, h.total) for chave, h in self._duracao.items()}
+            fases = {chave: (list(h.contagens), h.soma, h.total) for chave, h in self._fases.items()}
+        return requisicoes, duracao, fases
+
+    @staticmethod
+    def _linhas_histograma(nome, ajuda, rotulos, series):
+        linhas = [f"# HELP {nome} {ajuda}", f"# TYPE {nome} histogram"]
+        for valores, (contagens, soma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, contagem in zip(BUCKETS, contagens):
+                acumulado += contagem
+                le = f'le="{limite}"'
+                linhas.append(f"{nome}_bucket{_rotulos(rotulos, valores, le)} {acumulado}")
+            le = 'le="+Inf"'
+            linhas.append(f"{nome}_bucket{_rotulos(rotulos, valores, le)} {total}")
+            linhas.append(f"{nome}_sum{_rotulos(rotulos, valores)} {soma}")
+            linhas.append(f"{nome}_count{_rotulos(rotulos, valores)} {total}")
+        return linhas
+
+    def exportar(self, medidores=()):
+        """
+        Texto no formato de exposição do Prometheus.
+        medidores: [(nome, ajuda, nomes_rotulos, [(valores_rotulos, valor), ...])] lidos no
+        momento da coleta (ex.: estado do pool de conexões), exportados como gauge.
+        """
+        requisicoes, duracao, fases = self._copiar()
+
+        linhas = [
+            "# HELP frota_http_requisicoes_total Requisições atendidas por rota, método e status.",
+            "# TYPE frota_http_requisicoes_total counter",
+        ]
+        for valores, contagem in sorted(requisicoes.items()):
+            linhas.append(
+                f"frota_http_requisicoes_total{_rotulos(('rota', 'metodo', 'status'), valores)} {contagem}"
+            )
+        linhas += self._linhas_histograma(
+            "frota_http_duracao_segundos", "Duração das requisições por rota e método.",
+            ("rota", "metodo"), duracao
+        )
+        linhas += self._linhas_histograma(
+            "frota_fase_duracao_segundos",
+            "Tempo por requisição em cada fase (conexao, espera_conexao, execucao, senha, serializacao).",
+            ("rota", "fase"), fases
+        )
+        for nome, ajuda, rotulos, valores in medidores:
+            linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} gauge"]
+            for valores_rotulos, valor in valores:
+                linhas.append(f"{nome}{_rotulos(rotulos, valores_rotulos)} {valor}")
+        return "\n".join(linhas) + "\n"
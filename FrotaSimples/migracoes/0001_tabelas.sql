@@ -0,0 +1,43 @@
+-- Tabelas principais da API.
+-- IF NOT EXISTS permite aplicar a migração sobre um banco criado antes do versionamento.
+
+CREATE TABLE IF NOT EXISTS funcionarios (
+    id SERIAL PRIMARY KEY,
+    nome VARCHAR(150) NOT NULL,
+    matricula VARCHAR(50) NOT NULL UNIQUE,
+    cargo VARCHAR(100) NOT NULL,
+    criado_em TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id SERIAL PRIMARY KEY,
+    nome VARCHAR(150) NOT NULL,
+    -- A restrição UNIQUE cria o índice usado na busca por email do /login
+    email VARCHAR(255) NOT NULL UNIQUE,
+    senha_hash VARCHAR(255) NOT NULL,
+    funcionario_id INTEGER REFERENCES funcionarios (id),
+    criado_em TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS veiculos (
+    id SERIAL PRIMARY KEY,
+    modelo VARCHAR(100) NOT NULL,
+    marca VARCHAR(100) NOT NULL,
+    ano INTEGER NOT NULL CHECK (ano >= 1900),
+    placa VARCHAR(10) NOT NULL UNIQUE,
+    tipo VARCHAR(50) NOT NULL,
+    ativo BOOLEAN NOT NULL DEFAULT TRUE,
+    criado_em TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS emprestimos (
+    id SERIAL PRIMARY KEY,
+    veiculo_id INTEGER NOT NULL REFERENCES veiculos (id),
+    funcionario_id INTEGER NOT NULL REFERENCES funcionarios (id),
+    data_saida TIMESTAMP NOT NULL,
+    km_saida NUMERIC(10, 2) NOT NULL,
+    data_retorno TIMESTAMP,
+    km_retorno NUMERIC(10, 2),
+    observacao TEXT,
+    criado_em TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,37 @@
+-- Índices das consultas quentes das rotas.
+-- Nas listagens paginadas (keyset), cada página é uma descida no índice + leitura de 'limit'
+-- linhas, independente da profundidade.
+
+-- GET /emprestimos (ordem data_saida DESC, id DESC; filtros por veículo, funcionário e status)
+CREATE INDEX IF NOT EXISTS idx_emprestimos_data_saida_id
+    ON emprestimos (data_saida DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_emprestimos_veiculo_data_saida_id
+    ON emprestimos (veiculo_id, data_saida DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_emprestimos_funcionario_data_saida_id
+    ON emprestimos (funcionario_id, data_saida DESC, id DESC);
+-- GET /emprestimos/ativos e ?status=abertos: índice parcial só com os empréstimos abertos,
+-- que continua pequeno por mais que o histórico cresça
+CREATE INDEX IF NOT EXISTS idx_emprestimos_abertos_data_saida_id
+    ON emprestimos (data_saida DESC, id DESC)
+    WHERE data_retorno IS NULL;
+
+-- GET /veiculos (ordem id; filtros tipo, marca, ativo)
+CREATE INDEX IF NOT EXISTS idx_veiculos_tipo_id ON veiculos (tipo, id);
+CREATE INDEX IF NOT EXISTS idx_veiculos_marca_id ON veiculos (marca, id);
+CREATE INDEX IF NOT EXISTS idx_veiculos_ativo_id ON veiculos (ativo, id);
+
+-- GET /veiculos/disponiveis (WHERE ativo = TRUE ORDER BY modelo, marca): índice parcial e de
+-- cobertura, já na ordem da resposta, permitindo um index-only scan sem ordenação
+CREATE INDEX IF NOT EXISTS idx_veiculos_disponiveis_modelo_marca
+    ON veiculos (modelo, marca)
+    INCLUDE (id, ano, placa, tipo, criado_em)
+    WHERE ativo = TRUE;
+
+-- Junções das listagens de empréstimos: índices de cobertura sobre a chave primária com as
+-- colunas exibidas, para que cada linha seja resolvida com um index-only scan
+CREATE INDEX IF NOT EXISTS idx_veiculos_id_placa_modelo_marca
+    ON veiculos (id)
+    INCLUDE (placa, modelo, marca);
+CREATE INDEX IF NOT EXISTS idx_funcionarios_id_nome
+    ON funcionarios (id)
+    INCLUDE (nome);
@@ -0,0 +1,37 @@
+-- Versão por tabela, usada nas ETags das listagens (GET condicional com If-None-Match).
+-- Um trigger de comando incrementa a versão a cada INSERT/UPDATE/DELETE/TRUNCATE,
+-- inclusive para escritas feitas fora da API.
+
+CREATE TABLE IF NOT EXISTS versoes_tabelas (
+    tabela VARCHAR(63) PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION incrementar_versao_tabela() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO versoes_tabelas (tabela, versao)
+    VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (tabela) DO UPDATE SET versao = versoes_tabelas.versao + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_versao_usuarios ON usuarios;
+CREATE TRIGGER trg_versao_usuarios
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON usuarios
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+
+DROP TRIGGER IF EXISTS trg_versao_funcionarios ON funcionarios;
+CREATE TRIGGER trg_versao_funcionarios
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON funcionarios
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+
+DROP TRIGGER IF EXISTS trg_versao_veiculos ON veiculos;
+CREATE TRIGGER trg_versao_veiculos
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON veiculos
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+
+DROP TRIGGER IF EXISTS trg_versao_emprestimos ON emprestimos;
+CREATE TRIGGER trg_versao_emprestimos
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON emprestimos
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
@@ -0,0 +1,30 @@
+-- Resumos de uso da frota para GET /relatorios/uso.
+-- Cada empréstimo finalizado soma 1 empréstimo, os km rodados (km_retorno - km_saida) e o
+-- tempo em uso (data_retorno - data_saida) no dia e no mês da sua data_saida, em três
+-- dimensões: o veículo, o funcionário e a frota inteira (chave 0).
+-- Mantidos incrementalmente por consultas.SQL_FINALIZAR_EMPRESTIMO e reconstruídos a partir
+-- do histórico por "python migrar.py recalcular-uso".
+
+CREATE TABLE IF NOT EXISTS uso_diario (
+    dimensao VARCHAR(12) NOT NULL CHECK (dimensao IN ('veiculo', 'funcionario', 'frota')),
+    chave INTEGER NOT NULL,
+    dia DATE NOT NULL,
+    emprestimos INTEGER NOT NULL,
+    km NUMERIC(14, 2) NOT NULL,
+    segundos NUMERIC(16, 3) NOT NULL,
+    PRIMARY KEY (dimensao, chave, dia)
+);
+
+CREATE TABLE IF NOT EXISTS uso_mensal (
+    dimensao VARCHAR(12) NOT NULL CHECK (dimensao IN ('veiculo', 'funcionario', 'frota')),
+    chave INTEGER NOT NULL,
+    mes DATE NOT NULL,
+    emprestimos INTEGER NOT NULL,
+    km NUMERIC(14, 2) NOT NULL,
+    segundos NUMERIC(16, 3) NOT NULL,
+    PRIMARY KEY (dimensao, chave, mes)
+);
+
+-- Ranking do mês (veículos/funcionários que mais rodaram): lê só as 'limit' primeiras entradas
+CREATE INDEX IF NOT EXISTS idx_uso_mensal_ranking_km
+    ON uso_mensal (dimensao, mes, km DESC, chave);
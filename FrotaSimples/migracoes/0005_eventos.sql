@@ -0,0 +1,18 @@
+-- Eventos de disponibilidade enviados aos navegadores por GET /eventos (Server-Sent Events).
+-- As rotas de escrita chamam notificar_evento na mesma transação (ou no mesmo comando) da
+-- alteração; o PostgreSQL só entrega o NOTIFY no commit, então um evento nunca anuncia uma
+-- escrita desfeita. O id vem de uma sequência global, o mesmo em todos os processos da API.
+
+CREATE SEQUENCE IF NOT EXISTS eventos_id_seq;
+
+CREATE OR REPLACE FUNCTION notificar_evento(tipo TEXT, dados JSONB) RETURNS BIGINT AS $$
+DECLARE
+    evento_id BIGINT := nextval('eventos_id_seq');
+BEGIN
+    PERFORM pg_notify(
+        'frota_eventos',
+        json_build_object('id', evento_id, 'tipo', tipo, 'dados', dados)::text
+    );
+    RETURN evento_id;
+END;
+$$ LANGUAGE plpgsql;
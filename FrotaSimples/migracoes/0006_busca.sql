@@ -0,0 +1,36 @@
+-- GET /busca (autocompletar de placas, modelos, marcas, nomes e matrículas).
+-- Prefixo: um índice btree por coluna sobre lower(...) na collation "C" (ordem dos bytes), em
+-- que LIKE 'abc%' vira uma faixa do índice e ORDER BY ... LIMIT lê só as primeiras entradas.
+
+CREATE INDEX IF NOT EXISTS idx_veiculos_placa_prefixo ON veiculos (lower(placa) COLLATE "C", id);
+CREATE INDEX IF NOT EXISTS idx_veiculos_modelo_prefixo ON veiculos (lower(modelo) COLLATE "C", id);
+CREATE INDEX IF NOT EXISTS idx_veiculos_marca_prefixo ON veiculos (lower(marca) COLLATE "C", id);
+CREATE INDEX IF NOT EXISTS idx_funcionarios_nome_prefixo ON funcionarios (lower(nome) COLLATE "C", id);
+CREATE INDEX IF NOT EXISTS idx_funcionarios_matricula_prefixo ON funcionarios (lower(matricula) COLLATE "C", id);
+
+-- Busca aproximada (erros de digitação, palavras do meio do nome): trigramas (pg_trgm) num
+-- índice GiST sobre o texto de cada registro, que responde ORDER BY termo <<-> texto LIMIT n
+-- sem percorrer todas as linhas. As expressões são as de consultas.BUSCAS (campo 'texto').
+-- A extensão é opcional: sem ela (pacote contrib ausente), /busca faz só a busca por prefixo.
+-- Para ativá-la depois, instale o contrib e execute este bloco manualmente.
+DO $$
+DECLARE
+    esquema TEXT;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        RAISE NOTICE 'pg_trgm indisponível: GET /busca fará só a busca por prefixo';
+        RETURN;
+    END IF;
+
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    -- A classe de operadores vai qualificada: a extensão pode estar num schema fora do
+    -- search_path (ex.: o schema temporário de "migrar.py verificar-planos")
+    SELECT extnamespace::regnamespace::text INTO esquema FROM pg_extension WHERE extname = 'pg_trgm';
+    EXECUTE format(
+        'CREATE INDEX IF NOT EXISTS idx_veiculos_busca_trgm ON veiculos '
+        'USING gist ((placa || '' '' || modelo || '' '' || marca) %s.gist_trgm_ops)', esquema);
+    EXECUTE format(
+        'CREATE INDEX IF NOT EXISTS idx_funcionarios_busca_trgm ON funcionarios '
+        'USING gist ((nome || '' '' || matricula) %s.gist_trgm_ops)', esquema);
+END
+$$;
@@ -0,0 +1,5 @@
+-- Tokens de sessão (tokens.py): cada token leva a versão da senha do usuário em que foi
+-- emitido. A troca de senha incrementa a versão, o que invalida os tokens já emitidos.
+-- A regravação do hash com parâmetros novos no login (mesma senha) não mexe na versão.
+
+ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS versao_senha INTEGER NOT NULL DEFAULT 0;
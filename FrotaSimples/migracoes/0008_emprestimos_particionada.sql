@@ -0,0 +1,104 @@
+-- Histórico de empréstimos particionado por mês de data_saida.
+-- Cada mês é uma tabela (emprestimos_AAAA_MM) com os seus próprios índices: as consultas das
+-- rotas descem em índices do tamanho de um mês, e os meses antigos saem da tabela inteiros
+-- ("python migrar.py arquivar", que grava o mês em disco e desanexa a partição) em vez de
+-- um DELETE que deixaria o índice e a tabela cheios de espaço morto.
+--
+-- - emprestimos_padrao (DEFAULT) recebe o que não cai em nenhum mês criado (ex.: uma
+--   data_saida digitada errada, anos à frente). "python migrar.py particoes" cria os meses
+--   seguintes com antecedência e leva para eles o que estiver na padrão.
+-- - A chave primária inclui data_saida (exigência do particionamento); o id continua vindo
+--   da mesma sequência, então segue único, e a busca por id desce no índice de cada mês.
+-- - A tabela é recriada e os dados copiados, na transação da migração: em bancos grandes
+--   ela leva alguns minutos com a tabela travada.
+
+-- Meses já arquivados (migrar.py arquivar): arquivo em disco e quantidade de linhas.
+-- recalcular-uso preserva os resumos de uso desses meses, que não estão mais na tabela.
+CREATE TABLE IF NOT EXISTS emprestimos_arquivados (
+    mes DATE PRIMARY KEY,
+    arquivo TEXT NOT NULL,
+    linhas BIGINT NOT NULL,
+    bytes BIGINT NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    arquivado_em TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Cria as partições mensais de 'inicio' até o mês de 'fim' (inclusive) que ainda não existem.
+-- Os empréstimos desses meses que estavam em emprestimos_padrao passam para a nova partição.
+-- Retorna o nome de cada partição criada.
+CREATE OR REPLACE FUNCTION criar_particoes_emprestimos(inicio DATE, fim DATE) RETURNS SETOF TEXT AS $$
+DECLARE
+    mes DATE := date_trunc('month', inicio)::date;
+    seguinte DATE;
+    nome TEXT;
+BEGIN
+    WHILE mes <= fim LOOP
+        seguinte := (mes + INTERVAL '1 month')::date;
+        nome := 'emprestimos_' || to_char(mes, 'YYYY_MM');
+        IF to_regclass(nome) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE emprestimos INCLUDING DEFAULTS)', nome);
+            EXECUTE format(
+                'WITH movidos AS (DELETE FROM emprestimos_padrao WHERE data_saida >= %L AND data_saida < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM movidos', mes, seguinte, nome);
+            EXECUTE format('ALTER TABLE emprestimos ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           nome, mes, seguinte);
+            RETURN NEXT nome;
+        END IF;
+        mes := seguinte;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE emprestimos RENAME TO emprestimos_legado;
+
+CREATE TABLE emprestimos (
+    id INTEGER NOT NULL DEFAULT nextval('emprestimos_id_seq'),
+    veiculo_id INTEGER NOT NULL,
+    funcionario_id INTEGER NOT NULL,
+    data_saida TIMESTAMP NOT NULL,
+    km_saida NUMERIC(10, 2) NOT NULL,
+    data_retorno TIMESTAMP,
+    km_retorno NUMERIC(10, 2),
+    observacao TEXT,
+    criado_em TIMESTAMP NOT NULL DEFAULT NOW()
+) PARTITION BY RANGE (data_saida);
+
+CREATE TABLE emprestimos_padrao PARTITION OF emprestimos DEFAULT;
+
+-- Do mês do empréstimo mais antigo até três meses à frente
+SELECT count(*) FROM criar_particoes_emprestimos(
+    coalesce((SELECT min(data_saida) FROM emprestimos_legado)::date, current_date),
+    (greatest((SELECT max(data_saida) FROM emprestimos_legado)::date, current_date) + INTERVAL '3 months')::date
+);
+
+-- Os dados vão antes das chaves e índices: cada índice é construído uma vez, em lote
+INSERT INTO emprestimos (id, veiculo_id, funcionario_id, data_saida, km_saida, data_retorno,
+                         km_retorno, observacao, criado_em)
+SELECT id, veiculo_id, funcionario_id, data_saida, km_saida, data_retorno, km_retorno,
+       observacao, criado_em
+FROM emprestimos_legado;
+
+ALTER SEQUENCE emprestimos_id_seq OWNED BY emprestimos.id;
+DROP TABLE emprestimos_legado;
+
+ALTER TABLE emprestimos ADD PRIMARY KEY (id, data_saida);
+ALTER TABLE emprestimos ADD FOREIGN KEY (veiculo_id) REFERENCES veiculos (id);
+ALTER TABLE emprestimos ADD FOREIGN KEY (funcionario_id) REFERENCES funcionarios (id);
+
+-- Os mesmos índices da migração 0002, agora um por partição
+CREATE INDEX idx_emprestimos_data_saida_id
+    ON emprestimos (data_saida DESC, id DESC);
+CREATE INDEX idx_emprestimos_veiculo_data_saida_id
+    ON emprestimos (veiculo_id, data_saida DESC, id DESC);
+CREATE INDEX idx_emprestimos_funcionario_data_saida_id
+    ON emprestimos (funcionario_id, data_saida DESC, id DESC);
+CREATE INDEX idx_emprestimos_abertos_data_saida_id
+    ON emprestimos (data_saida DESC, id DESC)
+    WHERE data_retorno IS NULL;
+
+-- ETags (migração 0003): os comandos na tabela particionada disparam o gatilho dela
+CREATE TRIGGER trg_versao_emprestimos
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON emprestimos
+    FOR EACH STATEMENT EXECUTE FUNCTION incrementar_versao_tabela();
+
+ANALYZE emprestimos;
@@ -0,0 +1,27 @@
+-- Versões das ETags (migração 0003) travadas sempre na mesma ordem.
+-- O gatilho de versão trava a linha da tabela em versoes_tabelas até o commit. O checkout
+-- escreve em veiculos e depois em emprestimos; a devolução, em emprestimos e depois em
+-- veiculos. Com as duas linhas travadas em ordens opostas, um checkout e uma devolução
+-- simultâneos (de veículos diferentes) terminavam em deadlock. Agora a primeira escrita em
+-- qualquer uma das duas tabelas já trava as duas linhas, em ordem de nome.
+
+-- As linhas precisam existir para o FOR UPDATE travá-las (versão ausente já valia 0)
+INSERT INTO versoes_tabelas (tabela, versao)
+VALUES ('emprestimos', 0), ('veiculos', 0)
+ON CONFLICT (tabela) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION incrementar_versao_tabela() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME IN ('emprestimos', 'veiculos') THEN
+        PERFORM 1 FROM versoes_tabelas
+        WHERE tabela IN ('emprestimos', 'veiculos')
+        ORDER BY tabela
+        FOR UPDATE;
+    END IF;
+
+    INSERT INTO versoes_tabelas (tabela, versao)
+    VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (tabela) DO UPDATE SET versao = versoes_tabelas.versao + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
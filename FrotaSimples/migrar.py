@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Migrações versionadas do banco da Frota Simples.
+
+Uso:
+    python migrar.py                      aplica as migrações pendentes
+    python migrar.py status               lista as migrações aplicadas e pendentes
+    python migrar.py verificar-planos     aplica as migrações num schema temporário, popula
+                                          com um volume grande e falha (código 1) se alguma
+                                          consulta das rotas cair num Seq Scan indevido
+    python migrar.py recalcular-uso       reconstrói os resumos de /relatorios/uso a partir
+                                          do histórico de empréstimos
+    python migrar.py particoes            cria as partições mensais de empréstimos dos
+                                          próximos meses (rode todo mês)
+    python migrar.py arquivar             grava em arquivos os meses de empréstimos além da
+                                          retenção e os tira do banco (arquivamento.py)
+
+As migrações são os arquivos migracoes/NNNN_descricao.sql, aplicados em ordem, cada um
+na sua própria transação, e registrados na tabela migracoes_aplicadas.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date
+
+import psycopg2
+
+import arquivamento
+import consultas
+from config import DB_CONFIG, ARQUIVO_CONFIG
+
+DIRETORIO_MIGRACOES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migracoes')
+
+# Chave do advisory lock que impede duas execuções simultâneas do migrador
+TRAVA_MIGRACOES = 7_418_001
+
+
+# =============================================================================
+# MIGRAÇÕES
+# =============================================================================
+
+def listar_migracoes():
+    """Retorna [(versao, nome, caminho)] em ordem de versão."""
+    migracoes = []
+    for arquivo in sorted(os.listdir(DIRETORIO_MIGRACOES)):
+        if not arquivo.endswith('.sql'):
+            continue
+        versao, _, nome = arquivo[:-4].partition('_')
+        migracoes.append((versao, nome, os.path.join(DIRETORIO_MIGRACOES, arquivo)))
+    return migracoes
+
+
+def versoes_aplicadas(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS migracoes_aplicadas (
+                versao VARCHAR(20) PRIMARY KEY,
+                nome VARCHAR(200) NOT NULL,
+                aplicada_em TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
+        cur.execute("SELECT versao FROM migracoes_aplicadas;")
+        versoes = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versoes
+
+
+def aplicar_migracoes(conn, verbose=True):
+    """Aplica as migrações pendentes. Retorna a lista de versões aplicadas."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s);", (TRAVA_MIGRACOES,))
+    conn.commit()
+
+    aplicadas = []
+    try:
+        ja_aplicadas = versoes_aplicadas(conn)
+        for versao, nome, caminho in listar_migracoes():
+            if versao in ja_aplicadas:
+                continue
+            with open(caminho, encoding='utf-8') as arquivo:
+                sql = arquivo.read()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+                    cur.execute(
+                        "INSERT INTO migracoes_aplicadas (versao, nome) VALUES (%s, %s);",
+                        (versao, nome)
+                    )
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                print(f"Falha ao aplicar a migração {versao}_{nome}")
+                raise
+            aplicadas.append(versao)
+            if verbose:
+                print(f"Aplicada {versao}_{nome}")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (TRAVA_MIGRACOES,))
+        conn.commit()
+
+    return aplicadas
+
+
+def recalcular_uso(conn):
+    """Reconstrói uso_diario/uso_mensal numa única transação. Retorna as linhas por tabela."""
+    with conn.cursor() as cur:
+        cur.execute(consultas.SQL_RECALCULAR_USO)
+        cur.execute("SELECT (SELECT count(*) FROM uso_diario), (SELECT count(*) FROM uso_mensal);")
+        diario, mensal = cur.fetchone()
+    conn.commit()
+    return diario, mensal
+
+
+def arquivar(conn, reter_meses, diretorio, manter_tabelas):
+    """Arquiva os meses anteriores aos reter_meses completos antes do atual."""
+    atual = date.today().replace(day=1)
+    meses = atual.year * 12 + atual.month - 1 - reter_meses
+    corte = date(meses // 12, meses % 12 + 1, 1)
+    resultados = arquivamento.arquivar(conn, diretorio, corte, manter_tabelas)
+    for mes, linhas, motivo in resultados:
+        if linhas is None:
+            print(f"{mes:%Y-%m}: mantido no banco ({motivo})")
+        else:
+            print(f"{mes:%Y-%m}: {linhas} empréstimo(s) em {arquivamento.caminho_mes(diretorio, mes)}")
+    if not resultados:
+        print(f"Nenhum mês anterior a {corte:%Y-%m} no banco.")
+    return resultados
+
+
+def status(conn):
+    ja_aplicadas = versoes_aplicadas(conn)
+    for versao, nome, _ in listar_migracoes():
+        situacao = "aplicada" if versao in ja_aplicadas else "PENDENTE"
+        print(f"{versao}_{nome}: {situacao}")
+
+
+# =============================================================================
+# VERIFICAÇÃO DE PLANOS (EXPLAIN)
+# =============================================================================
+
+SCHEMA_VERIFICACAO = 'verificacao_planos'
+
+SQL_POPULAR = """
+    INSERT INTO funcionarios (nome, matricula, cargo)
+    SELECT 'Funcionario ' || g, 'MAT' || g, (ARRAY['Motorista', 'Tecnico', 'Gerente'])[1 + g %% 3]
+    FROM generate_series(1, %(funcionarios)s) g;
+
+    INSERT INTO usuarios (nome, email, senha_hash, funcionario_id)
+    SELECT 'Usuario ' || g, 'usuario' || g || '@frota.local', 'x', g
+    FROM generate_series(1, %(funcionarios)s) g;
+
+    INSERT INTO veiculos (modelo, marca, ano, placa, tipo)
+    SELECT 'Modelo ' || (g %% 60), 'Marca ' || (g %% 15), 1995 + g %% 30,
+           'P' || lpad(g::text, 7, '0'), (ARRAY['carro', 'moto', 'caminhao', 'van'])[1 + g %% 4]
+    FROM generate_series(1, %(veiculos)s) g;
+
+    -- Histórico: um empréstimo a cada 2 minutos; os 'abertos' mais recentes não foram devolvidos.
+    -- Antes, as partições mensais do período (migração 0008)
+    SELECT count(*) FROM criar_particoes_emprestimos(
+        DATE '2015-01-01', (TIMESTAMP '2015-01-01' + %(emprestimos)s * INTERVAL '2 minutes')::date);
+
+    INSERT INTO emprestimos (veiculo_id, funcionario_id, data_saida, km_saida,
+                             data_retorno, km_retorno)
+    SELECT 1 + g %% %(veiculos)s, 1 + g %% %(funcionarios)s,
+           TIMESTAMP '2015-01-01' + g * INTERVAL '2 minutes', (g %% 100000)::numeric,
+           CASE WHEN g <= %(emprestimos)s - %(abertos)s
+                THEN TIMESTAMP '2015-01-01' + g * INTERVAL '2 minutes' + INTERVAL '8 hours' END,
+           CASE WHEN g <= %(emprestimos)s - %(abertos)s THEN (g %% 100000)::numeric + 100 END
+    FROM generate_series(1, %(emprestimos)s) g;
+
+    UPDATE veiculos SET ativo = FALSE
+    WHERE id IN (SELECT veiculo_id FROM emprestimos WHERE data_retorno IS NULL);
+"""
+
+# Consultas das rotas (as mesmas de consultas.py), com parâmetros representativos.
+# As listagens completas (sem limit) não entram: elas leem a tabela inteira por definição.
+def _pagina(**filtros):
+    """Filtros de listagem com os valores padrão (sem filtro) mais os informados."""
+    padrao = {"limite": 100, "cursor": None, "tipo": None, "marca": None, "ativo": None,
+              "veiculo_id": None, "funcionario_id": None, "data_inicio": None,
+              "data_fim": None, "status": None, "campos": None}
+    padrao.update(filtros)
+    return padrao
+
+
+CONSULTAS_ROTAS = [
+    ("POST /login", consultas.SQL_LOGIN, ("usuario42@frota.local",)),
+    ("Bearer (usuário fora do cache de tokens)", consultas.SQL_USUARIO_SESSAO, (42,)),
+    ("GET /veiculos/disponiveis", consultas.SQL_VEICULOS_DISPONIVEIS, None),
+    ("GET /veiculos?tipo=&limit=", *consultas.listar_veiculos(_pagina(tipo="van", cursor=[5000]))),
+    ("PATCH /veiculos/<id>/status", consultas.SQL_ATUALIZAR_STATUS_VEICULO, (True, 42)),
+    ("GET /emprestimos?limit=", *consultas.listar_emprestimos(_pagina())),
+    ("GET /emprestimos?after=&limit= (página profunda)",
+     *consultas.listar_emprestimos(_pagina(cursor=["2015-06-01T00:00:00", 1000000000]))),
+    ("GET /emprestimos?veiculo_id=&limit=", *consultas.listar_emprestimos(_pagina(veiculo_id=42))),
+    ("GET /emprestimos?funcionario_id=&limit=", *consultas.listar_emprestimos(_pagina(funcionario_id=42))),
+    ("GET /emprestimos?fields=&limit= (sem junções)",
+     *consultas.listar_emprestimos(_pagina(campos=("id", "data_saida", "data_retorno")))),
+    ("GET /emprestimos/ativos", consultas.SQL_EMPRESTIMOS_ATIVOS, None),
+    ("POST /emprestimos", consultas.SQL_REGISTRAR_EMPRESTIMO, {
+        "veiculo_id": 42, "funcionario_id": 42, "data_saida": "2024-01-01T08:00:00",
+        "km_saida": 100, "observacao": None}),
+    ("PATCH /emprestimos/<id>/finalizar", consultas.SQL_FINALIZAR_EMPRESTIMO, {
+        "id": 4242, "data_retorno": "2024-01-01T18:00:00", "km_retorno": 200, "observacao": None}),
+    ("GET /relatorios/uso?agrupar=mes", *consultas.serie_uso(
+        'frota', 0, {"agrupar": "mes", "inicio": date(2015, 1, 1), "fim": date(2015, 12, 1)})),
+    ("GET /relatorios/uso/veiculos/<id>?agrupar=dia", *consultas.serie_uso(
+        'veiculo', 42, {"agrupar": "dia", "inicio": date(2015, 1, 1), "fim": None})),
+    ("GET /relatorios/uso/veiculos?mes=", *consultas.ranking_uso('veiculo', date(2015, 3, 1), 20)),
+    ("GET /relatorios/uso/funcionarios?mes=", *consultas.ranking_uso('funcionario', date(2015, 3, 1), 20)),
+    ("GET /busca?q=", *consultas.busca("fi", ("veiculo", "funcionario"), 10, False)),
+]
+
+
+def _seq_scans(plano, tamanhos, limite_linhas, limite_historico):
+    """
+    Percorre o plano (EXPLAIN FORMAT JSON) e retorna as tabelas lidas por Seq Scan indevido:
+    - com filtro (WHERE resolvido lendo a tabela toda) numa tabela com mais de limite_linhas;
+    - de qualquer tipo numa tabela com mais de limite_historico (ex.: emprestimos).
+    Uma tabela média lida inteira sem filtro, para montar o hash de uma junção, é uma
+    escolha legítima do planejador e não conta como falha.
+    """
+    encontrados = []
+    if plano.get('Node Type') == 'Seq Scan':
+        tabela = plano.get('Relation Name')
+        tamanho = tamanhos.get(tabela, 0)
+        if tamanho > limite_historico or ('Filter' in plano and tamanho > limite_linhas):
+            encontrados.append(tabela)
+    for filho in plano.get('Plans', []):
+        encontrados.extend(_seq_scans(filho, tamanhos, limite_linhas, limite_historico))
+    return encontrados
+
+
+def verificar_planos(conn, veiculos, funcionarios, emprestimos, abertos, limite_linhas,
+                     limite_historico):
+    """
+    Cria as tabelas num schema temporário (aplicando as próprias migrações), popula com
+    o volume informado, roda EXPLAIN em cada consulta de rota e remove o schema.
+    Retorna a lista de (rota, tabelas lidas por Seq Scan).
+    """
+    conn.autocommit = True
+    falhas = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA_VERIFICACAO} CASCADE;")
+            cur.execute(f"CREATE SCHEMA {SCHEMA_VERIFICACAO};")
+            cur.execute(f"SET search_path TO {SCHEMA_VERIFICACAO};")
+
+        conn.autocommit = False
+        aplicar_migracoes(conn, verbose=False)
+
+        print(f"Populando: {veiculos} veículos, {funcionarios} funcionários, "
+              f"{emprestimos} empréstimos ({abertos} abertos)...")
+        with conn.cursor() as cur:
+            cur.execute(SQL_POPULAR, {
+                "veiculos": veiculos,
+                "funcionarios": funcionarios,
+                "emprestimos": emprestimos,
+                "abertos": abertos,
+            })
+            cur.execute(consultas.SQL_RECALCULAR_USO)
+        conn.commit()
+
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for tabela in ('funcionarios', 'usuarios', 'veiculos', 'emprestimos',
+                           'uso_diario', 'uso_mensal'):
+                cur.execute(f"VACUUM ANALYZE {tabela};")
+            cur.execute("""
+                SELECT c.relname, c.reltuples::bigint
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relkind = 'r';
+            """, (SCHEMA_VERIFICACAO,))
+            tamanhos = dict(cur.fetchall())
+
+        conn.autocommit = False
+        for rota, sql, params in CONSULTAS_ROTAS:
+            with conn.cursor() as cur:
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plano = cur.fetchone()[0]
+                if isinstance(plano, str):
+                    plano = json.loads(plano)
+            # Rotas de escrita são só explicadas, nunca executadas
+            conn.rollback()
+            tabelas = _seq_scans(plano[0]['Plan'], tamanhos, limite_linhas, limite_historico)
+            print(f"{'FALHA' if tabelas else 'ok':5}  {rota}" + (f"  (Seq Scan em {', '.join(tabelas)})" if tabelas else ""))
+            if tabelas:
+                falhas.append((rota, tabelas))
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA_VERIFICACAO} CASCADE;")
+
+    return falhas
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest='comando')
+    subcomandos.add_parser('aplicar', help="aplica as migrações pendentes (padrão)")
+    subcomandos.add_parser('status', help="lista as migrações aplicadas e pendentes")
+    subcomandos.add_parser('recalcular-uso', help="reconstrói os resumos de /relatorios/uso")
+    particoes = subcomandos.add_parser('particoes', help="cria as partições mensais dos próximos meses")
+    particoes.add_argument('--meses-futuros', type=int, default=ARQUIVO_CONFIG["meses_futuros"])
+    retencao = subcomandos.add_parser('arquivar', help="arquiva os meses de empréstimos além da retenção")
+    retencao.add_argument('--reter-meses', type=int, default=ARQUIVO_CONFIG["reter_meses"],
+                          help="meses completos mantidos no banco antes do atual")
+    retencao.add_argument('--diretorio', default=ARQUIVO_CONFIG["diretorio"])
+    retencao.add_argument('--manter-tabelas', action='store_true',
+                          help="só desanexa as partições arquivadas, sem apagá-las")
+    verificar = subcomandos.add_parser('verificar-planos', help="regressão de planos com EXPLAIN")
+    verificar.add_argument('--veiculos', type=int, default=10000)
+    verificar.add_argument('--funcionarios', type=int, default=5000)
+    verificar.add_argument('--emprestimos', type=int, default=500000)
+    verificar.add_argument('--abertos', type=int, default=1500)
+    verificar.add_argument('--limite-linhas', type=int, default=5000,
+                           help="Seq Scan com filtro em tabelas com mais linhas que isso é falha")
+    verificar.add_argument('--limite-historico', type=int, default=100000,
+                           help="qualquer Seq Scan em tabelas com mais linhas que isso é falha")
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.comando == 'status':
+            status(conn)
+        elif args.comando == 'recalcular-uso':
+            diario, mensal = recalcular_uso(conn)
+            print(f"Resumos reconstruídos: {diario} linhas diárias, {mensal} mensais.")
+        elif args.comando == 'particoes':
+            criadas = arquivamento.criar_particoes(conn, args.meses_futuros)
+            print(f"Partições criadas: {', '.join(criadas)}." if criadas else "Nenhuma partição nova.")
+        elif args.comando == 'arquivar':
+            arquivar(conn, args.reter_meses, args.diretorio, args.manter_tabelas)
+        elif args.comando == 'verificar-planos':
+            falhas = verificar_planos(conn, args.veiculos, args.funcionarios, args.emprestimos,
+                                      args.abertos, args.limite_linhas, args.limite_historico)
+            if falhas:
+                print(f"{len(falhas)} consulta(s) com Seq Scan indevido.")
+                return 1
+            print("Nenhuma consulta de rota usa Seq Scan indevido.")
+        else:
+            aplicadas = aplicar_migracoes(conn)
+            if not aplicadas:
+                print("Nenhuma migração pendente.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
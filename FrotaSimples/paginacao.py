@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import base64
+import binascii
+import json
+from datetime import date, datetime, timedelta
+
+# Maior página aceita em ?limit=
+LIMITE_MAXIMO = 1000
+
+
+class ParametroInvalido(ValueError):
+    """Parâmetro de consulta (query string) inválido; vira uma resposta 400."""
+
+
+# =============================================================================
+# LEITURA DE PARÂMETROS
+# =============================================================================
+
+def ler_limite(args, nome='limit'):
+    """Tamanho da página (None quando o parâmetro não foi informado)."""
+    valor = args.get(nome)
+    if valor is None:
+        return None
+    try:
+        limite = int(valor)
+    except ValueError:
+        raise ParametroInvalido(f"'{nome}' deve ser um número inteiro")
+    if limite < 1 or limite > LIMITE_MAXIMO:
+        raise ParametroInvalido(f"'{nome}' deve estar entre 1 e {LIMITE_MAXIMO}")
+    return limite
+
+
+def ler_inteiro(args, nome):
+    valor = args.get(nome)
+    if valor is None:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ParametroInvalido(f"'{nome}' deve ser um número inteiro")
+
+
+def ler_booleano(args, nome):
+    valor = args.get(nome)
+    if valor is None:
+        return None
+    valor = valor.strip().lower()
+    if valor in ('true', '1', 'sim'):
+        return True
+    if valor in ('false', '0', 'nao', 'não'):
+        return False
+    raise ParametroInvalido(f"'{nome}' deve ser true ou false")
+
+
+def ler_data(args, nome, fim_do_dia=False):
+    """
+    Lê uma data/hora ISO 8601 (AAAA-MM-DD ou AAAA-MM-DDTHH:MM[:SS]).
+    Com fim_do_dia=True, uma data sem hora aponta para o início do dia seguinte,
+    para ser usada como limite exclusivo (data_saida < valor) sem perder o próprio dia.
+    """
+    valor = args.get(nome)
+    if valor is None:
+        return None
+    try:
+        data = datetime.fromisoformat(valor)
+    except ValueError:
+        raise ParametroInvalido(f"'{nome}' deve ser uma data no formato AAAA-MM-DD")
+    if fim_do_dia and len(valor) == 10:
+        data += timedelta(days=1)
+    return data
+
+
+def ler_campos(args, permitidos, nome='fields'):
+    """
+    Lê a lista de colunas pedidas (?fields=id,placa,data_saida), separadas por vírgula.
+    Retorna uma tupla na ordem de permitidos, sem repetições, ou None (todas as colunas)
+    quando o parâmetro não foi informado.
+    """
+    valor = args.get(nome)
+    if valor is None:
+        return None
+    pedidos = {campo.strip() for campo in valor.split(',') if campo.strip()}
+    if not pedidos:
+        raise ParametroInvalido(f"'{nome}' deve listar ao menos uma coluna")
+    desconhecidos = pedidos.difference(permitidos)
+    if desconhecidos:
+        raise ParametroInvalido(
+            f"'{nome}' tem colunas desconhecidas: {', '.join(sorted(desconhecidos))}. "
+            f"Permitidas: {', '.join(permitidos)}"
+        )
+    return tuple(campo for campo in permitidos if campo in pedidos)
+
+
+def ler_dia(args, nome, fim_do_mes=False):
+    """
+    Lê um dia (AAAA-MM-DD) ou um mês (AAAA-MM) e retorna um date.
+    Um mês vira o seu primeiro dia, ou o último com fim_do_mes=True (limite inclusivo).
+    """
+    valor = args.get(nome)
+    if valor is None:
+        return None
+    try:
+        if len(valor) == 7:
+            dia = datetime.strptime(valor, '%Y-%m').date()
+            if fim_do_mes:
+                proximo = date(dia.year + dia.month // 12, dia.month % 12 + 1, 1)
+                dia = proximo - timedelta(days=1)
+            return dia
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ParametroInvalido(f"'{nome}' deve estar no formato AAAA-MM-DD ou AAAA-MM")
+
+
+# =============================================================================
+# CURSORES (KEYSET)
+# =============================================================================
+
+def codificar_cursor(*valores):
+    """Serializa a chave do último item da página num token opaco e seguro para URL."""
+    bruto = json.dumps(valores, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(token, conversores, nome='after'):
+    """
+    Converte o token de volta para os valores da chave, aplicando um conversor por posição.
+    Retorna None se o token não foi informado.
+    """
+    if token is None:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        valores = json.loads(bruto)
+        if not isinstance(valores, list) or len(valores) != len(conversores):
+            raise ValueError
+        return [conversor(valor) for conversor, valor in zip(conversores, valores)]
+    except (binascii.Error, ValueError, TypeError):
+        raise ParametroInvalido(f"'{nome}' não é um cursor válido")
+
+
+def data_iso(valor):
+    """Conversor de cursor para datas: valida o formato e mantém o texto ISO."""
+    datetime.fromisoformat(valor)
+    return valor
+
+
+def fatiar_pagina(itens, limite, chave):
+    """
+    Recebe até limite+1 itens (a consulta busca um a mais para saber se há próxima página)
+    e retorna (itens da página, cursor da próxima página ou None).
+    """
+    if limite is None or len(itens) <= limite:
+        return itens, None
+    itens = itens[:limite]
+    return itens, codificar_cursor(*chave(itens[-1]))
+
+
+def recortar_campos(itens, campos):
+    """
+    Deixa nos itens só as colunas pedidas em ?fields= (campos; None = todas). As colunas
+    da chave do cursor são sempre lidas, mesmo fora de campos, e saem aqui.
+    """
+    if campos is None:
+        return itens
+    return [{nome: item[nome] for nome in campos} for item in itens]
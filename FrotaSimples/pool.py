@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo de espera configurado."""
+
+
+class PoolConexoes:
+    """
+    Pool de conexões PostgreSQL thread-safe.
+
+    - Mantém entre 'minimo' e 'maximo' conexões abertas.
+    - Quem pede uma conexão com o pool cheio espera no máximo 'timeout' segundos.
+    - Conexões ociosas há mais de 'validar_apos' segundos são testadas (SELECT 1) antes do uso.
+    - Conexões com mais de 'vida_maxima' segundos são recicladas na devolução.
+    - observador(fase, segundos), se informado, recebe a cada checkout o tempo de espera
+      ('espera_conexao') e, quando uma conexão nova foi aberta, o tempo de conexão ('conexao').
+    """
+
+    def __init__(self, db_config, minimo=2, maximo=20, timeout=5.0,
+                 vida_maxima=1800.0, validar_apos=30.0, observador=None):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError("Configuração de pool inválida (0 <= minimo <= maximo, maximo >= 1)")
+
+        self.db_config = dict(db_config)
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.vida_maxima = vida_maxima
+        self.validar_apos = validar_apos
+        self.observador = observador
+
+        self._cond = threading.Condition(threading.Lock())
+        # Pilha LIFO de (conexao, devolvida_em): reaproveita as conexões mais "quentes"
+        self._ociosas = deque()
+        # conexao -> momento da criação (para a reciclagem por tempo de vida)
+        self._criadas_em = {}
+        self._total = 0
+        self._em_uso = 0
+        self._aguardando = 0
+        self._fechado = False
+
+        self._stats = {
+            "conexoes_criadas": 0,
+            "conexoes_recicladas": 0,
+            "conexoes_descartadas": 0,
+            "checkouts": 0,
+            "esperas": 0,
+            "timeouts": 0,
+            "tempo_espera_total_ms": 0.0,
+            "tempo_espera_max_ms": 0.0,
+        }
+
+    # -------------------------------------------------------------------------
+    # Ciclo de vida das conexões
+    # -------------------------------------------------------------------------
+
+    def _conectar(self):
+        conn = psycopg2.connect(**self.db_config)
+        with self._cond:
+            self._criadas_em[conn] = time.monotonic()
+            self._stats["conexoes_criadas"] += 1
+        return conn
+
+    def _fechar_conexao(self, conn, motivo="conexoes_descartadas"):
+        """Fecha a conexão física e libera a vaga no pool."""
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._criadas_em.pop(conn, None)
+            self._total -= 1
+            self._stats[motivo] += 1
+            self._cond.notify()
+
+    def _expirada(self, conn, agora):
+        criada_em = self._criadas_em.get(conn, agora)
+        return self.vida_maxima is not None and agora - criada_em >= self.vida_maxima
+
+    def _valida(self, conn, devolvida_em, agora):
+        if conn.closed:
+            return False
+        if self.validar_apos is None or agora - devolvida_em < self.validar_apos:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def preencher(self):
+        """Abre conexões até atingir o mínimo configurado (falhas são apenas registradas)."""
+        while True:
+            with self._cond:
+                if self._fechado or self._total >= self.minimo:
+                    return
+                self._total += 1
+            try:
+                conn = self._conectar()
+            except psycopg2.Error as e:
+                with self._cond:
+                    self._total -= 1
+                print(f"DB Pool warm-up fail: {e}")
+                return
+            with self._cond:
+                self._ociosas.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    # -------------------------------------------------------------------------
+    # Checkout / devolução
+    # -------------------------------------------------------------------------
+
+    def obter(self, timeout=None):
+        """
+        Retira uma conexão do pool.
+        Lança PoolEsgotado se nenhuma ficar livre a tempo e psycopg2.Error se não for possível conectar.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        prazo = inicio + timeout
+        esperou = False
+        conexao_s = 0.0
+
+        while True:
+            conn = None
+            criar = False
+            with self._cond:
+                if self._fechado:
+                    raise PoolEsgotado("O pool de conexões foi fechado")
+                while True:
+                    if self._ociosas:
+                        conn, devolvida_em = self._ociosas.pop()
+                        break
+                    if self._total < self.maximo:
+                        self._total += 1
+                        criar = True
+                        break
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolEsgotado(
+                            f"Nenhuma conexão livre em {timeout:.1f}s (máximo {self.maximo})"
+                        )
+                    esperou = True
+                    self._aguardando += 1
+                    try:
+                        self._cond.wait(restante)
+                    finally:
+                        self._aguardando -= 1
+
+            if criar:
+                conectando = time.monotonic()
+                try:
+                    conn = self._conectar()
+                except psycopg2.Error:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+                conexao_s += time.monotonic() - conectando
+            else:
+                agora = time.monotonic()
+                if self._expirada(conn, agora):
+                    self._fechar_conexao(conn, "conexoes_recicladas")
+                    continue
+                if not self._valida(conn, devolvida_em, agora):
+                    self._fechar_conexao(conn)
+                    continue
+
+            espera_ms = (time.monotonic() - inicio) * 1000.0
+            with self._cond:
+                self._em_uso += 1
+                self._stats["checkouts"] += 1
+                if esperou:
+                    self._stats["esperas"] += 1
+                self._stats["tempo_espera_total_ms"] += espera_ms
+                if espera_ms > self._stats["tempo_espera_max_ms"]:
+                    self._stats["tempo_espera_max_ms"] = espera_ms
+            if self.observador is not None:
+                self.observador("espera_conexao", espera_ms / 1000.0 - conexao_s)
+                if conexao_s:
+                    self.observador("conexao", conexao_s)
+            return conn
+
+    def devolver(self, conn, descartar=False):
+        """Devolve a conexão ao pool, desfazendo qualquer transação deixada aberta."""
+        with self._cond:
+            self._em_uso -= 1
+
+        if descartar or conn.closed:
+            self._fechar_conexao(conn)
+            return
+
+        # Rotas de leitura não fazem commit: encerra a transação implícita antes de reutilizar.
+        # Rotas que executam um único comando em autocommit voltam ao modo transacional.
+        try:
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            self._fechar_conexao(conn)
+            return
+
+        if self._fechado:
+            self._fechar_conexao(conn)
+            return
+        if self._expirada(conn, time.monotonic()):
+            self._fechar_conexao(conn, "conexoes_recicladas")
+            return
+
+        with self._cond:
+            self._ociosas.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def fechar(self):
+        """Fecha todas as conexões ociosas; as que estão em uso são fechadas na devolução."""
+        with self._cond:
+            self._fechado = True
+            ociosas = list(self._ociosas)
+            self._ociosas.clear()
+            self._cond.notify_all()
+        for conn, _ in ociosas:
+            self._fechar_conexao(conn)
+
+    # -------------------------------------------------------------------------
+    # Estatísticas
+    # -------------------------------------------------------------------------
+
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "total": self._total,
+                "em_uso": self._em_uso,
+                "ociosas": len(self._ociosas),
+                "aguardando": self._aguardando,
+            })
+        checkouts = stats["checkouts"]
+        stats["tempo_espera_medio_ms"] = (
+            round(stats["tempo_espera_total_ms"] / checkouts, 3) if checkouts else 0.0
+        )
+        stats["tempo_espera_total_ms"] = round(stats["tempo_espera_total_ms"], 3)
+        stats["tempo_espera_max_ms"] = round(stats["tempo_espera_max_ms"], 3)
+        return stats
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Rastreio dos comandos SQL e cabeçalho Server-Timing.
+
+- CursorRastreado (cursor_factory das conexões do pool) mede cada execute: soma o tempo na
+  fase 'execucao' da requisição (metricas.py) e, se passar de 'consulta_lenta_ms', grava uma
+  linha JSON no log de consultas lentas com a impressão digital do SQL, a duração e o
+  número de linhas.
+- Uma fração ('amostra_explain') das consultas lentas de leitura é reexecutada com
+  EXPLAIN (ANALYZE, FORMAT JSON) numa thread separada, com conexão própria, e o plano vai
+  junto na linha do log. Comandos que alteram dados nunca são reexecutados.
+- server_timing() monta o cabeçalho com o tempo da requisição em cada fase, visível na aba
+  Network/Timing das ferramentas de desenvolvedor do navegador.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+import psycopg2
+from flask import has_request_context, request
+from psycopg2 import extensions
+
+import metricas
+
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_RE_PARAMETRO = re.compile(r"%\(\w+\)s|%s")
+_RE_ESPACOS = re.compile(r"\s+")
+# Listas de VALUES expandidas (execute_values): (?, ?), (?, ?), ... -> (?, ?), ...
+_RE_LISTA_VALUES = re.compile(r"(\([?, ]+\))(?:\s*,\s*\([?, ]+\))+")
+_RE_ESCRITA = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|CREATE|ALTER|DROP|LOCK|COPY)\b", re.I)
+
+
+@lru_cache(maxsize=1024)
+def impressao_digital(sql):
+    """SQL normalizado (literais e parâmetros viram ?, espaços colapsados) e um id curto dele."""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    normalizado = _RE_TEXTO.sub('?', sql)
+    normalizado = _RE_PARAMETRO.sub('?', normalizado)
+    normalizado = _RE_NUMERO.sub('?', normalizado)
+    normalizado = _RE_ESPACOS.sub(' ', normalizado).strip().rstrip(';').strip()
+    normalizado = _RE_LISTA_VALUES.sub(r"\1, ...", normalizado)
+    return normalizado, hashlib.md5(normalizado.encode('utf-8')).hexdigest()[:12]
+
+
+def somente_leitura(sql_normalizado):
+    inicio = sql_normalizado.lstrip('( ').split(' ', 1)[0].upper()
+    return inicio in ('SELECT', 'WITH') and not _RE_ESCRITA.search(sql_normalizado)
+
+
+class LogConsultasLentas:
+    """Grava uma linha JSON por consulta lenta (arquivo ou saída padrão)."""
+
+    def __init__(self, consulta_lenta_ms=200.0, amostra_explain=0.0, arquivo=None):
+        self.db_config = None
+        self.configurar(None, consulta_lenta_ms, amostra_explain, arquivo)
+        self._lock = threading.Lock()
+        # Uma thread e no máximo um EXPLAIN pendente: o plano é uma amostra, não pode virar carga
+        self._explicador = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+        self._explicando = threading.Semaphore(1)
+
+    def configurar(self, db_config, consulta_lenta_ms, amostra_explain=0.0, arquivo=None):
+        """db_config: conexão usada pelo EXPLAIN ANALYZE (sem ela, nenhum plano é amostrado)."""
+        self.db_config = db_config
+        self.consulta_lenta_ms = consulta_lenta_ms
+        self.amostra_explain = amostra_explain
+        self.arquivo = arquivo
+
+    def registrar(self, cursor, sql, parametros, duracao_ms):
+        normalizado, id_sql = impressao_digital(sql)
+        registro = {
+            "momento": datetime.now().isoformat(timespec='milliseconds'),
+            "rota": request.url_rule.rule if has_request_context() and request.url_rule else None,
+            "metodo": request.method if has_request_context() else None,
+            "id_sql": id_sql,
+            "sql": normalizado,
+            "duracao_ms": round(duracao_ms, 3),
+            "linhas": cursor.rowcount,
+        }
+        if (self.amostra_explain and self.db_config is not None and cursor.name is None
+                and somente_leitura(normalizado) and random.random() < self.amostra_explain
+                and self._explicando.acquire(blocking=False)):
+            # mogrify já devolve o comando com os parâmetros interpolados pelo psycopg2
+            comando = cursor.mogrify(sql, parametros)
+            self._explicador.submit(self._explicar, registro, comando)
+            return
+        self._gravar(registro)
+
+    def _explicar(self, registro, comando):
+        try:
+            # Cursor comum: o próprio EXPLAIN não entra no rastreio
+            conn = psycopg2.connect(**dict(self.db_config, cursor_factory=extensions.cursor))
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(b"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + comando)
+                    registro["plano"] = cur.fetchone()[0]
+            finally:
+                conn.rollback()
+                conn.close()
+        except psycopg2.Error as e:
+            registro["erro_plano"] = str(e).strip()
+        finally:
+            self._explicando.release()
+        self._gravar(registro)
+
+    def _gravar(self, registro):
+        linha = json.dumps(registro, ensure_ascii=False, default=str)
+        if self.arquivo is None:
+            print(f"Consulta lenta: {linha}")
+            return
+        with self._lock:
+            with open(self.arquivo, 'a', encoding='utf-8') as arquivo:
+                arquivo.write(linha + "\n")
+
+
+log_consultas_lentas = LogConsultasLentas()
+
+
+class CursorRastreado(extensions.cursor):
+    """Cursor psycopg2 que mede cada execute (fase 'execucao' e log de consultas lentas)."""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            duracao = time.perf_counter() - inicio
+            metricas.registrar_comando(duracao)
+            limite = log_consultas_lentas.consulta_lenta_ms
+            if limite is not None and duracao * 1000.0 >= limite:
+                log_consultas_lentas.registrar(self, query, vars, duracao * 1000.0)
+
+
+def server_timing(duracao, fases, comandos):
+    """Valor do cabeçalho Server-Timing: uma métrica por fase (ms) e o total da requisição."""
+    partes = []
+    for fase in metricas.FASES:
+        if fase in fases:
+            parte = f"{fase};dur={fases[fase] * 1000.0:.2f}"
+            if fase == "execucao":
+                parte += f';desc="{comandos} comando(s) SQL"'
+            partes.append(parte)
+    partes.append(f"total;dur={duracao * 1000.0:.2f}")
+    return ", ".join(partes)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Leituras em réplicas do PostgreSQL (streaming replication) para o app.py.
+
+As rotas marcadas com @leitura_em_replica (listagens, /veiculos/disponiveis,
+/emprestimos/ativos, busca e relatórios) pegam as conexões de uma réplica; escritas, login,
+eventos e o resto continuam no primário (DB_CONFIG). Cada réplica tem o seu PoolConexoes.
+
+- Saúde: uma thread verifica cada réplica a cada 'intervalo' segundos. A que não responde,
+  não está recebendo WAL do primário, ou cujo atraso de replicação passa de 'atraso_maximo'
+  segundos, sai do rodízio até uma verificação boa. Sem réplica saudável (ou se a conexão com ela falhar na hora), a leitura
+  vai para o primário.
+- Ler o que escreveu: quem fez uma escrita continua lendo do primário por 'janela_escrita'
+  segundos, para não ver, por exemplo, o veículo que acabou de retirar ainda disponível.
+  Mantenha janela_escrita >= atraso_maximo.
+"""
+import itertools
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+from pool import PoolConexoes
+
+# Se a réplica recebe WAL e o atraso dela em segundos: zero se ela já aplicou tudo o que
+# recebeu do primário, senão a idade da última transação aplicada. Num servidor que não é
+# réplica, sempre recebendo e com atraso zero.
+# Ao religar, a réplica informa como recebido o início do segmento de WAL, que pode ficar
+# atrás do que ela já aplicou: por isso a comparação é <= e não =.
+# Uma réplica sem receptor de WAL (primário fora do ar, rede cortada, receptor parado por
+# wal_receiver_timeout) já aplicou tudo o que recebeu, então o atraso daria zero enquanto os
+# dados envelhecem: ela precisa de um receptor em 'streaming'. Sem pg_read_all_stats
+# (pg_monitor), o usuário só enxerga se o receptor existe, não o status dele.
+SQL_ATRASO_REPLICA = """
+    SELECT pg_is_in_recovery(),
+           NOT pg_is_in_recovery() OR EXISTS (
+               SELECT 1 FROM pg_stat_wal_receiver WHERE coalesce(status, 'streaming') = 'streaming'
+           ),
+           CASE WHEN NOT pg_is_in_recovery()
+                  OR pg_last_wal_receive_lsn() IS NULL
+                  OR pg_last_wal_receive_lsn() <= pg_last_wal_replay_lsn() THEN 0
+                ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END;
+"""
+
+# Segundos para conectar na verificação de saúde (o mínimo aceito pela libpq é 2)
+TIMEOUT_VERIFICACAO = 2
+
+
+class Replica:
+    """Uma réplica: o pool de conexões e o resultado da última verificação."""
+
+    def __init__(self, nome, db_config, pool_config, observador=None):
+        self.nome = nome
+        self.db_config = db_config
+        self._pool_config = pool_config
+        self._observador = observador
+        self.pool = self._criar_pool()
+        # Fora do rodízio até a primeira verificação
+        self.saudavel = False
+        self.atraso = None
+        self.erro = "ainda não verificada"
+        self.verificada_em = None
+
+    def _criar_pool(self):
+        return PoolConexoes(self.db_config, observador=self._observador, **self._pool_config)
+
+
+class RoteadorLeituras:
+    """
+    - replicas: lista de dicionários sobrepostos a db_config (ex.: {"port": "5433"});
+      vazia, tudo fica no primário.
+    - intervalo: segundos entre as verificações de saúde.
+    - atraso_maximo: atraso de replicação (segundos) acima do qual a réplica sai do rodízio.
+    - janela_escrita: segundos que um cliente continua lendo do primário depois de escrever.
+    """
+
+    def __init__(self, replicas, db_config, pool_config, intervalo=5.0, atraso_maximo=5.0,
+                 janela_escrita=10.0, observador=None):
+        self.replicas = [
+            Replica(f"replica-{i + 1}", dict(db_config, **config), pool_config, observador)
+            for i, config in enumerate(replicas)
+        ]
+        self.intervalo = intervalo
+        self.atraso_maximo = atraso_maximo
+        self.janela_escrita = janela_escrita
+        self._lock = threading.Lock()
+        self._rodizio = itertools.count()
+        # Conexão emprestada -> pool de onde ela veio (para a devolução)
+        self._origem = {}
+        self._thread = None
+        self._ultima_escrita = None
+        self._avisadas = set()
+
+    @property
+    def ativo(self):
+        return bool(self.replicas)
+
+    def iniciar(self):
+        """Sobe a thread de verificação na primeira leitura (idempotente)."""
+        with self._lock:
+            if self._thread is not None or not self.replicas:
+                return
+            self._thread = threading.Thread(target=self._verificar_sempre, name='replicas-saude',
+                                            daemon=True)
+            self._thread.start()
+
+    # -------------------------------------------------------------------------
+    # Saúde
+    # -------------------------------------------------------------------------
+
+    def _verificar_sempre(self):
+        while True:
+            self.verificar()
+            time.sleep(self.intervalo)
+
+    def verificar(self):
+        """Verifica todas as réplicas (conexão própria, fora do pool) e atualiza o rodízio."""
+        for replica in self.replicas:
+            try:
+                # Cursor comum: a verificação não entra no rastreio de consultas
+                conn = psycopg2.connect(**dict(replica.db_config, cursor_factory=extensions.cursor,
+                                               connect_timeout=TIMEOUT_VERIFICACAO))
+                try:
+                    conn.autocommit = True
+                    with conn.cursor() as cur:
+                        cur.execute(SQL_ATRASO_REPLICA)
+                        em_recuperacao, recebendo, atraso = cur.fetchone()
+                finally:
+                    conn.close()
+            except psycopg2.Error as e:
+                self._marcar(replica, False, None, str(e).strip())
+                continue
+
+            if not em_recuperacao and replica.nome not in self._avisadas:
+                # Útil em testes com duas instâncias independentes; em produção é um erro de configuração
+                self._avisadas.add(replica.nome)
+                print(f"Réplicas: {replica.nome} não é uma réplica (pg_is_in_recovery = false)")
+
+            atraso = float(atraso)
+            if not recebendo:
+                self._marcar(replica, False, None, "sem receptor de WAL em streaming (replicação parada)")
+            elif atraso > self.atraso_maximo:
+                self._marcar(replica, False, atraso, f"atraso de replicação de {atraso:.1f}s")
+            else:
+                self._marcar(replica, True, atraso, None)
+
+    def _marcar(self, replica, saudavel, atraso, erro):
+        antigo = None
+        with self._lock:
+            mudou = replica.saudavel != saudavel
+            replica.saudavel = saudavel
+            replica.atraso = atraso
+            replica.erro = erro
+            replica.verificada_em = time.time()
+            if mudou and not saudavel:
+                # As conexões ociosas podem estar mortas: a réplica volta com um pool novo
+                antigo, replica.pool = replica.pool, replica._criar_pool()
+        if mudou:
+            print(f"Réplicas: {replica.nome} " + ("voltou ao rodízio" if saudavel else f"fora do rodízio: {erro}"))
+        if antigo is not None:
+            antigo.fechar()
+
+    # -------------------------------------------------------------------------
+    # Conexões
+    # -------------------------------------------------------------------------
+
+    def escolher(self):
+        """Próxima réplica saudável do rodízio (None: ler do primário)."""
+        with self._lock:
+            saudaveis = [replica for replica in self.replicas if replica.saudavel]
+            if not saudaveis:
+                return None
+            return saudaveis[next(self._rodizio) % len(saudaveis)]
+
+    def obter(self, replica):
+        """
+        Retira uma conexão do pool da réplica. Lança PoolEsgotado ou psycopg2.Error, como
+        PoolConexoes.obter; uma falha de conexão tira a réplica do rodízio na hora.
+        """
+        pool = replica.pool
+        try:
+            conn = pool.obter()
+        except psycopg2.Error as e:
+            self._marcar(replica, False, None, str(e).strip())
+            raise
+        with self._lock:
+            self._origem[conn] = pool
+        return conn
+
+    def devolver(self, conn):
+        """Devolve a conexão à réplica de onde veio. Retorna False se ela não é de uma réplica."""
+        with self._lock:
+            pool = self._origem.pop(conn, None)
+        if pool is None:
+            return False
+        pool.devolver(conn)
+        return True
+
+    # -------------------------------------------------------------------------
+    # Escritas recentes
+    # -------------------------------------------------------------------------
+
+    def registrar_escrita(self):
+        self._ultima_escrita = time.monotonic()
+
+    def escrita_recente(self):
+        """Este processo escreveu há menos de janela_escrita segundos?"""
+        return (self._ultima_escrita is not None
+                and time.monotonic() - self._ultima_escrita < self.janela_escrita)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "atraso_maximo": self.atraso_maximo,
+                "janela_escrita": self.janela_escrita,
+                "replicas": [{
+                    "nome": replica.nome,
+                    "host": replica.db_config.get("host"),
+                    "port": replica.db_config.get("port"),
+                    "saudavel": replica.saudavel,
+                    "atraso_s": replica.atraso,
+                    "erro": replica.erro,
+                    "verificada_em": replica.verificada_em,
+                    "pool": replica.pool.estatisticas(),
+                } for replica in self.replicas],
+            }
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturoTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class ServicoSenhasOcupado(Exception):
+    """A fila de hashing está cheia (ou não respondeu a tempo); vira uma resposta 503."""
+
+
+class ServicoSenhas:
+    """
+    Executa o hashing e a verificação de senhas num pool de processos limitado,
+    para que rajadas de login não ocupem as threads que atendem as outras rotas.
+
+    - metodo: método do werkzeug com o custo, ex.: "scrypt:32768:8:1" ou "pbkdf2:sha256:600000".
+    - processos: tamanho do pool (0 = executa na própria thread, útil em desenvolvimento).
+    - fila_maxima: quantas operações podem aguardar além das que estão executando;
+      acima disso a chamada falha na hora com ServicoSenhasOcupado.
+    - timeout: segundos máximos de espera por uma operação.
+    - observador(fase, segundos), se informado, recebe a duração de cada operação ('senha'),
+      incluindo a espera na fila.
+    """
+
+    def __init__(self, metodo="scrypt", processos=2, fila_maxima=32, timeout=10.0, observador=None):
+        self.metodo = metodo
+        self.processos = processos
+        self.timeout = timeout
+        self.observador = observador
+        self._vagas = threading.BoundedSemaphore(max(processos, 1) + fila_maxima)
+        self._executor = None
+        self._lock = threading.Lock()
+        # O werkzeug completa os parâmetros omitidos ("scrypt" -> "scrypt:32768:8:1"):
+        # um hash de referência, gerado aqui mesmo (fora do pool, que pode estar cheio),
+        # dá a forma completa para precisa_rehash comparar.
+        self._prefixo_atual = generate_password_hash("referencia", metodo).split('$', 1)[0]
+
+    def _obter_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.processos)
+            return self._executor
+
+    def _descartar_executor(self, executor):
+        """Um processo filho morreu: descarta o pool para que o próximo pedido crie outro."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _executar(self, funcao, *args):
+        if self.observador is None:
+            return self._executar_no_pool(funcao, *args)
+        inicio = time.perf_counter()
+        try:
+            return self._executar_no_pool(funcao, *args)
+        finally:
+            self.observador("senha", time.perf_counter() - inicio)
+
+    def _executar_no_pool(self, funcao, *args):
+        if self.processos == 0:
+            return funcao(*args)
+
+        if not self._vagas.acquire(blocking=False):
+            raise ServicoSenhasOcupado("Fila de hashing de senhas cheia")
+        executor = self._obter_executor()
+        try:
+            futuro = executor.submit(funcao, *args)
+        except BrokenProcessPool:
+            self._descartar_executor(executor)
+            self._vagas.release()
+            raise ServicoSenhasOcupado("Pool de hashing indisponível")
+        futuro.add_done_callback(lambda _: self._vagas.release())
+
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoTimeout:
+            raise ServicoSenhasOcupado("Hashing de senha excedeu o tempo limite")
+        except BrokenProcessPool:
+            # O processo morreu com a operação em andamento (a vaga já foi liberada pelo callback)
+            self._descartar_executor(executor)
+            raise ServicoSenhasOcupado("Pool de hashing indisponível")
+
+    def gerar_hash(self, senha):
+        return self._executar(generate_password_hash, senha, self.metodo)
+
+    def verificar(self, senha_hash, senha):
+        return self._executar(check_password_hash, senha_hash, senha)
+
+    def precisa_rehash(self, senha_hash):
+        """True se o hash foi gerado com um método/custo diferente do configurado."""
+        return senha_hash.split('$', 1)[0] != self._prefixo_atual
+
+    def encerrar(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
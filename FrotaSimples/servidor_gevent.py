@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor de produção do app.py com greenlets (gevent): muitas conexões simultâneas por
+processo, como milhares de clientes de /eventos ou de polling quase sempre ociosos.
+
+    python servidor_gevent.py [--host 0.0.0.0] [--porta 5000] [--conexoes 2000]
+    gunicorn -k gevent --worker-connections 2000 -w 4 -b 0.0.0.0:5000 servidor_gevent:app
+
+- monkey.patch_all() troca sockets, select, sleep e threading (locks, Condition, local) por
+  versões cooperativas: PoolConexoes, CentralEventos e as métricas por requisição passam a
+  bloquear só o greenlet, e não o processo.
+- psycogreen instala o wait callback do psycopg2: enquanto uma consulta espera o banco, o
+  greenlet cede a vez e o processo atende as outras requisições. Sem ele, uma consulta
+  lenta pararia o worker inteiro.
+- Limites (GEVENT_CONFIG): até 'conexoes' requisições ao mesmo tempo por processo e
+  'pool_maximo' conexões com o banco; quem não consegue uma conexão em
+  POOL_CONFIG["timeout"] segundos recebe 503, como no modo com threads.
+- O hashing de senhas continua no pool de processos de SENHA_CONFIG, fora do loop.
+
+Requer gevent e psycogreen.
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg  # noqa: E402
+
+patch_psycopg()
+
+import argparse  # noqa: E402
+
+from gevent.pool import Pool  # noqa: E402
+from gevent.pywsgi import WSGIServer  # noqa: E402
+
+from config import GEVENT_CONFIG, POOL_CONFIG  # noqa: E402
+
+# Antes de importar o app: os pools (primário e réplicas) são criados na importação
+POOL_CONFIG["maximo"] = max(GEVENT_CONFIG["pool_maximo"], POOL_CONFIG["minimo"])
+
+from app import app, db_pool  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=GEVENT_CONFIG["host"])
+    parser.add_argument('--porta', type=int, default=GEVENT_CONFIG["porta"])
+    parser.add_argument('--conexoes', type=int, default=GEVENT_CONFIG["conexoes"],
+                        help="requisições simultâneas por processo")
+    args = parser.parse_args(argv)
+
+    db_pool.preencher()
+    servidor = WSGIServer((args.host, args.porta), app, spawn=Pool(args.conexoes), log=None)
+    print(f"FrotaSimples em http://{args.host}:{args.porta} (gevent, até {args.conexoes} "
+          f"conexões, pool de {db_pool.maximo} conexões com o banco)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
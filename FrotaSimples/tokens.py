@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Tokens de sessão assinados emitidos pelo /login (JWT com HS256, só biblioteca padrão).
+
+- Acesso: curto (acesso_ttl), enviado em 'Authorization: Bearer <token>' nas rotas
+  protegidas. Verificar é checar a assinatura HMAC e a validade, sem ir ao banco.
+- Renovação: longo (renovacao_ttl), trocado por um par novo em POST /login/renovar.
+- Cada token leva a versão da senha do usuário ('ver', coluna usuarios.versao_senha). A troca
+  de senha incrementa a versão e chama invalidar_usuario(): os tokens antigos deixam de valer.
+
+O app.py verifica com verificar() e o app_async.py com verificar_assincrono(), que aguarda
+um carregar_usuario assíncrono; os dois usam as mesmas regras e os mesmos caches.
+
+Dois caches em memória do processo evitam o trabalho repetido:
+- tokens já validados (assinatura e conteúdo), até max_tokens, cada um até a sua expiração;
+- usuários (id, nome, email, funcionario_id, versao_senha), até max_usuarios, por usuarios_ttl
+  segundos, carregados do banco por carregar_usuario(usuario_id) só na falta.
+Com vários processos, a invalidação vale na hora só no processo que trocou a senha; nos
+outros, o token antigo é recusado quando o usuário sai do cache (até usuarios_ttl segundos).
+"""
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Cabeçalho fixo: tokens com outro algoritmo (inclusive "none") são recusados
+CABECALHO = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b'=').decode('ascii')
+
+TIPO_ACESSO = "acesso"
+TIPO_RENOVACAO = "renovacao"
+
+
+class TokenInvalido(Exception):
+    """Token ausente, malformado, com assinatura errada, expirado ou revogado; vira uma resposta 401."""
+
+
+def token_do_cabecalho(authorization):
+    """Token de 'Authorization: Bearer <token>'; TokenInvalido se o cabeçalho não tem um."""
+    esquema, _, token = (authorization or '').partition(' ')
+    if esquema.lower() != 'bearer' or not token.strip():
+        raise TokenInvalido("Token de acesso ausente")
+    return token.strip()
+
+
+def _b64(dados):
+    return base64.urlsafe_b64encode(dados).rstrip(b'=').decode('ascii')
+
+
+def _de_b64(texto):
+    return base64.urlsafe_b64decode(texto + '=' * (-len(texto) % 4))
+
+
+class ServicoTokens:
+    """
+    - segredo: chave do HMAC (None = aleatória, válida só neste processo e até reiniciar).
+    - acesso_ttl, renovacao_ttl: validade em segundos dos tokens de acesso e de renovação.
+    - carregar_usuario(usuario_id): dicionário com ao menos 'versao_senha', ou None se o
+      usuário não existe. Pode lançar exceções (ex.: psycopg2.Error), repassadas a quem chamou.
+      Com verificar_assincrono, é uma corrotina (async def).
+    """
+
+    def __init__(self, carregar_usuario, segredo=None, acesso_ttl=900, renovacao_ttl=604800,
+                 max_tokens=10000, usuarios_ttl=60.0, max_usuarios=1000):
+        if not segredo:
+            print("Tokens: sem 'segredo' configurado; usando um aleatório (os tokens não valem "
+                  "em outros processos nem depois de reiniciar)")
+            segredo = secrets.token_hex(32)
+        self._chave = segredo.encode('utf-8') if isinstance(segredo, str) else segredo
+        self.carregar_usuario = carregar_usuario
+        self.acesso_ttl = acesso_ttl
+        self.renovacao_ttl = renovacao_ttl
+        self.max_tokens = max_tokens
+        self.usuarios_ttl = usuarios_ttl
+        self.max_usuarios = max_usuarios
+        self._tokens = OrderedDict()
+        self._usuarios = OrderedDict()
+        # Incrementada a cada invalidação: um carregamento que começou antes não entra no cache
+        self._geracao = 0
+        self._lock = threading.Lock()
+        self._stats = {"tokens_hits": 0, "tokens_misses": 0, "usuarios_hits": 0,
+                       "usuarios_misses": 0, "recusados": 0, "invalidacoes": 0}
+
+    # -------------------------------------------------------------------------
+    # Emissão
+    # -------------------------------------------------------------------------
+
+    def _assinar(self, conteudo):
+        corpo = CABECALHO + '.' + _b64(json.dumps(conteudo, separators=(',', ':')).encode('utf-8'))
+        assinatura = hmac.new(self._chave, corpo.encode('ascii'), hashlib.sha256).digest()
+        return corpo + '.' + _b64(assinatura)
+
+    def emitir(self, usuario_id, versao_senha):
+        """Par de tokens (acesso e renovação) para a resposta do /login."""
+        agora = int(time.time())
+        base = {"sub": str(usuario_id), "ver": versao_senha, "iat": agora}
+        return {
+            "token_acesso": self._assinar(dict(base, tipo=TIPO_ACESSO, exp=agora + self.acesso_ttl)),
+            "token_renovacao": self._assinar(dict(base, tipo=TIPO_RENOVACAO, exp=agora + self.renovacao_ttl)),
+            "tipo_token": "Bearer",
+            "expira_em": self.acesso_ttl,
+        }
+
+    # -------------------------------------------------------------------------
+    # Verificação
+    # -------------------------------------------------------------------------
+
+    def _decodificar(self, token):
+        """Confere o formato e a assinatura; retorna o conteúdo (sem checar a validade)."""
+        try:
+            cabecalho, conteudo, assinatura = token.split('.')
+        except (AttributeError, ValueError):
+            raise TokenInvalido("Token malformado")
+        if cabecalho != CABECALHO:
+            raise TokenInvalido("Algoritmo de assinatura não suportado")
+        esperada = hmac.new(self._chave, (cabecalho + '.' + conteudo).encode('ascii'), hashlib.sha256).digest()
+        try:
+            valida = hmac.compare_digest(_de_b64(assinatura), esperada)
+            dados = json.loads(_de_b64(conteudo)) if valida else None
+        except (ValueError, UnicodeError):
+            raise TokenInvalido("Token malformado")
+        if not valida:
+            raise TokenInvalido("Assinatura inválida")
+        if not isinstance(dados, dict) or not all(campo in dados for campo in ("sub", "ver", "tipo", "exp")):
+            raise TokenInvalido("Token malformado")
+        return dados
+
+    def _conteudo(self, token):
+        """Conteúdo de um token de assinatura válida, do cache de tokens se já foi visto."""
+        with self._lock:
+            dados = self._tokens.get(token)
+            if dados is not None:
+                self._tokens.move_to_end(token)
+                self._stats["tokens_hits"] += 1
+                return dados
+            self._stats["tokens_misses"] += 1
+
+        dados = self._decodificar(token)
+        with self._lock:
+            self._tokens[token] = dados
+            while len(self._tokens) > self.max_tokens:
+                self._tokens.popitem(last=False)
+        return dados
+
+    def _conferir(self, token, tipo):
+        """Conteúdo de um token de assinatura válida, do tipo pedido e ainda na validade."""
+        dados = self._conteudo(token)
+        if dados["tipo"] != tipo:
+            raise TokenInvalido("Tipo de token incorreto")
+        if dados["exp"] <= time.time():
+            with self._lock:
+                self._tokens.pop(token, None)
+            raise TokenInvalido("Token expirado")
+        return dados
+
+    @staticmethod
+    def _conferir_versao(usuario, dados):
+        if usuario is None or usuario["versao_senha"] != dados["ver"]:
+            raise TokenInvalido("Token revogado")
+        return usuario
+
+    def verificar(self, token, tipo=TIPO_ACESSO):
+        """
+        Retorna o usuário (dicionário do cache; não altere) dono de um token válido do tipo
+        pedido. Lança TokenInvalido; erros de carregar_usuario passam adiante.
+        """
+        try:
+            dados = self._conferir(token, tipo)
+            return self._conferir_versao(self.usuario(int(dados["sub"])), dados)
+        except TokenInvalido:
+            self._stats["recusados"] += 1
+            raise
+
+    async def verificar_assincrono(self, token, tipo=TIPO_ACESSO):
+        """verificar() com carregar_usuario assíncrono, aguardado só na falta no cache."""
+        try:
+            dados = self._conferir(token, tipo)
+            usuario_id = int(dados["sub"])
+            usuario, geracao = self._usuario_em_cache(usuario_id)
+            if usuario is None:
+                usuario = await self.carregar_usuario(usuario_id)
+                self._guardar_usuario(usuario_id, usuario, geracao)
+            return self._conferir_versao(usuario, dados)
+        except TokenInvalido:
+            self._stats["recusados"] += 1
+            raise
+
+    # -------------------------------------------------------------------------
+    # Cache de usuários
+    # -------------------------------------------------------------------------
+
+    def usuario(self, usuario_id):
+        usuario, geracao = self._usuario_em_cache(usuario_id)
+        if usuario is None:
+            usuario = self.carregar_usuario(usuario_id)
+            self._guardar_usuario(usuario_id, usuario, geracao)
+        return usuario
+
+    def _usuario_em_cache(self, usuario_id):
+        """(usuário, None) num acerto; (None, geração atual) na falta, para _guardar_usuario."""
+        with self._lock:
+            item = self._usuarios.get(usuario_id)
+            if item is not None and item[1] > time.monotonic():
+                self._usuarios.move_to_end(usuario_id)
+                self._stats["usuarios_hits"] += 1
+                return item[0], None
+            self._stats["usuarios_misses"] += 1
+            return None, self._geracao
+
+    def _guardar_usuario(self, usuario_id, usuario, geracao):
+        if usuario is None:
+            return
+        with self._lock:
+            if geracao == self._geracao:
+                self._usuarios[usuario_id] = (usuario, time.monotonic() + self.usuarios_ttl)
+                self._usuarios.move_to_end(usuario_id)
+                while len(self._usuarios) > self.max_usuarios:
+                    self._usuarios.popitem(last=False)
+
+    def invalidar_usuario(self, usuario_id):
+        """Chamada depois da troca de senha: o próximo token do usuário é conferido no banco."""
+        with self._lock:
+            self._usuarios.pop(usuario_id, None)
+            self._geracao += 1
+            self._stats["invalidacoes"] += 1
+
+    def estatisticas(self):
+        with self._lock:
+            return dict(self._stats, tokens_em_cache=len(self._tokens), usuarios_em_cache=len(self._usuarios))
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+Validação dos corpos (JSON) e dos filtros (query string) das rotas.
+
+As funções não dependem do framework: recebem o dicionário já decodificado (ou
+request.args) e são usadas tanto pela aplicação síncrona (app.py) quanto pela
+assíncrona (app_async.py), para que as duas aceitem e recusem exatamente as mesmas
+requisições, com as mesmas mensagens.
+"""
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from consultas import COLUNAS_USUARIOS, COLUNAS_FUNCIONARIOS, COLUNAS_VEICULOS, COLUNAS_EMPRESTIMOS
+from paginacao import (
+    ParametroInvalido, ler_limite, ler_inteiro, ler_booleano, ler_data, ler_dia, ler_campos,
+    decodificar_cursor, data_iso
+)
+
+# Tamanho padrão dos rankings de /relatorios/uso/veiculos e /relatorios/uso/funcionarios
+RANKING_PADRAO = 20
+# Resultados padrão de GET /busca e o tamanho aceito para o termo
+BUSCA_PADRAO = 10
+BUSCA_TERMO_MINIMO = 2
+BUSCA_TERMO_MAXIMO = 100
+TIPOS_BUSCA = ('veiculo', 'funcionario')
+# Máximo de veículos num único PATCH /veiculos/status
+STATUS_LOTE_MAXIMO = 100000
+# Maior valor de uma coluna INTEGER (SERIAL) do PostgreSQL
+INTEIRO_MAXIMO = 2**31 - 1
+# Máximo de itens em POST /emprestimos/lote e PATCH /emprestimos/finalizar-lote
+LOTE_EMPRESTIMOS_MAXIMO = 1000
+# Itens por página de GET /arquivo/emprestimos/<AAAA-MM> sem ?limit=
+ARQUIVO_PAGINA_PADRAO = 100
+# Modos dos lotes de empréstimos: nada é gravado se um item for recusado, ou grava os aceitos
+MODOS_LOTE = ('atomico', 'parcial')
+
+
+class DadosInvalidos(ValueError):
+    """Corpo da requisição incompleto ou inválido; vira uma resposta 400."""
+
+
+# =============================================================================
+# CORPOS DAS REQUISIÇÕES
+# =============================================================================
+
+def validar_usuario(data):
+    """Retorna (nome, email, senha, funcionario_id)."""
+    if not data or 'nome' not in data or 'email' not in data or 'senha' not in data:
+        raise DadosInvalidos("Dados incompletos (nome, email, senha são obrigatórios)")
+    return data['nome'], data['email'], data['senha'], data.get('funcionario_id')
+
+
+def validar_login(data):
+    """Retorna (email, senha)."""
+    if not data or 'email' not in data or 'senha' not in data:
+        raise DadosInvalidos("Email e senha são obrigatórios")
+    return data['email'], data['senha']
+
+
+def validar_renovacao(data):
+    """Retorna o token de renovação (POST /login/renovar)."""
+    if not data or not isinstance(data.get('token_renovacao'), str):
+        raise DadosInvalidos("O token de renovação é obrigatório")
+    return data['token_renovacao']
+
+
+def validar_troca_senha(data):
+    """Retorna (senha_atual ou None, nova_senha)."""
+    if not data or 'nova_senha' not in data:
+        raise DadosInvalidos("A nova senha é obrigatória")
+    return data.get('senha_atual'), data['nova_senha']
+
+
+def validar_funcionario(data):
+    """Retorna (nome, matricula, cargo)."""
+    if not data or 'nome' not in data or 'matricula' not in data or 'cargo' not in data:
+        raise DadosInvalidos("Dados incompletos (nome, matricula, cargo)")
+    return data['nome'], data['matricula'], data['cargo']
+
+
+def validar_veiculo(data):
+    """Retorna (modelo, marca, ano, placa, tipo), com a placa em maiúsculas."""
+    if not data or not all(campo in data for campo in ('modelo', 'marca', 'ano', 'placa', 'tipo')):
+        raise DadosInvalidos("Dados incompletos (modelo, marca, ano, placa e tipo são obrigatórios)")
+    return data['modelo'], data['marca'], data['ano'], data['placa'].upper(), data['tipo']
+
+
+def validar_status_veiculo(data):
+    """Retorna o novo valor de 'ativo'."""
+    if not data or 'ativo' not in data:
+        raise DadosInvalidos("Campo 'ativo' é obrigatório (true ou false)")
+    if not isinstance(data['ativo'], bool):
+        raise DadosInvalidos("O campo 'ativo' deve ser um booleano (true ou false)")
+    return data['ativo']
+
+
+def validar_status_lote(data):
+    """
+    Corpo de PATCH /veiculos/status. Aceita:
+    - {"veiculos": [{"id": 1, "ativo": false}, ...]}: retorna ('lista', ids, ativos), com um id
+      repetido valendo pela última ocorrência;
+    - {"ativo": false, "tipo": ..., "marca": ...} (tipo e/ou marca): retorna
+      ('filtro', ativo, {"tipo", "marca"}).
+    """
+    if not isinstance(data, dict) or not data:
+        raise DadosInvalidos("Envie {'veiculos': [{'id', 'ativo'}, ...]} ou {'ativo', 'tipo' e/ou 'marca'}")
+
+    if 'veiculos' in data:
+        pares = data['veiculos']
+        if not isinstance(pares, list) or not pares:
+            raise DadosInvalidos("'veiculos' deve ser uma lista não vazia de {id, ativo}")
+        if len(pares) > STATUS_LOTE_MAXIMO:
+            raise DadosInvalidos(f"Máximo de {STATUS_LOTE_MAXIMO} veículos por requisição")
+        novos = {}
+        for posicao, par in enumerate(pares, start=1):
+            if not isinstance(par, dict) or 'id' not in par or 'ativo' not in par:
+                raise DadosInvalidos(f"Item {posicao}: 'id' e 'ativo' são obrigatórios")
+            if not isinstance(par['id'], int) or isinstance(par['id'], bool) or not 0 < par['id'] <= INTEIRO_MAXIMO:
+                raise DadosInvalidos(f"Item {posicao}: o 'id' deve ser um inteiro positivo")
+            if not isinstance(par['ativo'], bool):
+                raise DadosInvalidos(f"Item {posicao}: o campo 'ativo' deve ser um booleano (true ou false)")
+            novos[par['id']] = par['ativo']
+        return 'lista', list(novos), list(novos.values())
+
+    ativo = validar_status_veiculo(data)
+    filtros = {campo: data.get(campo) for campo in ('tipo', 'marca')}
+    if not any(filtros.values()):
+        raise DadosInvalidos("Informe 'veiculos' ou ao menos um filtro ('tipo', 'marca')")
+    return 'filtro', ativo, filtros
+
+
+def validar_emprestimo(data):
+    """Retorna os parâmetros de consultas.SQL_REGISTRAR_EMPRESTIMO."""
+    # Validação de campos obrigatórios para o registro de saída
+    required_fields = ['veiculo_id', 'funcionario_id', 'data_saida', 'km_saida']
+    if not data or not all(field in data for field in required_fields):
+        raise DadosInvalidos(f"Dados incompletos. Campos obrigatórios: {', '.join(required_fields)}")
+    return {
+        "veiculo_id": data['veiculo_id'],
+        "funcionario_id": data['funcionario_id'],
+        "data_saida": data['data_saida'],
+        "km_saida": data['km_saida'],
+        "observacao": data.get('observacao')
+    }
+
+
+def validar_finalizacao(data):
+    """Retorna os parâmetros de consultas.SQL_FINALIZAR_EMPRESTIMO (sem o id)."""
+    if not data or 'data_retorno' not in data or 'km_retorno' not in data:
+        raise DadosInvalidos("Dados incompletos (data_retorno e km_retorno são obrigatórios)")
+    try:
+        float(data['km_retorno'])
+    except (TypeError, ValueError):
+        raise DadosInvalidos("A quilometragem de retorno deve ser um número")
+    return {
+        "data_retorno": data['data_retorno'],
+        "km_retorno": data['km_retorno'],
+        "observacao": data.get('observacao') or None
+    }
+
+
+# =============================================================================
+# LOTES DE EMPRÉSTIMOS
+# =============================================================================
+# Os itens vão ao banco como arrays (um por campo), e um valor que o PostgreSQL não
+# converta derrubaria o comando inteiro; por isso cada item já sai daqui com os tipos finais.
+
+def _inteiro_positivo(valor, campo):
+    if not isinstance(valor, int) or isinstance(valor, bool) or not 0 < valor <= INTEIRO_MAXIMO:
+        raise DadosInvalidos(f"'{campo}' deve ser um inteiro positivo")
+    return valor
+
+
+def _quilometragem(valor, campo):
+    """NUMERIC(10, 2): finito e abaixo de 100 milhões."""
+    try:
+        km = Decimal(str(valor)) if not isinstance(valor, bool) else None
+    except InvalidOperation:
+        km = None
+    if km is None or not km.is_finite() or abs(km) >= 10**8:
+        raise DadosInvalidos(f"'{campo}' deve ser um número")
+    return km
+
+
+def _data_hora(valor, campo):
+    """AAAA-MM-DD[THH:MM[:SS]]; um fuso, se houver, é ignorado, como no cast para TIMESTAMP."""
+    try:
+        return datetime.fromisoformat(valor).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        raise DadosInvalidos(f"'{campo}' deve ser uma data/hora ISO 8601 (AAAA-MM-DDTHH:MM:SS)")
+
+
+def _texto(valor):
+    return None if valor is None else str(valor)
+
+
+def validar_emprestimo_lote(data):
+    """validar_emprestimo, com os tipos de consultas.SQL_REGISTRAR_EMPRESTIMOS_LOTE."""
+    params = validar_emprestimo(data)
+    return {
+        "veiculo_id": _inteiro_positivo(params["veiculo_id"], 'veiculo_id'),
+        "funcionario_id": _inteiro_positivo(params["funcionario_id"], 'funcionario_id'),
+        "data_saida": _data_hora(params["data_saida"], 'data_saida'),
+        "km_saida": _quilometragem(params["km_saida"], 'km_saida'),
+        "observacao": _texto(params["observacao"]),
+    }
+
+
+def validar_finalizacao_lote(data):
+    """validar_finalizacao com o id do empréstimo no item, com os tipos de SQL_FINALIZAR_EMPRESTIMOS_LOTE."""
+    params = validar_finalizacao(data)
+    if 'id' not in data:
+        raise DadosInvalidos("O 'id' do empréstimo é obrigatório")
+    return {
+        "id": _inteiro_positivo(data['id'], 'id'),
+        "data_retorno": _data_hora(params["data_retorno"], 'data_retorno'),
+        "km_retorno": _quilometragem(params["km_retorno"], 'km_retorno'),
+        "observacao": _texto(params["observacao"]),
+    }
+
+
+def validar_lote_emprestimos(data, validar_item):
+    """
+    Corpo de POST /emprestimos/lote e PATCH /emprestimos/finalizar-lote:
+    {"modo": "atomico" (padrão) | "parcial", "emprestimos": [...]}.
+    Retorna (modo, total, itens, erros): itens = [(número do item, parâmetros)] dos itens
+    aceitos por validar_item e erros = [{"item", "erro"}] dos recusados (itens começam em 1).
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('emprestimos'), list) or not data['emprestimos']:
+        raise DadosInvalidos("Envie {'emprestimos': [...]} com ao menos um item")
+    modo = data.get('modo', 'atomico')
+    if modo not in MODOS_LOTE:
+        raise DadosInvalidos("'modo' deve ser 'atomico' ou 'parcial'")
+    if len(data['emprestimos']) > LOTE_EMPRESTIMOS_MAXIMO:
+        raise DadosInvalidos(f"Máximo de {LOTE_EMPRESTIMOS_MAXIMO} empréstimos por requisição")
+
+    itens = []
+    erros = []
+    for numero, item in enumerate(data['emprestimos'], start=1):
+        try:
+            if not isinstance(item, dict):
+                raise DadosInvalidos("Cada item deve ser um objeto JSON")
+            itens.append((numero, validar_item(item)))
+        except DadosInvalidos as e:
+            erros.append({"item": numero, "erro": str(e)})
+    return modo, len(data['emprestimos']), itens, erros
+
+
+# =============================================================================
+# LINHAS DE IMPORTAÇÃO EM LOTE
+# =============================================================================
+
+def linha_funcionario(registro):
+    """Converte um registro da importação em (nome, matricula, cargo)."""
+    if not isinstance(registro, dict) or not all(registro.get(campo) for campo in ('nome', 'matricula', 'cargo')):
+        raise DadosInvalidos("Dados incompletos (nome, matricula, cargo)")
+    return registro['nome'], str(registro['matricula']), registro['cargo']
+
+
+def linha_veiculo(registro):
+    """Converte um registro da importação em (modelo, marca, ano, placa, tipo)."""
+    if not isinstance(registro, dict) or not all(registro.get(campo) for campo in ('modelo', 'marca', 'ano', 'placa', 'tipo')):
+        raise DadosInvalidos("Dados incompletos (modelo, marca, ano, placa e tipo são obrigatórios)")
+    try:
+        ano = int(registro['ano'])
+    except (TypeError, ValueError):
+        raise DadosInvalidos("O ano do veículo não é válido (deve ser >= 1900)")
+    return registro['modelo'], registro['marca'], ano, str(registro['placa']).upper(), registro['tipo']
+
+
+# =============================================================================
+# FILTROS DAS LISTAGENS
+# =============================================================================
+
+def ler_pagina_por_id(args):
+    """limit e after de listagens ordenadas por id. Retorna {'limite', 'cursor'}."""
+    return {
+        "limite": ler_limite(args),
+        "cursor": decodificar_cursor(args.get('after'), [int]),
+    }
+
+
+def ler_filtros_usuarios(args):
+    filtros = ler_pagina_por_id(args)
+    filtros["campos"] = ler_campos(args, COLUNAS_USUARIOS)
+    return filtros
+
+
+def ler_filtros_funcionarios(args):
+    filtros = ler_pagina_por_id(args)
+    filtros["campos"] = ler_campos(args, COLUNAS_FUNCIONARIOS)
+    return filtros
+
+
+def ler_filtros_veiculos(args):
+    filtros = ler_pagina_por_id(args)
+    filtros.update({
+        "campos": ler_campos(args, COLUNAS_VEICULOS),
+        "ativo": ler_booleano(args, 'ativo'),
+        "tipo": args.get('tipo'),
+        "marca": args.get('marca'),
+    })
+    return filtros
+
+
+def ler_filtros_emprestimos(args):
+    filtros = {
+        "limite": ler_limite(args),
+        "cursor": decodificar_cursor(args.get('after'), [data_iso, int]),
+        "veiculo_id": ler_inteiro(args, 'veiculo_id'),
+        "funcionario_id": ler_inteiro(args, 'funcionario_id'),
+        "data_inicio": ler_data(args, 'data_inicio'),
+        "data_fim": ler_data(args, 'data_fim', fim_do_dia=True),
+        "status": args.get('status'),
+        "campos": ler_campos(args, COLUNAS_EMPRESTIMOS),
+    }
+    if filtros["status"] not in (None, 'abertos', 'finalizados'):
+        raise ParametroInvalido("'status' deve ser 'abertos' ou 'finalizados'")
+    return filtros
+
+
+def ler_filtros_arquivo(mes, args):
+    """
+    mes (AAAA-MM, do caminho), veiculo_id, funcionario_id, fields e paginação (limit, padrão
+    ARQUIVO_PAGINA_PADRAO; after, na ordem crescente de data_saida e id).
+    """
+    mes = ler_dia({'mes': mes}, 'mes')
+    return {
+        "mes": mes.replace(day=1),
+        "limite": ler_limite(args) or ARQUIVO_PAGINA_PADRAO,
+        "cursor": decodificar_cursor(args.get('after'), [data_iso, int]),
+        "veiculo_id": ler_inteiro(args, 'veiculo_id'),
+        "funcionario_id": ler_inteiro(args, 'funcionario_id'),
+        "campos": ler_campos(args, COLUNAS_EMPRESTIMOS),
+    }
+
+
+def ler_filtros_uso(args):
+    """agrupar (dia | mes), inicio e fim (inclusivos, AAAA-MM-DD ou AAAA-MM)."""
+    agrupar = args.get('agrupar', 'dia')
+    if agrupar not in ('dia', 'mes'):
+        raise ParametroInvalido("'agrupar' deve ser 'dia' ou 'mes'")
+    inicio = ler_dia(args, 'inicio')
+    fim = ler_dia(args, 'fim', fim_do_mes=True)
+    if agrupar == 'mes':
+        # Os meses são guardados pelo primeiro dia
+        inicio = inicio and inicio.replace(day=1)
+        fim = fim and fim.replace(day=1)
+    return {"agrupar": agrupar, "inicio": inicio, "fim": fim}
+
+
+def ler_ranking_uso(args):
+    """mes (AAAA-MM, padrão: mês atual) e limit (padrão RANKING_PADRAO)."""
+    mes = ler_dia(args, 'mes') or date.today()
+    return {"mes": mes.replace(day=1), "limite": ler_limite(args) or RANKING_PADRAO}
+
+
+def ler_busca(args):
+    """q (termo, em minúsculas), tipo (veiculo | funcionario; padrão: os dois) e limit."""
+    termo = ' '.join((args.get('q') or '').split()).lower()
+    if not BUSCA_TERMO_MINIMO <= len(termo) <= BUSCA_TERMO_MAXIMO:
+        raise ParametroInvalido(
+            f"'q' deve ter entre {BUSCA_TERMO_MINIMO} e {BUSCA_TERMO_MAXIMO} caracteres"
+        )
+    tipo = args.get('tipo')
+    if tipo is not None and tipo not in TIPOS_BUSCA:
+        raise ParametroInvalido("'tipo' deve ser 'veiculo' ou 'funcionario'")
+    return {
+        "termo": termo,
+        "tipos": (tipo,) if tipo else TIPOS_BUSCA,
+        "limite": ler_limite(args) or BUSCA_PADRAO,
+    }
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import functools
+import hashlib
+
+import psycopg2
+from flask import Response, make_response, request
+
+SQL_VERSOES = "SELECT tabela, versao FROM versoes_tabelas WHERE tabela = ANY(%s);"
+
+
+def calcular_etag(caminho, variante, versoes):
+    """ETag de uma resposta: URL completa, formato pedido e versões das tabelas lidas."""
+    partes = [caminho, str(variante if variante is not None else '')]
+    partes += [f"{tabela}={versao}" for tabela, versao in sorted(versoes.items())]
+    return hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+class ControleVersoes:
+    """
+    GETs condicionais (ETag / If-None-Match) baseados na versão das tabelas.
+
+    A versão de cada tabela fica em 'versoes_tabelas' e é incrementada por um trigger de
+    comando (migracoes/0003_versoes_tabelas.sql) a cada INSERT/UPDATE/DELETE, então vale
+    para todos os workers. A ETag de uma resposta combina a URL, o formato pedido e as versões das
+    tabelas que a rota lê; se o cliente já tem essa ETag, a resposta é 304 sem executar
+    a consulta principal nem serializar JSON.
+    """
+
+    def __init__(self, obter_conexao, liberar_conexao):
+        self._obter_conexao = obter_conexao
+        self._liberar_conexao = liberar_conexao
+
+    def versoes(self, tabelas):
+        """Retorna {tabela: versao} (None se não foi possível consultar)."""
+        conn = self._obter_conexao()
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute(SQL_VERSOES, (list(tabelas),))
+                versoes = dict(cur.fetchall())
+            return {tabela: versoes.get(tabela, 0) for tabela in tabelas}
+        except psycopg2.Error as e:
+            print(f"Erro ao consultar versoes_tabelas: {e}")
+            return None
+        finally:
+            self._liberar_conexao(conn)
+
+    def condicional(self, *tabelas, variante=None):
+        """
+        Decorador de rota GET. 'variante' é uma função opcional cujo valor entra na ETag
+        (ex.: quer_ndjson, para JSON e NDJSON não compartilharem a mesma ETag).
+        """
+        def decorador(rota):
+            @functools.wraps(rota)
+            def envoltorio(*args, **kwargs):
+                versoes = self.versoes(tabelas)
+                if versoes is None:
+                    # Sem versões (tabela ausente ou banco indisponível): resposta normal, sem ETag
+                    return rota(*args, **kwargs)
+
+                etag = calcular_etag(request.full_path, variante() if variante else None, versoes)
+
+                if request.if_none_match.contains(etag):
+                    resposta = Response(status=304)
+                    resposta.set_etag(etag)
+                    return resposta
+
+                resposta = make_response(rota(*args, **kwargs))
+                if resposta.status_code == 200:
+                    resposta.set_etag(etag)
+                return resposta
+            return envoltorio
+        return decorador
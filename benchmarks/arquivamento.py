@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Teste de integração do histórico particionado e do arquivo (FrotaSimples/arquivamento.py,
+migração 0008).
+
+    python benchmarks/arquivamento.py [--emprestimos 300000] [--reter 2] [--pg-bin DIR | --servidor-existente]
+
+1. sobe um banco descartável (como a suíte de carga), aplica as migrações e popula um
+   histórico de alguns meses (um empréstimo a cada 2 minutos desde 2015-01);
+2. mede as consultas quentes (primeira página de GET /emprestimos, por veículo, busca por id
+   da finalização) com todas as partições;
+3. guarda o que GET /emprestimos e /relatorios/uso devolvem para um mês antigo, arquiva
+   tudo menos os --reter últimos meses com dados e verifica que:
+   - as partições saíram do banco e os meses estão em emprestimos_arquivados;
+   - a ETag de GET /emprestimos mudou (DETACH não dispara o gatilho de versão);
+   - GET /arquivo/emprestimos/<AAAA-MM> devolve os mesmos empréstimos, com os mesmos
+     valores, paginando pelo cursor; 404 para mês fora do arquivo;
+   - um mês com empréstimos abertos não é arquivado;
+   - recalcular-uso não perde os resumos dos meses arquivados;
+4. mede de novo as consultas quentes, agora com menos partições.
+
+Termina com código 1 se alguma verificação falhar.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+import psycopg2
+
+from carga import DIRETORIO_APP, BancoTemporario, PostgresTemporario, popular
+
+sys.path.insert(0, DIRETORIO_APP)
+
+import arquivamento  # noqa: E402
+import migrar  # noqa: E402
+from config import ARQUIVO_CONFIG  # noqa: E402
+
+CONSULTAS_QUENTES = [
+    ("GET /emprestimos?limit=100",
+     "SELECT id FROM emprestimos ORDER BY data_saida DESC, id DESC LIMIT 101", None),
+    ("GET /emprestimos?veiculo_id=&limit=100",
+     "SELECT id FROM emprestimos WHERE veiculo_id = 42 ORDER BY data_saida DESC, id DESC LIMIT 101", None),
+    ("busca por id (finalizar)",
+     "SELECT id FROM emprestimos WHERE id = (SELECT max(id) FROM emprestimos) FOR UPDATE", None),
+]
+
+
+def medir_consultas(db_config, repeticoes):
+    """Mediana em ms de cada consulta quente e o número de partições anexadas."""
+    conn = psycopg2.connect(**db_config)
+    try:
+        resultados = {}
+        with conn.cursor() as cur:
+            for nome, sql, params in CONSULTAS_QUENTES:
+                tempos = []
+                for _ in range(repeticoes):
+                    inicio = time.perf_counter()
+                    cur.execute(sql, params)
+                    cur.fetchall()
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                    conn.rollback()
+                resultados[nome] = statistics.median(tempos)
+        particoes = len(arquivamento.particoes_mensais(conn))
+    finally:
+        conn.close()
+    return resultados, particoes
+
+
+def paginas(cliente, caminho, limite):
+    """Todos os itens de uma listagem paginada por X-Proximo-Cursor."""
+    itens = []
+    url = f"{caminho}{'&' if '?' in caminho else '?'}limit={limite}"
+    while True:
+        resposta = cliente.get(url)
+        if resposta.status_code != 200:
+            return None
+        itens.extend(resposta.get_json())
+        proximo = resposta.headers.get('X-Proximo-Cursor')
+        if not proximo:
+            return itens
+        url = f"{caminho}{'&' if '?' in caminho else '?'}limit={limite}&after={proximo}"
+
+
+def executar(args):
+    falhas = []
+
+    def verificar(descricao, condicao):
+        print(f"{'ok' if condicao else 'FALHA':5}  {descricao}")
+        if not condicao:
+            falhas.append(descricao)
+
+    diretorio = tempfile.mkdtemp(prefix='frota_arquivo_')
+    banco = BancoTemporario() if args.servidor_existente else PostgresTemporario(args.pg_bin)
+    try:
+        with banco as db_config:
+            popular(db_config, veiculos=200, funcionarios=100, emprestimos=args.emprestimos, abertos=50)
+            conn = psycopg2.connect(**db_config)
+            migrar.recalcular_uso(conn)
+
+            antes, particoes_antes = medir_consultas(db_config, args.repeticoes)
+
+            # Meses com dados, do mais antigo ao mais recente; o último tem os abertos
+            with conn.cursor() as cur:
+                cur.execute("SELECT DISTINCT date_trunc('month', data_saida)::date FROM emprestimos ORDER BY 1;")
+                meses = [row[0] for row in cur.fetchall()]
+                cur.execute("SELECT count(*) FROM emprestimos;")
+                total = cur.fetchone()[0]
+                cur.execute("SELECT dimensao, chave, mes, emprestimos, km, segundos FROM uso_mensal ORDER BY 1, 2, 3;")
+                uso_antes = cur.fetchall()
+            conn.rollback()
+            corte = meses[-args.reter]
+            amostra = meses[1]
+
+            ARQUIVO_CONFIG["diretorio"] = diretorio
+            import app as frota
+            frota.db_pool.db_config.update(db_config)
+            cliente = frota.app.test_client()
+
+            # Do dia 1 ao 28 do mês de amostra: no arquivo (em ordem crescente) eles vêm primeiro
+            filtro = f"veiculo_id=7&data_inicio={amostra:%Y-%m-%d}&data_fim={amostra:%Y-%m}-28"
+            ao_vivo = paginas(cliente, f"/emprestimos?{filtro}", 500)
+            relatorio_antes = cliente.get("/relatorios/uso/veiculos/7?agrupar=mes").get_json()
+            etag_antes = cliente.get("/emprestimos?limit=10").headers.get('ETag')
+
+            print(f"Arquivando os meses anteriores a {corte:%Y-%m} ({len(meses)} meses com dados)...")
+            inicio = time.perf_counter()
+            resultados = arquivamento.arquivar(conn, diretorio, corte)
+            print(f"Arquivados em {time.perf_counter() - inicio:.1f}s")
+            arquivados = [mes for mes, linhas, _ in resultados if linhas is not None]
+            verificar(f"{len(meses) - args.reter} meses arquivados", arquivados == meses[:-args.reter])
+
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*) FROM emprestimos;")
+                restantes = cur.fetchone()[0]
+                cur.execute("SELECT coalesce(sum(linhas), 0) FROM emprestimos_arquivados;")
+                linhas_arquivadas = cur.fetchone()[0]
+                cur.execute("SELECT count(*) FROM pg_class WHERE relname = %s;",
+                            (arquivamento.nome_particao(amostra),))
+                tabela_existe = cur.fetchone()[0]
+            conn.rollback()
+            verificar("linhas no banco + arquivadas = total", restantes + linhas_arquivadas == total)
+            verificar("partições arquivadas apagadas", tabela_existe == 0)
+            verificar("ETag de GET /emprestimos muda com o arquivamento",
+                      cliente.get("/emprestimos?limit=10", headers={"If-None-Match": etag_antes}).status_code == 200)
+            verificar("arquivos gravados", all(
+                os.path.exists(arquivamento.caminho_mes(diretorio, mes)) for mes in arquivados))
+
+            resposta = cliente.get('/arquivo/emprestimos')
+            verificar("GET /arquivo/emprestimos lista os meses arquivados",
+                      [mes["mes"] for mes in resposta.get_json()] == [f"{mes:%Y-%m}" for mes in arquivados])
+
+            do_arquivo = paginas(cliente, f"/arquivo/emprestimos/{amostra:%Y-%m}?veiculo_id=7", 7)
+            verificar(f"GET /arquivo/emprestimos/{amostra:%Y-%m} devolve os mesmos {len(ao_vivo)} empréstimos",
+                      len(ao_vivo) > 0 and (do_arquivo or [])[:len(ao_vivo)] == list(reversed(ao_vivo)))
+            resposta = cliente.get(f"/arquivo/emprestimos/{amostra:%Y-%m}?fields=id,km_retorno&limit=3")
+            verificar("?fields= recorta as colunas",
+                      resposta.status_code == 200 and set(resposta.get_json()[0]) == {"id", "km_retorno"})
+            verificar("mês fora do arquivo responde 404",
+                      cliente.get(f"/arquivo/emprestimos/{meses[-1]:%Y-%m}").status_code == 404)
+            verificar("mês inválido responde 400", cliente.get("/arquivo/emprestimos/2015-13").status_code == 400)
+
+            resultados = arquivamento.arquivar(conn, diretorio, date(meses[-1].year + 1, 1, 1))
+            verificar("mês com empréstimos abertos fica no banco",
+                      [(mes, linhas) for mes, linhas, _ in resultados if mes == meses[-1]] == [(meses[-1], None)])
+
+            migrar.recalcular_uso(conn)
+            with conn.cursor() as cur:
+                cur.execute("SELECT dimensao, chave, mes, emprestimos, km, segundos FROM uso_mensal ORDER BY 1, 2, 3;")
+                uso_depois = cur.fetchall()
+            conn.rollback()
+            verificar("recalcular-uso preserva os resumos dos meses arquivados", uso_depois == uso_antes)
+            verificar("GET /relatorios/uso igual ao de antes do arquivamento",
+                      cliente.get("/relatorios/uso/veiculos/7?agrupar=mes").get_json() == relatorio_antes)
+            conn.close()
+
+            depois, particoes_depois = medir_consultas(db_config, args.repeticoes)
+            print(f"\n{'consulta (mediana, ms)':40} {f'{particoes_antes} partições':>14} {f'{particoes_depois} partições':>14}")
+            for nome in antes:
+                print(f"{nome:40} {antes[nome]:14.3f} {depois[nome]:14.3f}")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    if falhas:
+        print(f"{len(falhas)} verificação(ões) falharam.")
+        return 1
+    print("Todas as verificações passaram.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emprestimos', type=int, default=300000)
+    parser.add_argument('--reter', type=int, default=2, help="meses com dados mantidos no banco")
+    parser.add_argument('--repeticoes', type=int, default=200)
+    parser.add_argument('--pg-bin', help="diretório com initdb/pg_ctl (padrão: PATH ou pg_config)")
+    parser.add_argument('--servidor-existente', action='store_true',
+                        help="cria um banco temporário no servidor de DB_CONFIG em vez de rodar initdb")
+    return executar(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Compara a aplicação síncrona (app.py) com a assíncrona (app_async.py) sob carga.
+
+Abre C clientes concorrentes (padrão 1000), cada um repetindo a mesma requisição GET
+durante D segundos, contra cada servidor informado, e imprime requisições por segundo,
+latências p50/p95/p99 e erros (status != 200 ou falha de conexão).
+
+Suba os dois servidores antes, com o mesmo número de processos e o mesmo banco:
+    gunicorn -w 4 --threads 8 -b 0.0.0.0:5000 app:app          (síncrono)
+    uvicorn app_async:app --workers 4 --host 0.0.0.0 --port 5001  (assíncrono)
+
+Uso: python benchmarks/bench_async.py [--clientes 1000] [--duracao 20]
+         [--rota "/veiculos?limit=20"] [--processos 4]
+         [--alvo sync=http://localhost:5000] [--alvo async=http://localhost:5001]
+
+Os clientes são divididos entre --processos processos geradores de carga, para que o
+próprio gerador (httpx) não vire o gargalo.
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+ALVOS_PADRAO = ["sync=http://localhost:5000", "async=http://localhost:5001"]
+
+
+async def _cliente(http, url, prazo, latencias, erros):
+    while time.monotonic() < prazo:
+        inicio = time.monotonic()
+        try:
+            resposta = await http.get(url)
+            ok = resposta.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencias.append(time.monotonic() - inicio)
+        else:
+            erros.append(1)
+
+
+async def _gerar_carga(url, clientes, duracao, timeout):
+    limites = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    latencias = []
+    erros = []
+    async with httpx.AsyncClient(limits=limites, timeout=timeout) as http:
+        prazo = time.monotonic() + duracao
+        await asyncio.gather(*(_cliente(http, url, prazo, latencias, erros) for _ in range(clientes)))
+    return latencias, len(erros)
+
+
+def _processo_de_carga(url, clientes, duracao, timeout):
+    return asyncio.run(_gerar_carga(url, clientes, duracao, timeout))
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, int(round(p / 100.0 * (len(valores) - 1))))
+    return valores[indice]
+
+
+def medir(url, clientes, duracao, processos, timeout):
+    """Retorna {'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'ok', 'erros'}."""
+    por_processo = [clientes // processos + (1 if i < clientes % processos else 0) for i in range(processos)]
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [
+            executor.submit(_processo_de_carga, url, n, duracao, timeout)
+            for n in por_processo if n
+        ]
+        resultados = [futuro.result() for futuro in futuros]
+
+    latencias = sorted(latencia for parcial, _ in resultados for latencia in parcial)
+    erros = sum(parcial for _, parcial in resultados)
+    return {
+        "rps": round(len(latencias) / duracao, 1),
+        "p50_ms": round(percentil(latencias, 50) * 1000, 1),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 1),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 1),
+        "ok": len(latencias),
+        "erros": erros,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clientes', type=int, default=1000)
+    parser.add_argument('--duracao', type=float, default=20.0)
+    parser.add_argument('--aquecimento', type=float, default=3.0,
+                        help="segundos de carga descartados antes da medição")
+    parser.add_argument('--rota', default='/veiculos?limit=20')
+    parser.add_argument('--processos', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--alvo', action='append',
+                        help="nome=url_base (pode repetir); padrão: sync em :5000 e async em :5001")
+    args = parser.parse_args()
+
+    alvos = [alvo.split('=', 1) for alvo in (args.alvo or ALVOS_PADRAO)]
+    print(f"{args.clientes} clientes concorrentes, {args.duracao:.0f}s por alvo, GET {args.rota}")
+    print(f"{'alvo':10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ok':>8} {'erros':>7}")
+    for nome, base in alvos:
+        url = base.rstrip('/') + args.rota
+        if args.aquecimento:
+            medir(url, args.clientes, args.aquecimento, args.processos, args.timeout)
+        r = medir(url, args.clientes, args.duracao, args.processos, args.timeout)
+        print(f"{nome:10} {r['rps']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['ok']:>8} {r['erros']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Compara os dois caminhos de serialização das listagens:
+- python: linhas -> dict(zip(...)) -> jsonify (padrão);
+- banco:  array JSON montado pelo PostgreSQL (JSON_NO_BANCO / consultas.como_json).
+
+Cria um schema temporário (com as próprias migrações), popula o histórico de empréstimos
+e mede GET /emprestimos devolvendo 10 mil, 100 mil e 1 milhão de linhas (filtro por
+data_saida), pelo test client do Flask (sem rede). Confere que os dois caminhos produzem
+exatamente os mesmos bytes. O schema é removido ao final.
+
+Uso: python benchmarks/bench_json.py [--linhas 10000 100000 1000000] [--repeticoes 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'FrotaSimples'))
+
+import app as frota  # noqa: E402
+import migrar  # noqa: E402
+
+SCHEMA = 'bench_json'
+# O SQL_POPULAR do migrar.py gera um empréstimo a cada 2 minutos a partir desta data
+INICIO_HISTORICO = datetime(2015, 1, 1)
+
+
+def preparar_schema(total):
+    conn = psycopg2.connect(**frota.DB_CONFIG)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+            cur.execute(f"CREATE SCHEMA {SCHEMA};")
+            cur.execute(f"SET search_path TO {SCHEMA};")
+        conn.autocommit = False
+        migrar.aplicar_migracoes(conn, verbose=False)
+        print(f"Populando {total} empréstimos...")
+        with conn.cursor() as cur:
+            cur.execute(migrar.SQL_POPULAR, {
+                "veiculos": 10000, "funcionarios": 5000, "emprestimos": total, "abertos": 1500,
+            })
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for tabela in ('funcionarios', 'usuarios', 'veiculos', 'emprestimos'):
+                cur.execute(f"VACUUM ANALYZE {tabela};")
+    finally:
+        conn.close()
+
+
+def remover_schema():
+    conn = psycopg2.connect(**frota.DB_CONFIG)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    finally:
+        conn.close()
+
+
+def medir(cliente, url, no_banco, repeticoes):
+    """Retorna (tempos em segundos, corpo da última resposta)."""
+    frota.app.config['JSON_NO_BANCO'] = no_banco
+    tempos = []
+    corpo = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resposta = cliente.get(url)
+        corpo = resposta.get_data()
+        tempos.append(time.perf_counter() - inicio)
+        assert resposta.status_code == 200, resposta.status_code
+    return tempos, corpo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    preparar_schema(max(args.linhas))
+    # As conexões do pool (ainda não abertas) passam a enxergar só o schema temporário
+    frota.db_pool.db_config['options'] = f'-c search_path={SCHEMA}'
+    cliente = frota.app.test_client()
+
+    print(f"{'linhas':>9} {'MB':>8} {'python s':>10} {'banco s':>10} {'ganho':>7}  bytes iguais")
+    try:
+        for linhas in args.linhas:
+            # g = 1..linhas: data_saida = INICIO + g * 2 min < INICIO + (linhas + 1) * 2 min
+            fim = INICIO_HISTORICO + timedelta(minutes=2 * (linhas + 1))
+            url = f"/emprestimos?data_inicio=2015-01-01T00:00:00&data_fim={fim.isoformat()}"
+
+            tempos_python, corpo_python = medir(cliente, url, False, args.repeticoes)
+            tempos_banco, corpo_banco = medir(cliente, url, True, args.repeticoes)
+
+            python_s = statistics.median(tempos_python)
+            banco_s = statistics.median(tempos_banco)
+            print(f"{linhas:>9} {len(corpo_python) / 1e6:>8.1f} {python_s:>10.3f} {banco_s:>10.3f} "
+                  f"{python_s / banco_s:>6.1f}x  {corpo_python == corpo_banco}")
+            del corpo_python, corpo_banco
+    finally:
+        frota.db_pool.fechar()
+        remover_schema()
+
+
+if __name__ == '__main__':
+    main()
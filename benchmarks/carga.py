@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+"""
+Suíte de carga reproduzível das rotas da API.
+
+    python benchmarks/carga.py executar [--saida resultado.json]
+    python benchmarks/carga.py comparar base.json resultado.json
+
+'executar':
+1. sobe um PostgreSQL descartável (initdb num diretório temporário, porta livre) ou, com
+   --servidor-existente, cria um banco temporário no servidor de DB_CONFIG;
+2. aplica as migrações e popula volumes de frota realistas (--veiculos 10000,
+   --funcionarios 5000, --emprestimos 2000000, --abertos 1500) e um usuário para o /login;
+3. sobe o app.py num processo separado (servidor WSGI com threads), apontado para esse banco;
+4. roda cada cenário em cada nível de concorrência (--concorrencias 1 16 64) durante
+   --duracao segundos, após --aquecimento segundos descartados;
+5. grava vazão (req/s) e latências p50/p95/p99 de cada rota em JSON e remove o banco.
+
+'comparar' casa os resultados por (rota, concorrência) e marca REGRESSÃO quando a vazão cai
+mais que --tolerancia-vazao ou o p95/p99 sobe mais que --tolerancia-latencia (frações,
+padrão 0.10 e 0.15). Termina com código 1 se houver regressão, para uso em CI.
+
+Compare só resultados gerados na mesma máquina e com os mesmos volumes: o JSON registra
+volumes, duração, commit e CPU justamente para isso.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import httpx
+import psycopg2
+
+DIRETORIO_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'FrotaSimples')
+sys.path.insert(0, DIRETORIO_APP)
+
+import migrar  # noqa: E402
+from config import DB_CONFIG, SENHA_CONFIG  # noqa: E402
+
+EMAIL_CARGA = "carga@frota.local"
+SENHA_CARGA = "senha-da-carga"
+
+CENARIOS = [
+    "login",
+    "veiculos_disponiveis",
+    "emprestimos",
+    "emprestimos_por_veiculo",
+    "emprestimos_ativos",
+    "cadastrar_veiculo",
+    "status_veiculo",
+    "checkout_devolucao",
+]
+
+
+# =============================================================================
+# BANCO DESCARTÁVEL
+# =============================================================================
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+class PostgresTemporario:
+    """Cluster PostgreSQL criado com initdb num diretório temporário e removido ao final."""
+
+    def __init__(self, pg_bin=None):
+        self.pg_bin = pg_bin or self._localizar_binarios()
+        self.diretorio = None
+        self.porta = porta_livre()
+
+    @staticmethod
+    def _localizar_binarios():
+        if shutil.which('initdb'):
+            return os.path.dirname(shutil.which('initdb'))
+        try:
+            return subprocess.check_output(['pg_config', '--bindir'], text=True).strip()
+        except (OSError, subprocess.CalledProcessError):
+            raise SystemExit("initdb não encontrado: use --pg-bin ou --servidor-existente")
+
+    def _executar(self, programa, *args):
+        subprocess.run([os.path.join(self.pg_bin, programa), *args], check=True,
+                       stdout=subprocess.DEVNULL)
+
+    def __enter__(self):
+        self.diretorio = tempfile.mkdtemp(prefix='frota-carga-')
+        dados = os.path.join(self.diretorio, 'dados')
+        self._executar('initdb', '-D', dados, '-U', 'postgres', '--auth=trust',
+                       '-E', 'UTF8', '--locale=C')
+        self._executar('pg_ctl', '-D', dados, '-l', os.path.join(self.diretorio, 'postgres.log'),
+                       '-o', f"-p {self.porta} -k {self.diretorio} -c listen_addresses=localhost",
+                       '-w', 'start')
+        return {"host": "localhost", "port": str(self.porta), "user": "postgres",
+                "password": "", "database": "postgres"}
+
+    def __exit__(self, *exc):
+        try:
+            self._executar('pg_ctl', '-D', os.path.join(self.diretorio, 'dados'), '-m', 'fast',
+                           '-w', 'stop')
+        finally:
+            shutil.rmtree(self.diretorio, ignore_errors=True)
+
+
+class BancoTemporario:
+    """Banco criado no servidor de DB_CONFIG (para quando não é possível rodar initdb)."""
+
+    def __init__(self):
+        self.nome = f"frota_carga_{os.getpid()}"
+
+    def _admin(self, sql):
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(sql)
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._admin(f"DROP DATABASE IF EXISTS {self.nome};")
+        self._admin(f"CREATE DATABASE {self.nome};")
+        return dict(DB_CONFIG, database=self.nome)
+
+    def __exit__(self, *exc):
+        self._admin(f"DROP DATABASE IF EXISTS {self.nome} WITH (FORCE);")
+
+
+def popular(db_config, veiculos, funcionarios, emprestimos, abertos):
+    from werkzeug.security import generate_password_hash
+
+    conn = psycopg2.connect(**db_config)
+    try:
+        migrar.aplicar_migracoes(conn, verbose=False)
+        print(f"Populando: {veiculos} veículos, {funcionarios} funcionários, "
+              f"{emprestimos} empréstimos ({abertos} abertos)...")
+        inicio = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute(migrar.SQL_POPULAR, {
+                "veiculos": veiculos, "funcionarios": funcionarios,
+                "emprestimos": emprestimos, "abertos": abertos,
+            })
+            cur.execute(
+                "INSERT INTO usuarios (nome, email, senha_hash) VALUES (%s, %s, %s);",
+                ("Carga", EMAIL_CARGA, generate_password_hash(SENHA_CARGA, SENHA_CONFIG["metodo"]))
+            )
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for tabela in ('funcionarios', 'usuarios', 'veiculos', 'emprestimos'):
+                cur.execute(f"VACUUM ANALYZE {tabela};")
+        print(f"Banco populado em {time.perf_counter() - inicio:.0f}s")
+    finally:
+        conn.close()
+
+
+def veiculos_disponiveis(db_config):
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM veiculos WHERE ativo ORDER BY id;")
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+# =============================================================================
+# SERVIDOR DA API
+# =============================================================================
+
+def servir(db_config, porta, json_no_banco):
+    """Processo filho: o app.py com o pool apontado para o banco da carga."""
+    from werkzeug.serving import make_server
+
+    import app as frota
+
+    frota.db_pool.db_config.update(db_config)
+    frota.app.config['JSON_NO_BANCO'] = json_no_banco
+    frota.db_pool.preencher()
+    make_server('localhost', porta, frota.app, threaded=True).serve_forever()
+
+
+def iniciar_servidor(db_config, json_no_banco):
+    porta = porta_livre()
+    processo = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), 'servir', '--porta', str(porta),
+         '--db', json.dumps(db_config)] + (['--json-no-banco'] if json_no_banco else []),
+        cwd=DIRETORIO_APP
+    )
+    base = f"http://localhost:{porta}"
+    for _ in range(100):
+        try:
+            httpx.get(base + '/status/pool', timeout=1.0)
+            return processo, base
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    processo.kill()
+    raise SystemExit("O servidor da API não respondeu")
+
+
+# =============================================================================
+# CENÁRIOS
+# =============================================================================
+
+async def _medir(http, rotulo, metodo, url, amostras, **kwargs):
+    """Executa uma requisição e registra (rotulo, latência) ou um erro. Retorna a resposta."""
+    inicio = time.monotonic()
+    try:
+        resposta = await http.request(metodo, url, **kwargs)
+    except httpx.HTTPError:
+        amostras.setdefault(rotulo, ([], [0]))[1][0] += 1
+        return None
+    latencias, erros = amostras.setdefault(rotulo, ([], [0]))
+    if resposta.status_code < 400:
+        latencias.append(time.monotonic() - inicio)
+    else:
+        erros[0] += 1
+    return resposta
+
+
+async def _cliente(cenario, http, base, veiculo_id, prazo, amostras):
+    ativo = False
+    while time.monotonic() < prazo:
+        if cenario == "login":
+            await _medir(http, "POST /login", 'POST', base + '/login', amostras,
+                         json={"email": EMAIL_CARGA, "senha": SENHA_CARGA})
+        elif cenario == "veiculos_disponiveis":
+            await _medir(http, "GET /veiculos/disponiveis", 'GET', base + '/veiculos/disponiveis', amostras)
+        elif cenario == "emprestimos":
+            await _medir(http, "GET /emprestimos?limit=50", 'GET', base + '/emprestimos?limit=50', amostras)
+        elif cenario == "emprestimos_por_veiculo":
+            await _medir(http, "GET /emprestimos?veiculo_id=&limit=50", 'GET',
+                         f"{base}/emprestimos?veiculo_id={veiculo_id}&limit=50", amostras)
+        elif cenario == "emprestimos_ativos":
+            await _medir(http, "GET /emprestimos/ativos", 'GET', base + '/emprestimos/ativos', amostras)
+        elif cenario == "cadastrar_veiculo":
+            await _medir(http, "POST /veiculos", 'POST', base + '/veiculos', amostras, json={
+                "modelo": "Carga", "marca": "Teste", "ano": 2022,
+                "placa": "C" + uuid.uuid4().hex[:9], "tipo": "carro"
+            })
+        elif cenario == "status_veiculo":
+            await _medir(http, "PATCH /veiculos/<id>/status", 'PATCH',
+                         f"{base}/veiculos/{veiculo_id}/status", amostras, json={"ativo": ativo})
+            ativo = not ativo
+        elif cenario == "checkout_devolucao":
+            # Cada cliente tem o seu veículo: retira e devolve em sequência
+            resposta = await _medir(http, "POST /emprestimos", 'POST', base + '/emprestimos', amostras, json={
+                "veiculo_id": veiculo_id, "funcionario_id": 1,
+                "data_saida": "2024-01-01T08:00:00", "km_saida": 0
+            })
+            if resposta is None or resposta.status_code != 201:
+                continue
+            await _medir(http, "PATCH /emprestimos/<id>/finalizar", 'PATCH',
+                         f"{base}/emprestimos/{resposta.json()['id']}/finalizar", amostras,
+                         json={"data_retorno": "2024-01-01T18:00:00", "km_retorno": 1})
+
+
+async def _gerar_carga(cenario, base, veiculos, duracao):
+    amostras = {}
+    limites = httpx.Limits(max_connections=len(veiculos), max_keepalive_connections=len(veiculos))
+    async with httpx.AsyncClient(limits=limites, timeout=60.0) as http:
+        prazo = time.monotonic() + duracao
+        await asyncio.gather(*(
+            _cliente(cenario, http, base, veiculo_id, prazo, amostras) for veiculo_id in veiculos
+        ))
+    return {rotulo: (latencias, erros[0]) for rotulo, (latencias, erros) in amostras.items()}
+
+
+def _processo_de_carga(cenario, base, veiculos, duracao):
+    return asyncio.run(_gerar_carga(cenario, base, veiculos, duracao))
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, int(round(p / 100.0 * (len(valores) - 1))))
+    return valores[indice]
+
+
+def rodar_cenario(cenario, base, veiculos, duracao, processos):
+    """Distribui os clientes (um veículo cada) entre os processos e agrega as amostras por rota."""
+    fatias = [veiculos[i::processos] for i in range(processos)]
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [executor.submit(_processo_de_carga, cenario, base, fatia, duracao)
+                   for fatia in fatias if fatia]
+        parciais = [futuro.result() for futuro in futuros]
+
+    resultados = []
+    for rotulo in sorted({rotulo for parcial in parciais for rotulo in parcial}):
+        latencias = sorted(l for parcial in parciais for l in parcial.get(rotulo, ([], 0))[0])
+        erros = sum(parcial.get(rotulo, ([], 0))[1] for parcial in parciais)
+        resultados.append({
+            "rota": rotulo,
+            "requisicoes": len(latencias),
+            "erros": erros,
+            "vazao_rps": round(len(latencias) / duracao, 1),
+            "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+            "p95_ms": round(percentil(latencias, 95) * 1000, 2),
+            "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+        })
+    return resultados
+
+
+# =============================================================================
+# COMANDOS
+# =============================================================================
+
+def commit_atual():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=DIRETORIO_APP, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def executar(args):
+    banco = BancoTemporario() if args.servidor_existente else PostgresTemporario(args.pg_bin)
+    cenarios = args.cenarios or CENARIOS
+    resultado = {
+        "gerado_em": datetime.now().isoformat(timespec='seconds'),
+        "commit": commit_atual(),
+        "maquina": {"cpus": os.cpu_count(), "python": platform.python_version(),
+                    "plataforma": platform.platform()},
+        "parametros": {
+            "veiculos": args.veiculos, "funcionarios": args.funcionarios,
+            "emprestimos": args.emprestimos, "abertos": args.abertos,
+            "duracao_s": args.duracao, "aquecimento_s": args.aquecimento,
+            "concorrencias": args.concorrencias, "json_no_banco": args.json_no_banco,
+        },
+        "resultados": [],
+    }
+
+    with banco as db_config:
+        popular(db_config, args.veiculos, args.funcionarios, args.emprestimos, args.abertos)
+        processo, base = iniciar_servidor(db_config, args.json_no_banco)
+        try:
+            for cenario in cenarios:
+                for concorrencia in args.concorrencias:
+                    # Um veículo disponível por cliente (usado pelos cenários de escrita)
+                    veiculos = veiculos_disponiveis(db_config)[:concorrencia]
+                    if len(veiculos) < concorrencia:
+                        raise SystemExit(f"Veículos disponíveis insuficientes para {concorrencia} clientes")
+                    processos = max(1, min(args.processos, concorrencia))
+                    if args.aquecimento:
+                        rodar_cenario(cenario, base, veiculos, args.aquecimento, processos)
+                    for linha in rodar_cenario(cenario, base, veiculos, args.duracao, processos):
+                        linha.update({"cenario": cenario, "concorrencia": concorrencia})
+                        resultado["resultados"].append(linha)
+                        print(f"{linha['rota']:38} c={concorrencia:<4} {linha['vazao_rps']:>9} req/s  "
+                              f"p50 {linha['p50_ms']:>8} ms  p95 {linha['p95_ms']:>8} ms  "
+                              f"p99 {linha['p99_ms']:>8} ms  erros {linha['erros']}")
+        finally:
+            processo.terminate()
+            processo.wait()
+
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.saida}")
+    return 0
+
+
+def comparar(args):
+    with open(args.base, encoding='utf-8') as arquivo:
+        base = json.load(arquivo)
+    with open(args.atual, encoding='utf-8') as arquivo:
+        atual = json.load(arquivo)
+
+    if base["parametros"] != atual["parametros"]:
+        print("ATENÇÃO: parâmetros diferentes entre os dois resultados "
+              f"({base['parametros']} x {atual['parametros']})")
+
+    anteriores = {(linha["rota"], linha["concorrencia"]): linha for linha in base["resultados"]}
+    regressoes = 0
+    print(f"{'rota':38} {'conc':>5} {'req/s':>16} {'p95 ms':>20} {'p99 ms':>20}")
+    for linha in atual["resultados"]:
+        anterior = anteriores.get((linha["rota"], linha["concorrencia"]))
+        if anterior is None:
+            continue
+        motivos = []
+        if anterior["vazao_rps"] and linha["vazao_rps"] < anterior["vazao_rps"] * (1 - args.tolerancia_vazao):
+            motivos.append("vazão")
+        for campo in ("p95_ms", "p99_ms"):
+            if anterior[campo] and linha[campo] > anterior[campo] * (1 + args.tolerancia_latencia):
+                motivos.append(campo[:3])
+        if linha["erros"] > anterior["erros"]:
+            motivos.append("erros")
+        regressoes += bool(motivos)
+        print(f"{linha['rota']:38} {linha['concorrencia']:>5} "
+              f"{anterior['vazao_rps']:>7} -> {linha['vazao_rps']:<7} "
+              f"{anterior['p95_ms']:>9} -> {linha['p95_ms']:<9} "
+              f"{anterior['p99_ms']:>9} -> {linha['p99_ms']:<9}"
+              + (f"  REGRESSÃO ({', '.join(motivos)})" if motivos else ""))
+
+    if regressoes:
+        print(f"{regressoes} regressão(ões) acima da tolerância.")
+        return 1
+    print("Nenhuma regressão acima da tolerância.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    execucao = subcomandos.add_parser('executar', help="popula um banco descartável e mede as rotas")
+    execucao.add_argument('--saida', default=f"carga-{datetime.now():%Y%m%d-%H%M%S}.json")
+    execucao.add_argument('--veiculos', type=int, default=10000)
+    execucao.add_argument('--funcionarios', type=int, default=5000)
+    execucao.add_argument('--emprestimos', type=int, default=2000000)
+    execucao.add_argument('--abertos', type=int, default=1500)
+    execucao.add_argument('--concorrencias', type=int, nargs='+', default=[1, 16, 64])
+    execucao.add_argument('--duracao', type=float, default=10.0)
+    execucao.add_argument('--aquecimento', type=float, default=2.0)
+    execucao.add_argument('--processos', type=int, default=4, help="processos geradores de carga")
+    execucao.add_argument('--cenarios', nargs='+', choices=CENARIOS)
+    execucao.add_argument('--json-no-banco', action='store_true', help="liga JSON_NO_BANCO no servidor")
+    execucao.add_argument('--pg-bin', help="diretório com initdb/pg_ctl (padrão: PATH ou pg_config)")
+    execucao.add_argument('--servidor-existente', action='store_true',
+                          help="usa um banco temporário no servidor de DB_CONFIG em vez de initdb")
+
+    comparacao = subcomandos.add_parser('comparar', help="compara um resultado com uma base")
+    comparacao.add_argument('base')
+    comparacao.add_argument('atual')
+    comparacao.add_argument('--tolerancia-vazao', type=float, default=0.10)
+    comparacao.add_argument('--tolerancia-latencia', type=float, default=0.15)
+
+    servidor = subcomandos.add_parser('servir', help=argparse.SUPPRESS)
+    servidor.add_argument('--porta', type=int, required=True)
+    servidor.add_argument('--db', required=True)
+    servidor.add_argument('--json-no-banco', action='store_true')
+
+    args = parser.parse_args(argv)
+    if args.comando == 'executar':
+        return executar(args)
+    if args.comando == 'comparar':
+        return comparar(args)
+    servir(json.loads(args.db), args.porta, args.json_no_banco)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
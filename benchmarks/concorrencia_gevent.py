@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Verificação do servidor com greenlets (FrotaSimples/servidor_gevent.py): num único processo,
+consultas lentas e milhares de conexões ociosas não podem atrasar as outras requisições.
+
+    python benchmarks/concorrencia_gevent.py [--servidor-existente] [--ociosos 1000]
+
+1. sobe um PostgreSQL descartável (ou, com --servidor-existente, um banco temporário no
+   servidor de DB_CONFIG), como a suíte de carga, e popula uma frota pequena;
+2. inicia o servidor_gevent.py em UM processo, apontado para esse banco;
+3. consultas lentas: trava a tabela emprestimos (LOCK ... ACCESS EXCLUSIVE) numa conexão à
+   parte e dispara --lentas GET /emprestimos, que ficam esperando o banco. Enquanto isso,
+   --rapidas GET /funcionarios precisam terminar todas com 200 e p99 abaixo de --limite-ms,
+   com as lentas ainda pendentes; depois de soltar a trava, as lentas terminam com 200;
+4. conexões ociosas: abre --ociosos clientes de GET /eventos (SSE, parados esperando
+   eventos) e mede de novo as requisições rápidas, que precisam continuar abaixo do limite.
+
+Termina com código 1 se alguma verificação falhar.
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+import httpx
+import psycopg2
+
+from carga import (
+    DIRETORIO_APP, BancoTemporario, PostgresTemporario, popular, porta_livre, percentil
+)
+
+# O servidor_gevent precisa ser o primeiro import (monkey patching); o banco vem por argumento
+INICIAR_SERVIDOR = """
+import json, sys
+import servidor_gevent, app
+app.db_pool.db_config.update(json.loads(sys.argv[1]))
+sys.exit(servidor_gevent.main(sys.argv[2:]))
+"""
+
+
+def iniciar_servidor(db_config, conexoes):
+    porta = porta_livre()
+    processo = subprocess.Popen(
+        [sys.executable, '-c', INICIAR_SERVIDOR, json.dumps(db_config),
+         '--host', 'localhost', '--porta', str(porta), '--conexoes', str(conexoes)],
+        cwd=DIRETORIO_APP
+    )
+    base = f"http://localhost:{porta}"
+    for _ in range(100):
+        try:
+            httpx.get(base + '/status/pool', timeout=1.0)
+            return processo, base
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    processo.kill()
+    raise SystemExit("O servidor gevent não respondeu")
+
+
+async def medir_rapidas(http, base, quantidade, concorrencia):
+    """Dispara 'quantidade' GET /funcionarios com 'concorrencia' clientes; retorna (latências, erros)."""
+    latencias = []
+    erros = 0
+    fila = iter(range(quantidade))
+
+    async def cliente():
+        nonlocal erros
+        for _ in fila:
+            inicio = time.monotonic()
+            try:
+                resposta = await http.get(base + '/funcionarios?limit=10')
+            except httpx.HTTPError:
+                erros += 1
+                continue
+            if resposta.status_code == 200:
+                latencias.append(time.monotonic() - inicio)
+            else:
+                erros += 1
+
+    await asyncio.gather(*(cliente() for _ in range(concorrencia)))
+    return sorted(latencias), erros
+
+
+async def cenario_consultas_lentas(args, db_config, base, verificar):
+    trava = psycopg2.connect(**db_config)
+    try:
+        with trava.cursor() as cur:
+            cur.execute("LOCK TABLE emprestimos IN ACCESS EXCLUSIVE MODE;")
+
+        async with httpx.AsyncClient(timeout=60.0, limits=httpx.Limits(max_connections=None)) as http:
+            inicio_lentas = time.monotonic()
+            lentas = [asyncio.ensure_future(http.get(base + '/emprestimos?limit=10'))
+                      for _ in range(args.lentas)]
+            # Dá tempo de as lentas chegarem ao banco e ficarem esperando a trava
+            await asyncio.sleep(0.5)
+
+            latencias, erros = await medir_rapidas(http, base, args.rapidas, args.concorrencia)
+            p99 = percentil(latencias, 99) * 1000
+            pendentes = sum(not tarefa.done() for tarefa in lentas)
+            print(f"       {len(latencias)} rápidas em p50 {percentil(latencias, 50) * 1000:.1f} ms, "
+                  f"p99 {p99:.1f} ms; {pendentes} de {args.lentas} lentas pendentes")
+            verificar("rápidas terminam com 200 enquanto as lentas esperam o banco", erros == 0)
+            verificar(f"p99 das rápidas abaixo de {args.limite_ms} ms", p99 < args.limite_ms)
+            verificar("as lentas continuavam pendentes", pendentes == args.lentas)
+
+            trava.rollback()
+            respostas = await asyncio.gather(*lentas)
+            duracao = time.monotonic() - inicio_lentas
+            verificar(f"lentas terminam com 200 depois da trava ({duracao:.1f}s)",
+                      all(resposta.status_code == 200 for resposta in respostas))
+    finally:
+        trava.close()
+
+
+async def cenario_conexoes_ociosas(args, base, verificar):
+    limites = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=60.0, limits=limites) as http:
+        fluxos = []
+
+        async def assinar():
+            contexto = http.stream('GET', base + '/eventos')
+            resposta = await contexto.__aenter__()
+            fluxos.append(contexto)
+            return resposta.status_code
+
+        inicio = time.monotonic()
+        status = await asyncio.gather(*(assinar() for _ in range(args.ociosos)), return_exceptions=True)
+        abertos = sum(codigo == 200 for codigo in status)
+        print(f"       {abertos} clientes de /eventos abertos em {time.monotonic() - inicio:.1f}s")
+        try:
+            estado = (await http.get(base + '/status/eventos')).json()
+            verificar(f"{args.ociosos} clientes de /eventos conectados ao mesmo processo",
+                      abertos == args.ociosos and estado.get("clientes", 0) >= args.ociosos)
+
+            # Cliente separado: o pool do httpx percorre as suas conexões a cada requisição
+            async with httpx.AsyncClient(timeout=60.0) as outro:
+                latencias, erros = await medir_rapidas(outro, base, args.rapidas, args.concorrencia)
+            p99 = percentil(latencias, 99) * 1000
+            print(f"       {len(latencias)} rápidas em p50 {percentil(latencias, 50) * 1000:.1f} ms, "
+                  f"p99 {p99:.1f} ms")
+            verificar("rápidas terminam com 200 com os clientes ociosos conectados", erros == 0)
+            verificar(f"p99 das rápidas abaixo de {args.limite_ms} ms", p99 < args.limite_ms)
+        finally:
+            for contexto in fluxos:
+                await contexto.__aexit__(None, None, None)
+
+
+def executar(args):
+    falhas = []
+
+    def verificar(descricao, condicao):
+        print(f"{'ok' if condicao else 'FALHA':5}  {descricao}")
+        if not condicao:
+            falhas.append(descricao)
+
+    banco = BancoTemporario() if args.servidor_existente else PostgresTemporario(args.pg_bin)
+    with banco as db_config:
+        popular(db_config, veiculos=500, funcionarios=200, emprestimos=20000, abertos=50)
+        processo, base = iniciar_servidor(db_config, args.ociosos + 2 * args.concorrencia + args.lentas)
+        try:
+            asyncio.run(cenario_consultas_lentas(args, db_config, base, verificar))
+            asyncio.run(cenario_conexoes_ociosas(args, base, verificar))
+        finally:
+            processo.terminate()
+            processo.wait()
+
+    if falhas:
+        print(f"{len(falhas)} verificação(ões) falharam.")
+        return 1
+    print("Todas as verificações passaram.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lentas', type=int, default=10, help="requisições presas no banco")
+    parser.add_argument('--rapidas', type=int, default=500)
+    parser.add_argument('--concorrencia', type=int, default=20)
+    parser.add_argument('--ociosos', type=int, default=1000, help="clientes de /eventos abertos")
+    parser.add_argument('--limite-ms', type=float, default=500.0, help="p99 máximo das rápidas")
+    parser.add_argument('--pg-bin', help="diretório com initdb/pg_ctl (padrão: PATH ou pg_config)")
+    parser.add_argument('--servidor-existente', action='store_true',
+                        help="usa um banco temporário no servidor de DB_CONFIG em vez de initdb")
+    return executar(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
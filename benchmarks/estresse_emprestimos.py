@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Teste de estresse do checkout/devolução de veículos.
+
+Dispara N checkouts simultâneos do MESMO veículo e depois N finalizações simultâneas
+do empréstimo criado, contra o banco configurado em DB_CONFIG (use um banco descartável).
+Verifica que:
+- exatamente um checkout é aceito (201) e os demais recusados (409);
+- existe no máximo um empréstimo aberto para o veículo;
+- exatamente uma finalização é aceita (200) e o veículo volta a ficar disponível.
+Também mede as idas ao banco por requisição (comandos + BEGIN/COMMIT/ROLLBACK).
+
+Depois mistura, em --rodadas rodadas, --mistos checkouts e --mistos devoluções simultâneos
+de veículos DIFERENTES (os devolvidos numa rodada saem na seguinte). O checkout escreve em
+veiculos e depois em emprestimos, a devolução na ordem inversa; verifica que nenhuma
+requisição falha (deadlock vira 500) e que cada veículo termina com no máximo um
+empréstimo aberto.
+
+Uso: python benchmarks/estresse_emprestimos.py [--concorrencia 200] [--mistos 8] [--rodadas 25]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import psycopg2
+import psycopg2.extensions
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'FrotaSimples'))
+
+import app as frota  # noqa: E402
+
+# Idas ao banco por requisição na implementação anterior (BEGIN + comandos + COMMIT)
+IDAS_ANTERIORES = {"checkout": 3, "finalizacao": 5}
+
+_idas = threading.local()
+
+
+class CursorContador(psycopg2.extensions.cursor):
+    def execute(self, sql, params=None):
+        conn = self.connection
+        if not conn.autocommit and conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            _contar()  # BEGIN implícito
+        _contar()
+        return super().execute(sql, params)
+
+
+class ConexaoContadora(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', CursorContador)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        if self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            _contar()
+        return super().commit()
+
+    def rollback(self):
+        if self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            _contar()
+        return super().rollback()
+
+
+def _contar():
+    _idas.total = getattr(_idas, 'total', 0) + 1
+
+
+def disparar(requisicoes):
+    """Executa cada uma das 'requisicoes' numa thread, todas liberadas ao mesmo tempo."""
+    barreira = threading.Barrier(len(requisicoes))
+    resultados = []
+    idas = []
+    lock = threading.Lock()
+
+    def trabalhador(requisicao):
+        cliente = frota.app.test_client()
+        barreira.wait()
+        _idas.total = 0
+        resposta = requisicao(cliente)
+        with lock:
+            resultados.append(resposta.status_code)
+            idas.append(_idas.total)
+
+    threads = [threading.Thread(target=trabalhador, args=(requisicao,)) for requisicao in requisicoes]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return Counter(resultados), idas, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concorrencia', type=int, default=200)
+    parser.add_argument('--mistos', type=int, default=8,
+                        help="checkouts e devoluções simultâneos por rodada (cada)")
+    parser.add_argument('--rodadas', type=int, default=25)
+    args = parser.parse_args()
+
+    frota.db_pool.db_config['connection_factory'] = ConexaoContadora
+    cliente = frota.app.test_client()
+    sufixo = uuid.uuid4().hex[:6].upper()
+
+    funcionario = cliente.post('/funcionarios', json={
+        "nome": "Estresse", "matricula": f"EST-{sufixo}", "cargo": "Teste"
+    }).get_json()
+    veiculo = cliente.post('/veiculos', json={
+        "modelo": "Estresse", "marca": "Teste", "ano": 2020, "placa": f"E{sufixo}", "tipo": "carro"
+    }).get_json()
+
+    checkout = {
+        "veiculo_id": veiculo['id'], "funcionario_id": funcionario['id'],
+        "data_saida": "2024-01-01 08:00", "km_saida": 1000
+    }
+    status, idas, duracao = disparar([lambda c: c.post('/emprestimos', json=checkout)] * args.concorrencia)
+    print(f"Checkouts: {dict(status)} em {duracao:.2f}s | "
+          f"idas ao banco por requisição: {max(idas)} (antes: {IDAS_ANTERIORES['checkout']})")
+    assert status[201] == 1, "mais de um checkout aceito para o mesmo veículo"
+    assert status[409] == args.concorrencia - 1
+
+    conn = psycopg2.connect(**frota.DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT id FROM emprestimos WHERE veiculo_id = %s AND data_retorno IS NULL;",
+                (veiculo['id'],)
+            )
+            abertos = cur.fetchall()
+        assert len(abertos) == 1, f"{len(abertos)} empréstimos abertos para o veículo"
+        emprestimo_id = abertos[0][0]
+
+        retorno = {"data_retorno": "2024-01-01 18:00", "km_retorno": 1100, "observacao": "ok"}
+        status, idas, duracao = disparar(
+            [lambda c: c.patch(f'/emprestimos/{emprestimo_id}/finalizar', json=retorno)] * args.concorrencia
+        )
+        print(f"Finalizações: {dict(status)} em {duracao:.2f}s | "
+              f"idas ao banco por requisição: {max(idas)} (antes: {IDAS_ANTERIORES['finalizacao']})")
+        assert status[200] == 1, "mais de uma finalização aceita para o mesmo empréstimo"
+        assert status[400] == args.concorrencia - 1
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT ativo FROM veiculos WHERE id = %s;", (veiculo['id'],))
+            assert cur.fetchone()[0] is True, "veículo não voltou a ficar disponível"
+            cur.execute("SELECT observacao FROM emprestimos WHERE id = %s;", (emprestimo_id,))
+            assert cur.fetchone()[0] == "Retorno: ok", "observação concatenada mais de uma vez"
+
+        checkouts_e_devolucoes_mistos(cliente, conn, funcionario['id'], sufixo, args.mistos, args.rodadas)
+    finally:
+        conn.close()
+
+    print("OK: nenhuma reserva dupla, nenhuma finalização dupla e nenhum deadlock.")
+
+
+def checkouts_e_devolucoes_mistos(cliente, conn, funcionario_id, sufixo, mistos, rodadas):
+    veiculos = [
+        cliente.post('/veiculos', json={
+            "modelo": "Estresse", "marca": "Teste", "ano": 2020, "placa": f"M{sufixo}{i:03d}", "tipo": "carro"
+        }).get_json()['id']
+        for i in range(2 * mistos)
+    ]
+
+    def checkout(veiculo_id):
+        return lambda c: c.post('/emprestimos', json={
+            "veiculo_id": veiculo_id, "funcionario_id": funcionario_id,
+            "data_saida": "2024-01-02 08:00", "km_saida": 1000
+        })
+
+    def devolucao(emprestimo_id):
+        return lambda c: c.patch(f'/emprestimos/{emprestimo_id}/finalizar', json={
+            "data_retorno": "2024-01-02 18:00", "km_retorno": 1100
+        })
+
+    def abertos():
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT veiculo_id, id FROM emprestimos WHERE veiculo_id = ANY(%s) AND data_retorno IS NULL;",
+                (veiculos,)
+            )
+            linhas = cur.fetchall()
+        conn.rollback()
+        assert len(linhas) == len({veiculo_id for veiculo_id, _ in linhas}), \
+            "mais de um empréstimo aberto para o mesmo veículo"
+        return dict(linhas)
+
+    # A metade de cima já sai emprestada
+    for veiculo_id in veiculos[mistos:]:
+        assert checkout(veiculo_id)(cliente).status_code == 201
+
+    total = Counter()
+    inicio = time.perf_counter()
+    for _ in range(rodadas):
+        emprestados = abertos()
+        requisicoes = [checkout(v) for v in veiculos if v not in emprestados]
+        requisicoes += [devolucao(e) for e in emprestados.values()]
+        status, _, _ = disparar(requisicoes)
+        total.update(status)
+    duracao = time.perf_counter() - inicio
+    abertos()
+
+    print(f"Checkouts e devoluções mistos: {dict(total)} em {duracao:.2f}s "
+          f"({rodadas} rodadas de {mistos} + {mistos})")
+    assert total == Counter({201: mistos * rodadas, 200: mistos * rodadas}), \
+        f"{total[500]} requisição(ões) com erro 500 (deadlock?)"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Teste de integração das leituras em réplicas (FrotaSimples/replicas.py) com dois PostgreSQL
+locais: um primário e uma réplica dele por streaming replication.
+
+    python benchmarks/leituras_replica.py [--pg-bin DIR] [--atraso-replica 2]
+
+1. sobe um primário descartável (initdb, como a suíte de carga) e uma réplica
+   (pg_basebackup -R) com recovery_min_apply_delay = --atraso-replica segundos, para que
+   o atraso de replicação fique visível;
+2. aplica as migrações e popula uma frota pequena no primário;
+3. aponta o app.py (cliente de teste do Flask, no mesmo processo) para o primário, com a
+   réplica no roteador de leituras, e verifica que:
+   - as listagens são lidas da réplica (cabeçalho X-Origem-Leitura);
+   - depois de uma retirada, quem a fez lê do primário e não vê mais o veículo como
+     disponível, enquanto outro cliente continua na réplica;
+   - com a réplica parada, as leituras caem para o primário sem erro, e voltam para ela
+     quando ela volta;
+   - com a réplica no ar mas sem receber WAL (primary_conninfo vazio), ela sai do rodízio
+     em vez de passar por saudável com atraso zero.
+
+Termina com código 1 se alguma verificação falhar. initdb não roda como root: use um
+usuário comum.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import psycopg2
+
+from carga import DIRETORIO_APP, PostgresTemporario, popular, porta_livre, veiculos_disponiveis
+
+sys.path.insert(0, DIRETORIO_APP)
+
+from config import POOL_CONFIG  # noqa: E402
+from replicas import RoteadorLeituras  # noqa: E402
+
+
+class ReplicaTemporaria:
+    """Réplica por streaming de um PostgresTemporario, no mesmo diretório temporário."""
+
+    def __init__(self, primario, db_primario, atraso_aplicacao):
+        self.primario = primario
+        self.db_primario = db_primario
+        self.atraso_aplicacao = atraso_aplicacao
+        self.porta = porta_livre()
+        self.dados = os.path.join(primario.diretorio, 'replica')
+
+    def _executar(self, programa, *args):
+        subprocess.run([os.path.join(self.primario.pg_bin, programa), *args], check=True,
+                       stdout=subprocess.DEVNULL)
+
+    def iniciar(self):
+        self._executar('pg_ctl', '-D', self.dados, '-l', os.path.join(self.primario.diretorio, 'replica.log'),
+                       '-o', f"-p {self.porta} -k {self.primario.diretorio} -c listen_addresses=localhost",
+                       '-w', 'start')
+        # Sem o receptor de WAL em streaming, o roteador ainda não a considera saudável
+        self._aguardar("SELECT count(*) FROM pg_stat_wal_receiver WHERE status = 'streaming';", 1, 30.0,
+                       "O receptor de WAL da réplica não subiu")
+
+    def parar(self):
+        self._executar('pg_ctl', '-D', self.dados, '-m', 'fast', '-w', 'stop')
+
+    def _sql(self, comando, params=None):
+        conn = psycopg2.connect(**dict(self.db_primario, port=str(self.porta)))
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(comando, params)
+                return cur.fetchone() if cur.description else None
+        finally:
+            conn.close()
+
+    def _aguardar(self, sql, esperado, prazo, erro):
+        limite = time.monotonic() + prazo
+        while self._sql(sql)[0] != esperado:
+            if time.monotonic() > limite:
+                raise SystemExit(erro)
+            time.sleep(0.2)
+
+    def cortar_streaming(self, prazo=30.0):
+        """Desliga o receptor de WAL (primary_conninfo vazio) com a réplica no ar."""
+        self.primary_conninfo = self._sql("SHOW primary_conninfo;")[0]
+        self._sql("ALTER SYSTEM SET primary_conninfo = '';")
+        self._sql("SELECT pg_reload_conf();")
+        self._aguardar("SELECT count(*) FROM pg_stat_wal_receiver;", 0, prazo,
+                       "O receptor de WAL da réplica não parou")
+
+    def religar_streaming(self, prazo=30.0):
+        self._sql("ALTER SYSTEM SET primary_conninfo = %s;", (self.primary_conninfo,))
+        self._sql("SELECT pg_reload_conf();")
+        self._aguardar("SELECT count(*) FROM pg_stat_wal_receiver WHERE status = 'streaming';", 1, prazo,
+                       "O receptor de WAL da réplica não voltou")
+
+    def __enter__(self):
+        self._executar('pg_basebackup', '-D', self.dados, '-R', '-X', 'stream',
+                       '-h', 'localhost', '-p', self.db_primario["port"], '-U', 'postgres')
+        with open(os.path.join(self.dados, 'postgresql.auto.conf'), 'a') as arquivo:
+            arquivo.write(f"recovery_min_apply_delay = '{self.atraso_aplicacao}s'\n")
+        self.iniciar()
+        return dict(self.db_primario, port=str(self.porta))
+
+    def __exit__(self, *exc):
+        try:
+            self.parar()
+        except subprocess.CalledProcessError:
+            pass
+
+
+def aguardar_replicacao(db_primario, db_replica, prazo=30.0):
+    """Espera a réplica aplicar tudo o que o primário já gravou."""
+    conn = psycopg2.connect(**db_primario)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_current_wal_lsn();")
+            lsn = cur.fetchone()[0]
+    finally:
+        conn.close()
+    limite = time.monotonic() + prazo
+    while time.monotonic() < limite:
+        conn = psycopg2.connect(**db_replica)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn;", (lsn,))
+                if cur.fetchone()[0]:
+                    return
+        finally:
+            conn.close()
+        time.sleep(0.2)
+    raise SystemExit("A réplica não alcançou o primário")
+
+
+def executar(args):
+    falhas = []
+
+    def verificar(descricao, condicao):
+        print(f"{'ok' if condicao else 'FALHA':5}  {descricao}")
+        if not condicao:
+            falhas.append(descricao)
+
+    primario = PostgresTemporario(args.pg_bin)
+    with primario as db_primario:
+        popular(db_primario, veiculos=200, funcionarios=50, emprestimos=2000, abertos=20)
+        replica = ReplicaTemporaria(primario, db_primario, args.atraso_replica)
+        with replica as db_replica:
+            aguardar_replicacao(db_primario, db_replica)
+
+            import app as frota
+
+            frota.db_pool.db_config.update(db_primario)
+            frota.roteador_leituras = RoteadorLeituras(
+                [{"port": db_replica["port"]}], frota.db_pool.db_config, POOL_CONFIG,
+                intervalo=1.0, atraso_maximo=args.atraso_replica + 3.0,
+                janela_escrita=args.atraso_replica + 5.0
+            )
+            frota.roteador_leituras.verificar()
+
+            quem_escreve = frota.app.test_client()
+            outro = frota.app.test_client()
+
+            resposta = outro.get('/emprestimos?limit=10')
+            verificar("GET /emprestimos é lido da réplica",
+                      resposta.status_code == 200 and resposta.headers.get('X-Origem-Leitura') == 'replica-1')
+            resposta = outro.get('/veiculos/disponiveis')
+            verificar("GET /veiculos/disponiveis é lido da réplica",
+                      resposta.headers.get('X-Origem-Leitura') == 'replica-1')
+
+            veiculo_id = veiculos_disponiveis(db_primario)[0]
+            resposta = quem_escreve.post('/emprestimos', json={
+                "veiculo_id": veiculo_id, "funcionario_id": 1,
+                "data_saida": "2024-01-01T08:00:00", "km_saida": 0
+            })
+            verificar("POST /emprestimos grava no primário", resposta.status_code == 201)
+
+            resposta = quem_escreve.get('/veiculos/disponiveis')
+            ids = [veiculo['id'] for veiculo in resposta.get_json()['veiculos']]
+            verificar("quem escreveu lê do primário logo depois",
+                      resposta.headers.get('X-Origem-Leitura') == 'primario')
+            verificar("quem escreveu não vê o veículo retirado como disponível", veiculo_id not in ids)
+
+            resposta = outro.get('/veiculos/disponiveis')
+            ids = [veiculo['id'] for veiculo in resposta.get_json()['veiculos']]
+            verificar("outro cliente continua lendo da réplica",
+                      resposta.headers.get('X-Origem-Leitura') == 'replica-1')
+            print(f"       (na réplica, o veículo {veiculo_id} ainda "
+                  f"{'aparece' if veiculo_id in ids else 'não aparece'} como disponível)")
+
+            replica.parar()
+            frota.roteador_leituras.verificar()
+            resposta = outro.get('/emprestimos?limit=10')
+            verificar("réplica parada: a leitura cai para o primário",
+                      resposta.status_code == 200 and resposta.headers.get('X-Origem-Leitura') == 'primario')
+
+            replica.iniciar()
+            frota.roteador_leituras.verificar()
+            resposta = outro.get('/emprestimos?limit=10')
+            verificar("réplica de volta: a leitura volta para ela",
+                      resposta.status_code == 200 and resposta.headers.get('X-Origem-Leitura') == 'replica-1')
+
+            replica.cortar_streaming()
+            frota.roteador_leituras.verificar()
+            resposta = outro.get('/emprestimos?limit=10')
+            verificar("réplica sem receber WAL: sai do rodízio e a leitura cai para o primário",
+                      resposta.status_code == 200 and resposta.headers.get('X-Origem-Leitura') == 'primario')
+
+            replica.religar_streaming()
+            frota.roteador_leituras.verificar()
+            resposta = outro.get('/emprestimos?limit=10')
+            verificar("streaming religado: a leitura volta para a réplica",
+                      resposta.status_code == 200 and resposta.headers.get('X-Origem-Leitura') == 'replica-1')
+
+    if falhas:
+        print(f"{len(falhas)} verificação(ões) falharam.")
+        return 1
+    print("Todas as verificações passaram.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pg-bin', help="diretório com initdb/pg_ctl/pg_basebackup (padrão: PATH ou pg_config)")
+    parser.add_argument('--atraso-replica', type=float, default=2.0,
+                        help="recovery_min_apply_delay da réplica, em segundos")
+    return executar(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())